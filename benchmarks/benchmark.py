@@ -0,0 +1,346 @@
+# -*- coding: utf-8 -*-
+"""
+读写性能测试，对tests/files下的每个文件和几个人工构造的对象图分别测试：
+    read      ObjectRead.readContent
+    write     ObjectWrite.writeContent
+    roundtrip 读取后再写入
+    equal     两次读取的结果用==比较
+输出每秒次数、每秒处理的字节数和单次操作的内存峰值，可以保存为JSON并与之前的结果比较。
+--batch N时另外用BatchWrite生成dnslog.ser的变体，分别比较1个和N个工作进程的吞吐量。
+--compact时另外对直接构造的人工对象图，比较默认模式和ObjectWrite(compact=True)写入的字节数和耗时
+用法:
+    python benchmarks/benchmark.py [--save run.json] [--compare base.json] [--cases 名字中包含的字符串 ...]
+    python benchmarks/benchmark.py --batch 4 --ops none
+    python benchmarks/benchmark.py --compact --ops none
+    python benchmarks/benchmark.py --diff base.json run.json
+"""
+import argparse
+import glob
+import io
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+
+from javaSerializationTools import ObjectRead, ObjectWrite, JavaClassDesc, JavaFieldDesc, JavaString, JavaObject, \
+    JavaField, JavaArray, JavaEndBlock, JavaEnum, BatchWrite
+
+CORPUS = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'tests', 'files')
+OPS = ('read', 'write', 'roundtrip', 'equal')
+
+
+def nodeClass():
+    desc = JavaClassDesc('bench.Node', 1, 2)
+    desc.fields = [JavaFieldDesc('value', 'I'), JavaFieldDesc('name', JavaString('Ljava/lang/String;')),
+                   JavaFieldDesc('next', JavaString('Lbench/Node;'))]
+    desc.classAnnotations = [JavaEndBlock()]
+    return desc
+
+
+def node(desc, value, nextNode='null'):
+    obj = JavaObject(desc)
+    obj.fields.append([JavaField('value', 'I', value), JavaField('name', desc.fields[1].signature,
+                                                                 JavaString(f'node{value}')),
+                       JavaField('next', desc.fields[2].signature, nextNode)])
+    return obj
+
+
+def objectArray(values):
+    desc = JavaClassDesc('[Ljava.lang.Object;', 1, 2)
+    desc.classAnnotations = [JavaEndBlock()]
+    values = list(values)
+    array = JavaArray(len(values), desc)
+    array.list = values
+    return array
+
+
+def deepChain(length=2000):
+    desc = nodeClass()
+    head = 'null'
+    for i in range(length):
+        head = node(desc, i, head)
+    return head
+
+
+def wideArray(width=5000):
+    desc = nodeClass()
+    return objectArray(node(desc, i) for i in range(width))
+
+
+def sharedReferences(count=10000, shared=100):
+    desc = nodeClass()
+    nodes = [node(desc, i) for i in range(shared)]
+    return objectArray(nodes[i % shared] for i in range(count))
+
+
+def separateClassDescs(width=2000):
+    """
+    每个对象的类描述分别构造，内容相同，测试compact模式
+    """
+    return objectArray(node(nodeClass(), i) for i in range(width))
+
+
+def separateEnums(width=2000):
+    """
+    每个枚举常量和它的类描述都分别构造，默认模式下每个都写入一次，compact模式下每种常量只写入一次
+    """
+    values = []
+    for i in range(width):
+        desc = JavaClassDesc('java.util.concurrent.TimeUnit', 0, 0x12)
+        desc.classAnnotations = [JavaEndBlock()]
+        desc.superJavaClass = JavaClassDesc('java.lang.Enum', 0, 0x12)
+        desc.superJavaClass.classAnnotations = [JavaEndBlock()]
+        enum = JavaEnum(desc)
+        enum.enumConstantName = JavaString(('SECONDS', 'MINUTES', 'HOURS')[i % 3])
+        values.append(enum)
+    return objectArray(values)
+
+
+def primitiveFields(count=2000):
+    """
+    每个对象有10个基本类型字段，测试字段的分派
+    """
+    desc = JavaClassDesc('bench.Point', 1, 2)
+    signatures = 'BDFIJSZIJD'
+    desc.fields = [JavaFieldDesc(f'f{i}', signature) for i, signature in enumerate(signatures)]
+    desc.classAnnotations = [JavaEndBlock()]
+    values = {'B': b'\x01', 'D': 1.5, 'F': 2.5, 'I': 3, 'J': 4, 'S': 5, 'Z': True}
+    objects = []
+    for n in range(count):
+        obj = JavaObject(desc)
+        obj.fields.append([JavaField(f'f{i}', signature, n if signature in 'IJ' else values[signature])
+                           for i, signature in enumerate(signatures)])
+        objects.append(obj)
+    return objectArray(objects)
+
+
+SYNTHETIC = {
+    'synthetic:deepChain': deepChain,
+    'synthetic:wideArray': wideArray,
+    'synthetic:sharedReferences': sharedReferences,
+    'synthetic:primitiveFields': primitiveFields,
+    'synthetic:separateClassDescs': separateClassDescs,
+    'synthetic:separateEnums': separateEnums,
+}
+
+
+def serialize(obj, compact=False):
+    out = io.BytesIO()
+    ObjectWrite(out, compact=compact).writeContent(obj)
+    return out.getvalue()
+
+
+def loadCases(patterns):
+    cases = {}
+    for path in sorted(glob.glob(os.path.join(CORPUS, '*'))):
+        with open(path, 'rb') as f:
+            cases[os.path.basename(path)] = f.read()
+    for name, build in SYNTHETIC.items():
+        cases[name] = serialize(build())
+    if patterns:
+        cases = {name: data for name, data in cases.items() if any(p in name for p in patterns)}
+    return cases
+
+
+def operation(op, data):
+    """
+    返回执行一次op的无参函数
+    """
+    if op == 'read':
+        return lambda: ObjectRead(data).readContent()
+    obj = ObjectRead(data).readContent()
+    if op == 'write':
+        return lambda: serialize(obj)
+    if op == 'roundtrip':
+        return lambda: serialize(ObjectRead(data).readContent())
+    other = ObjectRead(data).readContent()
+    return lambda: obj == other
+
+
+def measure(func, minTime, repeat):
+    """
+    每轮至少运行minTime秒，取repeat轮中最快的一轮
+    """
+    number = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        elapsed = time.perf_counter() - start
+        if elapsed >= minTime:
+            break
+        number = max(number * 2, int(number * minTime / max(elapsed, 1e-9)))
+    best = elapsed / number
+    for _ in range(repeat - 1):
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        best = min(best, (time.perf_counter() - start) / number)
+    tracemalloc.start()
+    func()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return best, peak
+
+
+def run(cases, ops, minTime, repeat):
+    results = []
+    print(f"{'case':<30}{'op':<10}{'ops/s':>12}{'MiB/s':>10}{'peak(KiB)':>12}")
+    for name, data in cases.items():
+        for op in ops:
+            try:
+                seconds, peak = measure(operation(op, data), minTime, repeat)
+            except Exception as e:
+                # 例如递归实现的==在很深的对象图上超出递归深度，记录错误继续测试其他项
+                results.append({'case': name, 'op': op, 'bytes': len(data), 'error': f"{type(e).__name__}: {e}"})
+                print(f"{name:<30}{op:<10}{type(e).__name__:>34}")
+                continue
+            result = {'case': name, 'op': op, 'bytes': len(data), 'seconds': seconds,
+                      'opsPerSecond': 1 / seconds, 'bytesPerSecond': len(data) / seconds, 'peakBytes': peak}
+            results.append(result)
+            print(f"{name:<30}{op:<10}{result['opsPerSecond']:>12.1f}{result['bytesPerSecond'] / 2 ** 20:>10.2f}"
+                  f"{peak / 1024:>12.1f}")
+    return {'python': sys.version.split()[0], 'platform': platform.platform(), 'results': results}
+
+
+def hostField(dnslog):
+    """
+    dnslog.ser中java.net.URL的host字段，见tests/testDnslog
+    """
+    return dnslog.objectAnnotation[1].fields[0][4]
+
+
+def setHost(dnslog, host):
+    """
+    BatchWrite(mutate=...)使用，需要是模块级的函数
+    """
+    hostField(dnslog).value.string = host
+
+
+def batch(workers, count, chunksize=256):
+    """
+    用BatchWrite生成count个不同host的dnslog.ser，每种方式分别用1个和workers个工作进程，
+    进程启动后先预热一次，只计算map的耗时
+    """
+    with open(os.path.join(CORPUS, 'dnslog.ser'), 'rb') as f:
+        data = f.read()
+    hosts = [f'{i}.dnslog.cn' for i in range(count)]
+    expected = ObjectRead(data).readContent()
+    setHost(expected, hosts[-1])
+    expected = serialize(expected)
+    results = []
+    print(f"{'case':<30}{'workers':<10}{'variants/s':>12}{'speedup':>10}")
+    for mode in ('slots', 'mutate'):
+        single = None
+        for n in sorted({1, workers}):
+            dnslog = ObjectRead(data).readContent()
+            if mode == 'slots':
+                batchWrite = BatchWrite(dnslog, slots={'host': hostField(dnslog)}, workers=n)
+                variants = [{'host': host} for host in hosts]
+            else:
+                batchWrite = BatchWrite(dnslog, mutate=setHost, workers=n)
+                variants = hosts
+            with batchWrite:
+                list(batchWrite.map(variants[:n * chunksize], chunksize))
+                start = time.perf_counter()
+                outputs = list(batchWrite.map(variants, chunksize))
+                seconds = (time.perf_counter() - start) / count
+            assert len(outputs) == count and outputs[-1] == expected
+            single = single or seconds
+            name = f'batch:{mode}'
+            results.append({'case': name, 'op': f'workers={n}', 'bytes': len(outputs[-1]), 'seconds': seconds,
+                            'opsPerSecond': 1 / seconds, 'bytesPerSecond': len(outputs[-1]) / seconds,
+                            'workers': n})
+            print(f"{name:<30}{n:<10}{1 / seconds:>12.0f}{single / seconds:>10.2f}")
+    return results
+
+
+def compact(patterns, minTime, repeat):
+    """
+    用直接构造的人工对象图比较默认模式和compact模式，读取后再写入时类描述已经是共享的，不能体现两者的差别。
+    两种模式每轮交替运行，取各自最快的一轮，避免机器负载的变化影响比较
+    """
+    results = []
+    print(f"{'case':<30}{'mode':<10}{'bytes':>12}{'us':>10}")
+    for name, build in SYNTHETIC.items():
+        if patterns and not any(p in name for p in patterns):
+            continue
+        obj = build()
+        measured = {}
+        for _ in range(repeat):
+            for mode in ('default', 'compact'):
+                seconds, peak = measure(lambda: serialize(obj, mode == 'compact'), minTime, 1)
+                if mode not in measured or seconds < measured[mode][0]:
+                    measured[mode] = seconds, peak
+        for mode, (seconds, peak) in measured.items():
+            data = serialize(obj, mode == 'compact')
+            results.append({'case': f'compact:{name}', 'op': mode, 'bytes': len(data), 'seconds': seconds,
+                            'opsPerSecond': 1 / seconds, 'bytesPerSecond': len(data) / seconds, 'peakBytes': peak})
+            print(f"{name:<30}{mode:<10}{len(data):>12}{seconds * 1e6:>10.0f}")
+    return results
+
+
+def compare(base, current, threshold):
+    """
+    打印两次结果中相同测试的耗时变化，返回变慢超过threshold的数量
+    """
+    baseResults = {(r['case'], r['op']): r for r in base['results']}
+    regressions = 0
+    print(f"{'case':<30}{'op':<10}{'base(us)':>12}{'now(us)':>12}{'change':>10}")
+    for result in current['results']:
+        old = baseResults.get((result['case'], result['op']))
+        if old is None or 'error' in old or 'error' in result:
+            continue
+        change = result['seconds'] / old['seconds'] - 1
+        flag = ''
+        if change > threshold:
+            flag = '  slower'
+            regressions += 1
+        elif change < -threshold:
+            flag = '  faster'
+        print(f"{result['case']:<30}{result['op']:<10}{old['seconds'] * 1e6:>12.1f}{result['seconds'] * 1e6:>12.1f}"
+              f"{change:>+10.1%}{flag}")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='javaSerializationTools read/write benchmark')
+    parser.add_argument('--cases', nargs='*', default=None, help='only run cases whose name contains one of these')
+    parser.add_argument('--ops', default=','.join(OPS), help=f'comma separated, default {",".join(OPS)}')
+    parser.add_argument('--min-time', type=float, default=0.2, help='minimum seconds per round')
+    parser.add_argument('--repeat', type=int, default=3, help='rounds per measurement, the fastest is kept')
+    parser.add_argument('--save', help='save results as JSON')
+    parser.add_argument('--compare', help='compare with results saved by --save')
+    parser.add_argument('--diff', nargs=2, metavar=('BASE', 'CURRENT'), help='compare two saved runs and exit')
+    parser.add_argument('--threshold', type=float, default=0.1, help='relative slowdown reported as regression')
+    parser.add_argument('--batch', type=int, metavar='N', help='also compare BatchWrite with 1 and N workers')
+    parser.add_argument('--batch-count', type=int, default=20000, help='variants per BatchWrite measurement')
+    parser.add_argument('--compact', action='store_true', help='also compare default and compact write mode')
+    args = parser.parse_args(argv)
+
+    if args.diff:
+        with open(args.diff[0]) as f, open(args.diff[1]) as g:
+            return 1 if compare(json.load(f), json.load(g), args.threshold) else 0
+
+    ops = [op for op in args.ops.split(',') if op != 'none']
+    current = run(loadCases(args.cases), ops, args.min_time, args.repeat)
+    if args.batch:
+        print()
+        current['results'].extend(batch(args.batch, args.batch_count))
+    if args.compact:
+        print()
+        current['results'].extend(compact(args.cases, args.min_time, args.repeat))
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(current, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            print()
+            return 1 if compare(json.load(f), current, args.threshold) else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
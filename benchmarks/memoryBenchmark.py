@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+"""
+ObjectRead 内存占用测试，统计解析结果常驻的内存，默认测试tests/files下最大的几个文件
+用法: python benchmarks/memoryBenchmark.py [序列化文件 ...]
+"""
+import glob
+import os
+import sys
+import tracemalloc
+
+from javaSerializationTools import ObjectRead
+
+CORPUS = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'tests', 'files')
+
+
+def measure(path, copies=20):
+    """
+    同一个文件解析copies次并保留全部结果，返回平均每次解析常驻的字节数
+    """
+    with open(path, 'rb') as f:
+        data = f.read()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    trees = [ObjectRead(data).readContent() for _ in range(copies)]
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del trees
+    return (after - before) / copies
+
+
+if __name__ == '__main__':
+    paths = sys.argv[1:] or sorted(glob.glob(os.path.join(CORPUS, '*')), key=os.path.getsize)[-5:]
+    print(f"{'file':<24}{'size(B)':>10}{'tree(KiB)':>12}")
+    for path in paths:
+        print(f"{os.path.basename(path):<24}{os.path.getsize(path):>10}{measure(path) / 1024:>12.1f}")
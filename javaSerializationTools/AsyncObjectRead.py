@@ -0,0 +1,41 @@
+# -*- coding: utf-8 -*-
+from collections import deque
+
+from .IncrementalObjectRead import IncrementalObjectRead
+
+
+class AsyncObjectRead:
+    """
+    从asyncio.StreamReader读取，解析复用IncrementalObjectRead：
+        async for content in AsyncObjectRead(reader):
+            ...
+    只有在需要下一个content时才从reader读取数据，读取慢时由StreamReader暂停底层连接的接收
+    """
+
+    def __init__(self, reader, handler=None, chunkSize=65536):
+        self.reader = reader
+        self.chunkSize = chunkSize
+        self.incremental = IncrementalObjectRead(handler)
+        self.contents = deque()
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        while not self.contents:
+            data = await self.reader.read(self.chunkSize)
+            if not data:
+                # 在content中间断开时抛出EOFError
+                self.incremental.close()
+                raise StopAsyncIteration
+            self.contents.extend(self.incremental.feed(data))
+        return self.contents.popleft()
+
+    async def readContent(self):
+        """
+        读取下一个content，连接已经关闭时抛出EOFError
+        """
+        try:
+            return await self.__anext__()
+        except StopAsyncIteration:
+            raise EOFError("stream ended") from None
@@ -0,0 +1,34 @@
+# -*- coding: utf-8 -*-
+from .ObjectWrite import ObjectWrite
+
+
+class AsyncObjectWrite:
+    """
+    写入asyncio.StreamWriter，序列化复用ObjectWrite。
+    每个content先完整写入内存中的缓冲区，再一次交给writer，之后等待drain()，对端接收慢时在此等待
+    """
+
+    def __init__(self, writer, valueEquality=True, tracer=None, compact=False):
+        self.writer = writer
+        # 只写入内存，流的头部在第一次flush时和第一个content一起发送
+        self.objectWrite = ObjectWrite(None, valueEquality, tracer, compact=compact)
+
+    async def writeContent(self, content):
+        self.objectWrite.writeContent(content)
+        await self.flush()
+
+    async def reset(self):
+        self.objectWrite.reset()
+        await self.flush()
+
+    async def flush(self):
+        buffer = self.objectWrite.stream.buffer
+        if buffer:
+            self.writer.write(bytes(buffer))
+            buffer.clear()
+        await self.writer.drain()
+
+    async def close(self):
+        await self.flush()
+        self.writer.close()
+        await self.writer.wait_closed()
@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from .ObjectTemplate import ObjectTemplate
+from .ObjectWrite import ObjectWrite
+
+# 每个工作进程中的(对象, 模板, mutate, valueEquality)，由initWorker设置
+workerState = None
+
+
+def initWorker(content, slots, mutate, valueEquality):
+    """
+    工作进程启动时执行一次，对象只在这里传给每个工作进程一次，之后的任务只传递变化的部分
+    """
+    global workerState
+    template = ObjectTemplate(content, slots, valueEquality) if slots else None
+    workerState = (content, template, mutate, valueEquality)
+
+
+def renderVariant(variant):
+    content, template, mutate, valueEquality = workerState
+    if template is not None:
+        return template.render(**variant)
+    mutate(content, variant)
+    writer = ObjectWrite(None, valueEquality)
+    writer.writeContent(content)
+    return writer.toBytes()
+
+
+def writeVariant(task):
+    path, variant = task
+    with open(path, 'wb') as f:
+        f.write(renderVariant(variant))
+    return path
+
+
+class BatchWrite:
+    """
+    在多个进程中批量生成序列化数据，有两种生成方式：
+    slots：同ObjectTemplate，每个变体是{名字: 新值}，每个工作进程编译一次模板，之后只替换数据
+        with BatchWrite(dnslog, slots={'host': hostField}) as batch:
+            payloads = list(batch.map({'host': f'{i}.dnslog.cn'} for i in range(10000)))
+    mutate：每个变体传给mutate(content, variant)，修改工作进程中的对象之后重新写入。
+        对象在同一个工作进程的多个变体之间复用，mutate需要设置所有会被修改的值，且必须能被pickle，如模块级的函数
+    """
+
+    def __init__(self, content, slots=None, mutate=None, workers=None, valueEquality=True):
+        if (slots is None) == (mutate is None):
+            raise ValueError("exactly one of slots and mutate must be given")
+        # content和slots一起作为initargs传递，pickle后slots中的对象仍然是content中的对象
+        self.executor = ProcessPoolExecutor(workers, initializer=initWorker,
+                                            initargs=(content, slots, mutate, valueEquality))
+
+    def map(self, variants, chunksize=64):
+        """
+        :return: 按variants的顺序返回每个变体的bytes
+        """
+        return self.executor.map(renderVariant, variants, chunksize=chunksize)
+
+    def writeFiles(self, variants, directory, nameFormat='{0}.ser', chunksize=64):
+        """
+        由工作进程直接写入directory，不把数据传回主进程
+        :param nameFormat: 文件名，{0}为变体的序号
+        :return: 写入的文件路径
+        """
+        os.makedirs(directory, exist_ok=True)
+        tasks = ((os.path.join(directory, nameFormat.format(index)), variant)
+                 for index, variant in enumerate(variants))
+        return list(self.executor.map(writeVariant, tasks, chunksize=chunksize))
+
+    def close(self):
+        self.executor.shutdown()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, excType, excValue, traceback):
+        self.close()
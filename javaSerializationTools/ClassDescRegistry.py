@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+from .JavaMetaClass import JavaClassDesc, JavaEndBlock, JavaBLockData, JavaLongBLockData
+
+
+class ClassDescRegistry:
+    """
+    在多个流之间共享相同的类描述，传给ObjectRead后，类名、suid、flags、字段、附加信息和父类都相同的类描述
+    只保留第一次读到的对象，之后读到的对象树都引用它：
+        registry = ClassDescRegistry()
+        for data in payloads:
+            content = ObjectRead(data, registry=registry).readContent()
+    相同的类描述是同一个对象，可以用is比较。类描述被多个对象树共享，修改前需要copy.deepcopy。
+    只处理附加信息中只有块数据的JavaClassDesc，附加信息中有对象的类描述和动态代理类不共享。
+    ObjectRead读取字段时先按类名、suid、flags和字段的字符串查找，读到过相同内容时直接使用之前的字段列表，
+    不再构造字段和类型字符串，附加信息或者父类不同的类描述也共用字段列表
+    """
+
+    def __init__(self):
+        # key -> 类描述
+        self.descs = {}
+        # id(类描述) -> key，父类作为key的一部分时使用
+        self.keys = {}
+        # header -> 字段列表
+        self.headers = {}
+
+    def header(self, classDesc):
+        """
+        :return: (类名, suid, flags, ((字段名, 类型), ...))
+        """
+        fields = tuple((field.name, str(field.signature)) for field in classDesc.fields)
+        return classDesc.name, classDesc.suid, classDesc.flags, fields
+
+    def sharedFields(self, header):
+        """
+        :return: 读到过相同header的类描述时返回它的字段列表，否则返回None
+        """
+        return self.headers.get(header)
+
+    def addFields(self, header, fields):
+        self.headers.setdefault(header, fields)
+
+    def key(self, classDesc, header=None):
+        """
+        :param header: 读取时已经得到的header，为None时根据classDesc计算
+        :return: 不能共享时返回None
+        """
+        superJavaClass = classDesc.superJavaClass
+        if superJavaClass is None:
+            superKey = None
+        else:
+            superKey = self.keys.get(id(superJavaClass))
+            if superKey is None:
+                return None
+        annotations = []
+        for annotation in classDesc.classAnnotations:
+            t = type(annotation)
+            if t is JavaEndBlock:
+                annotations.append(None)
+            elif t is JavaBLockData or t is JavaLongBLockData:
+                annotations.append(bytes(annotation.data))
+            else:
+                return None
+        if header is None:
+            header = self.header(classDesc)
+        return header, tuple(annotations), superKey
+
+    def intern(self, classDesc, header=None):
+        """
+        :param header: 同key
+        :return: 已经有相同的类描述时返回它，否则记录并返回classDesc
+        """
+        if type(classDesc) is not JavaClassDesc:
+            return classDesc
+        key = self.key(classDesc, header)
+        if key is None:
+            return classDesc
+        # setdefault在多个线程同时读取时也只会保留一个
+        interned = self.descs.setdefault(key, classDesc)
+        if interned is classDesc:
+            self.keys[id(classDesc)] = key
+        return interned
+
+    def __len__(self):
+        return len(self.descs)
+
+    def __contains__(self, classDesc):
+        return self.descs.get(self.keys.get(id(classDesc))) is classDesc
+
+    def clear(self):
+        self.descs = {}
+        self.keys = {}
+        self.headers = {}
@@ -59,3 +59,9 @@ class Constants:
 
     # First wire handle to be assigned.
     baseWireHandle = int.from_bytes(b'\x7e\x00\x00', 'big')
+
+    # Size in bytes of each primitive type.
+    primitiveSizes = {'B': 1, 'C': 2, 'D': 8, 'F': 4, 'I': 4, 'J': 8, 'S': 2, 'Z': 1}
+
+    # array.array typecodes of primitive arrays decoded in bulk, [B [Z and [C are kept as bytes and str.
+    arrayTypecodes = {'D': 'd', 'F': 'f', 'I': 'i', 'J': 'q', 'S': 'h'}
@@ -0,0 +1,171 @@
+# -*- coding: utf-8 -*-
+from .Constants import Constants
+from .JavaMetaClass import JavaEndBlock, JavaObject, JavaField, JavaBLockData, JavaArray, JavaEnum, JavaException, \
+    JavaLongBLockData, JavaClass, LazyJavaObject
+
+
+class ContentHandler:
+    """
+    ObjectRead解析时的回调，类似SAX。ObjectRead负责读取流、维护handle表，类描述JavaClassDesc和字符串JavaString
+    由ObjectRead构造，其余content构造成什么由handler决定。
+    start*等返回值就是该content的值，会记录到handle表中，被引用时原样传给reference，也会作为字段、数组元素的值传回handler。
+    默认实现不构造任何对象，只用于扫描流
+    """
+
+    def reset(self):
+        pass
+
+    def null(self):
+        return None
+
+    def reference(self, handle, value):
+        return value
+
+    def string(self, handle, javaString):
+        return javaString
+
+    def classDesc(self, handle, classDesc):
+        """
+        开始读取类描述，classDesc可能是JavaClassDesc或者JavaProxyClass，之后依次是类的附加信息和父类
+        """
+
+    def endClassDesc(self, classDesc):
+        pass
+
+    def startObject(self, handle, classDesc):
+        return None
+
+    def classData(self, obj, classDesc):
+        """
+        开始读取对象中classDesc这一层的字段，从最顶层的父类开始
+        """
+
+    def field(self, obj, fieldDesc, value):
+        """
+        字段的值读取完之后调用，引用类型字段的值对应的事件都在这之前
+        """
+
+    def annotation(self, obj, value):
+        pass
+
+    def endObject(self, obj):
+        pass
+
+    def startArray(self, handle, classDesc, size):
+        return None
+
+    def arrayValues(self, array, values):
+        """
+        基本类型数组一次读出的值，见ObjectRead.readPrimitiveArray
+        """
+
+    def element(self, array, value):
+        pass
+
+    def endArray(self, array):
+        pass
+
+    def startEnum(self, handle, classDesc):
+        return None
+
+    def endEnum(self, enum, constantName):
+        pass
+
+    def javaClass(self, handle, classDesc):
+        return None
+
+    def exception(self, value):
+        return None
+
+    def blockData(self, tc, data):
+        return None
+
+    def endBlock(self):
+        return None
+
+
+class TreeBuilder(ContentHandler):
+    """
+    构造JavaMetaClass中的对象树，ObjectRead默认使用
+    """
+
+    def null(self):
+        return 'null'
+
+    def startObject(self, handle, classDesc):
+        return JavaObject(classDesc)
+
+    def classData(self, javaObject, classDesc):
+        javaObject.fields.append([])
+
+    def field(self, javaObject, fieldDesc, value):
+        javaObject.fields[-1].append(JavaField(fieldDesc.name, fieldDesc.signature, value))
+
+    def annotation(self, javaObject, value):
+        javaObject.objectAnnotation.append(value)
+
+    def startArray(self, handle, classDesc, size):
+        return JavaArray(size, classDesc)
+
+    def arrayValues(self, javaArray, values):
+        javaArray.list = values
+
+    def element(self, javaArray, value):
+        javaArray.add(value)
+
+    def startEnum(self, handle, classDesc):
+        return JavaEnum(classDesc)
+
+    def endEnum(self, javaEnum, constantName):
+        javaEnum.enumConstantName = constantName
+
+    def javaClass(self, handle, classDesc):
+        return JavaClass(classDesc)
+
+    def exception(self, value):
+        return JavaException(value)
+
+    def blockData(self, tc, data):
+        if tc == Constants.TC_BLOCKDATA:
+            return JavaBLockData(len(data), data)
+        return JavaLongBLockData(len(data), data)
+
+    def endBlock(self):
+        return JavaEndBlock()
+
+
+class LazyTreeBuilder(TreeBuilder):
+    """
+    ObjectRead(lazy=True)使用，对象构造成LazyJavaObject，基本类型字段在第一次访问fields时读取
+    """
+
+    def startObject(self, handle, classDesc):
+        return LazyJavaObject(classDesc)
+
+    def classData(self, javaObject, classDesc):
+        javaObject.rawFields().append([])
+
+    def field(self, javaObject, fieldDesc, value):
+        javaObject.rawFields()[-1].append(JavaField(fieldDesc.name, fieldDesc.signature, value))
+
+    def lazyFields(self, javaObject, fieldDescs, buffer, offset):
+        """
+        当前类开头的基本类型字段fieldDescs位于buffer的offset处，暂不读取
+        """
+        javaObject.pending.append((javaObject.rawFields()[-1], fieldDescs, buffer, offset))
+
+
+class StatsHandler(ContentHandler):
+    """
+    只统计类名和对象数，不构造对象树
+    """
+
+    def __init__(self):
+        self.classes = {}
+        self.objects = 0
+
+    def classDesc(self, handle, classDesc):
+        self.classes.setdefault(classDesc.name, None)
+
+    def startObject(self, handle, classDesc):
+        self.objects += 1
@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+"""
+并行解析大量序列化文件，每个文件输出一行JSON：
+    path     文件路径
+    ok       是否解析成功
+    error    失败时的异常，offset为出错时流中的偏移
+    size     文件字节数
+    contents 读取到的顶层content数
+    handles  handle表的大小（TC_RESET之后重新计数）
+    objects  对象数
+    classes  出现的类名，按第一次出现的顺序
+    seconds  解析耗时
+用法: python -m javaSerializationTools.CorpusScan [-j 进程数] [-o 输出文件] 文件、目录或glob ...
+"""
+import argparse
+import glob
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from .ParseCache import readSummary
+
+
+def scanFile(path):
+    result = {'path': path, 'ok': False, 'error': None, 'size': None, 'contents': 0, 'handles': 0, 'objects': 0,
+              'classes': [], 'seconds': None}
+    try:
+        with open(path, 'rb') as f:
+            data = f.read()
+    except OSError as e:
+        result['error'] = f"{type(e).__name__}: {e}"
+        return result
+    result['size'] = len(data)
+    start = time.perf_counter()
+    summary, error, offset = readSummary(data)
+    result['seconds'] = round(time.perf_counter() - start, 6)
+    result['ok'] = error is None
+    if error is not None:
+        result['error'] = f"{type(error).__name__}: {error} (offset {offset})"
+    for key in ('contents', 'handles', 'objects', 'classes'):
+        result[key] = summary[key]
+    return result
+
+
+def expandPaths(patterns):
+    """
+    展开文件、目录（递归）和glob，去重并保持顺序
+    """
+    paths = {}
+    for pattern in patterns:
+        matches = glob.glob(pattern, recursive=True) if glob.has_magic(pattern) else [pattern]
+        for match in sorted(matches):
+            if os.path.isdir(match):
+                for root, dirs, files in os.walk(match):
+                    dirs.sort()
+                    for name in sorted(files):
+                        paths.setdefault(os.path.join(root, name), None)
+            else:
+                paths.setdefault(match, None)
+    return list(paths)
+
+
+def writeResults(output, results):
+    for result in results:
+        output.write(json.dumps(result, ensure_ascii=False) + '\n')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m javaSerializationTools.CorpusScan',
+                                     description='parse serialized files in parallel and print JSON lines')
+    parser.add_argument('paths', nargs='+', help='files, directories or glob patterns')
+    parser.add_argument('-j', '--workers', type=int, default=None, help='number of processes, default cpu count')
+    parser.add_argument('-o', '--output', default=None, help='write JSON lines to this file instead of stdout')
+    args = parser.parse_args(argv)
+
+    paths = expandPaths(args.paths)
+    output = open(args.output, 'w') if args.output else sys.stdout
+    try:
+        if args.workers == 1:
+            writeResults(output, map(scanFile, paths))
+        else:
+            # 工作进程出错时with同样关闭进程池
+            with ProcessPoolExecutor(args.workers) as executor:
+                writeResults(output, executor.map(scanFile, paths, chunksize=8))
+    finally:
+        if output is not sys.stdout:
+            output.close()
+
+
+if __name__ == '__main__':
+    main()
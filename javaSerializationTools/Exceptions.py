@@ -5,7 +5,7 @@ class InvalidHeaderException(Exception):
         self.version = version
 
     def __str__(self):
-        print(f"invalid bin header {self.magic:#2x} {self.version:#2x}")
+        return f"invalid bin header {self.magic:#2x} {self.version:#2x}"
 
 
 class InvalidTypeCodeException(Exception):
@@ -14,3 +14,17 @@ class InvalidTypeCodeException(Exception):
 
     def __str__(self):
         return f"invalid type code {int.from_bytes(self.tc, 'big'):#2x}"
+
+
+class InvalidArraySizeException(Exception):
+    def __init__(self, size):
+        self.size = size
+
+    def __str__(self):
+        return f"invalid array size {self.size}"
+
+
+class NeedMoreDataException(EOFError):
+    """
+    FeedBufferIO中已经收到的数据读完了，但流还没有结束。抛出时读取位置不变，收到更多数据后从同一位置重新读取
+    """
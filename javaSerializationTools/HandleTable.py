@@ -0,0 +1,162 @@
+# -*- coding: utf-8 -*-
+from .Constants import Constants
+from .JavaMetaClass import JavaString, JavaClassDesc, JavaFieldDesc, JavaEnum, JavaClass, JavaEndBlock, \
+    JavaBLockData, JavaLongBLockData
+
+# 只有TC_ENDBLOCKDATA的附加信息
+END_ONLY = (None,)
+
+
+class HandleTable:
+    """
+    序列化时使用的handle表，按对象的id()查找，分配与查找handle都是O(1)
+    valueEquality为True时，JavaString按字符串内容查找，JavaClassDesc按类名查找，与JavaMetaClass中__eq__的语义一致。
+    compact为True时不论valueEquality，都按内容查找：
+        JavaString      字符串内容
+        JavaClassDesc   类名、suid、flags、字段、附加信息和父类，类名相同但内容不同的不会被合并
+        JavaEnum        类描述和常量名，Java中枚举常量只有一个对象
+        JavaClass       类描述，Java中每个类只有一个Class对象
+    类描述的key缓存在类描述上，类名、suid、flags、父类变化，或者fields、classAnnotations被替换、增删元素后重新计算，
+    写入后修改过的类描述不会匹配到旧的handle。
+    附加信息中有块数据、字符串以外的对象的类描述，以及父类是动态代理类的类描述不按内容查找
+    """
+
+    def __init__(self, valueEquality=True, compact=False):
+        self.valueEquality = valueEquality
+        self.compact = compact
+        self.objects = []
+        self.identities = {}
+        self.values = {}
+
+    def __len__(self):
+        return len(self.objects)
+
+    def __contains__(self, obj):
+        return self.lookup(obj) is not None
+
+    def clear(self):
+        self.objects = []
+        self.identities = {}
+        self.values = {}
+
+    def valueKey(self, obj):
+        if self.compact:
+            t = type(obj)
+            # 字符串和类描述最常见，不经过compactKey
+            if t is JavaString:
+                return JavaString, obj.string
+            if t is JavaClassDesc:
+                return self.descKey(obj)
+            if t is JavaEnum or t is JavaClass:
+                return self.compactKey(obj)
+            return None
+        if not self.valueEquality:
+            return None
+        if isinstance(obj, JavaString):
+            return JavaString, obj.string
+        if isinstance(obj, JavaClassDesc):
+            return JavaClassDesc, obj.name
+        return None
+
+    def compactKey(self, obj):
+        t = type(obj)
+        if t is JavaString:
+            return JavaString, obj.string
+        if t is JavaClassDesc:
+            return self.descKey(obj)
+        if t is JavaEnum:
+            descKey = self.descKey(obj.javaClass)
+            name = obj.enumConstantName
+            if descKey is None or type(name) is not JavaString:
+                return None
+            return JavaEnum, descKey, name.string
+        if t is JavaClass:
+            descKey = self.descKey(obj.javaclassDesc)
+            if descKey is None:
+                return None
+            return JavaClass, descKey
+        return None
+
+    def descKey(self, classDesc):
+        """
+        与ClassDescRegistry.key相同的内容作为key，附加信息中的字符串按内容比较
+        :return: 不能按内容查找时返回None
+        """
+        if type(classDesc) is not JavaClassDesc:
+            return None
+        superJavaClass = classDesc.superJavaClass
+        superKey = None
+        if superJavaClass is not None:
+            superKey = self.descKey(superJavaClass)
+            if superKey is None:
+                return None
+        fields = classDesc.fields
+        classAnnotations = classDesc.classAnnotations
+        state = (classDesc.name, classDesc.suid, classDesc.flags, fields, len(fields), classAnnotations,
+                 len(classAnnotations), superKey)
+        try:
+            cached = classDesc.contentKey
+            if cached is not None and cached[0] == state:
+                return cached[1]
+        except AttributeError:
+            # 从pickle或copy恢复的类描述没有这个属性
+            pass
+        if len(classAnnotations) == 1 and type(classAnnotations[0]) is JavaEndBlock:
+            # 大多数类描述的附加信息只有TC_ENDBLOCKDATA
+            annotations = END_ONLY
+        else:
+            annotations = []
+            for annotation in classAnnotations:
+                t = type(annotation)
+                if t is JavaEndBlock:
+                    annotations.append(None)
+                elif t is JavaBLockData or t is JavaLongBLockData:
+                    annotations.append(bytes(annotation.data))
+                elif t is JavaString:
+                    annotations.append(annotation.string)
+                else:
+                    return None
+            annotations = tuple(annotations)
+        # 依次是每个字段的名字和签名
+        signatures = []
+        for field in fields:
+            if type(field) is JavaFieldDesc:
+                signatures.append(field.name)
+                signature = field.signature
+            else:
+                signatures.append(field['name'])
+                signature = field['signature']
+            if type(signature) is JavaString:
+                signature = signature.string
+            elif type(signature) is not str:
+                signature = str(signature)
+            signatures.append(signature)
+        key = JavaClassDesc, classDesc.name, classDesc.suid, classDesc.flags, tuple(signatures), annotations, superKey
+        classDesc.contentKey = (state, key)
+        return key
+
+    def lookup(self, obj):
+        """
+        查找对象对应的handle
+        :return: 对象未写入过时返回None
+        """
+        handle = self.identities.get(id(obj))
+        if handle is None:
+            key = self.valueKey(obj)
+            if key is not None:
+                handle = self.values.get(key)
+        return handle
+
+    def assign(self, obj):
+        """
+        为对象分配新的handle，同一个对象被分配多次时，查找返回第一次分配的handle
+        :return: 新分配的handle
+        """
+        handle = len(self.objects) + Constants.baseWireHandle
+        # objects持有对象的引用，保证表存在期间id()不会被其他对象复用
+        self.objects.append(obj)
+        self.identities.setdefault(id(obj), handle)
+        key = self.valueKey(obj)
+        if key is not None:
+            self.values.setdefault(key, handle)
+        return handle
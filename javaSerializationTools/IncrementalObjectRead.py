@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+from .ObjectIO import FeedBufferIO
+from .ObjectRead import ObjectRead
+
+
+class IncrementalObjectRead:
+    """
+    推送式读取，适用于数据分段到达的场景，如从网络中逐个收到的TCP分段：
+        reader = IncrementalObjectRead()
+        for chunk in chunks:
+            for content in reader.feed(chunk):
+                ...
+    只缓存还没有读完的content的数据。某个顶层content的数据不完整时，读取它的driveContent停在数据不够的位置，
+    收到更多数据后从这里继续读取，已经读过的部分不会重复读取
+    """
+
+    def __init__(self, handler=None):
+        """
+        :param handler: 同ObjectRead，每个回调只执行一次
+        """
+        self.handler = handler
+        self.buffer = bytearray()
+        self.reader = None
+        self.stream = None
+        # 读到一半的顶层content
+        self.driver = None
+
+    def feed(self, data):
+        """
+        :return: 本次读完的顶层content，与ObjectRead.readContent的返回值相同。
+                 流中的数据有错误时抛出异常，之后不能继续feed
+        """
+        self.buffer += data
+        contents = []
+        if self.reader is None:
+            if len(self.buffer) < 4:
+                return contents
+            self.reader = ObjectRead(bytes(self.buffer[:4]), handler=self.handler)
+            # 所有元素都经过driveContent，数据不完整时在driveContent中等待
+            self.reader.inlineReaders = {}
+            self.stream = self.reader.bin = FeedBufferIO(b'')
+            del self.buffer[:4]
+        reader = self.reader
+        stream = self.stream
+        stream.buffer = memoryview(self.buffer)
+        try:
+            while True:
+                if self.driver is None:
+                    if stream.pos == len(self.buffer):
+                        break
+                    if stream.pos:
+                        # 丢弃已经读完的content，新的content从缓冲区的开头开始
+                        stream.release()
+                        del self.buffer[:stream.pos]
+                        stream.buffer = memoryview(self.buffer)
+                        stream.pos = 0
+                    self.driver = reader.driveContent(False, resumable=True)
+                try:
+                    next(self.driver)
+                except StopIteration as e:
+                    self.driver = None
+                    contents.append(e.value)
+                else:
+                    # 数据不完整，等待下一次feed
+                    break
+        finally:
+            stream.release()
+            if self.driver is None:
+                del self.buffer[:stream.pos]
+                stream.pos = 0
+        return contents
+
+    @property
+    def pending(self):
+        """
+        已经收到但还没有组成完整content的字节数
+        """
+        return len(self.buffer)
+
+    def close(self):
+        """
+        数据全部到达后调用，还有不完整的content时抛出EOFError
+        """
+        if self.buffer:
+            raise EOFError(f"stream ended inside a content, {len(self.buffer)} bytes pending")
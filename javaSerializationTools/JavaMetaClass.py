@@ -1,18 +1,62 @@
 # -*- coding: utf-8 -*-
-reference = []
+import hashlib
+from array import array
 
+from .ObjectIO import primitiveRun, PRIMITIVE_FORMATS, MIN_WRITE_RUN_LENGTH
+
+
+class JavaMeta:
+    """
+    所有节点都使用__slots__，不再为每个对象创建__dict__。
+    __getstate__返回字段组成的dict，pickle、deepcopy以及yaml的序列化结果与之前dict实现的对象一致
+    """
+    __slots__ = ()
+
+    def __getstate__(self):
+        return {name: getattr(self, name) for name in slotNames(type(self)) if hasattr(self, name)}
+
+    def __setstate__(self, state):
+        for name, value in state.items():
+            setattr(self, name, value)
+
+
+def slotNames(cls):
+    """
+    cls和所有父类声明的__slots__，__slots__只包含类自己声明的名字
+    """
+    names = SLOT_NAMES.get(cls)
+    if names is None:
+        names = []
+        for klass in reversed(cls.__mro__):
+            for name in klass.__dict__.get('__slots__', ()):
+                if name not in names:
+                    names.append(name)
+        names = SLOT_NAMES[cls] = tuple(names)
+    return names
+
+
+# 类 -> slotNames的结果
+SLOT_NAMES = {}
+
+
+class JavaEndBlock(JavaMeta):
+    __slots__ = ()
 
-class JavaEndBlock:
     def __eq__(self, other):
         return isinstance(other, JavaEndBlock)
 
+    def __hash__(self):
+        return hash(JavaEndBlock)
+
 
 """
 两种block的区别在于size的大小，一个为byte，一个为int
 """
 
 
-class JavaBLockData:
+class JavaBLockData(JavaMeta):
+    __slots__ = ('size', 'data')
+
     def __init__(self, size, data):
         self.size = size
         self.data = data
@@ -22,8 +66,13 @@ class JavaBLockData:
             return False
         return self.size == other.size and self.data == other.data
 
+    def __hash__(self):
+        return hash((JavaBLockData, self.size, bytes(self.data)))
+
+
+class JavaLongBLockData(JavaMeta):
+    __slots__ = ('size', 'data')
 
-class JavaLongBLockData:
     def __init__(self, size, data):
         self.size = size
         self.data = data
@@ -33,8 +82,44 @@ class JavaLongBLockData:
             return False
         return self.size == other.size and self.data == other.data
 
+    def __hash__(self):
+        return hash((JavaLongBLockData, self.size, bytes(self.data)))
+
+
+class JavaFieldDesc(JavaMeta):
+    """
+    类描述中的字段，保留下标访问，field['name']与field.name等价，兼容之前的{'name', 'signature'} dict
+    """
+    __slots__ = ('name', 'signature')
+
+    def __init__(self, name, signature):
+        self.name = name
+        self.signature = signature
+
+    def __getitem__(self, key):
+        if key == 'name':
+            return self.name
+        if key == 'signature':
+            return self.signature
+        raise KeyError(key)
+
+    def __eq__(self, other):
+        if isinstance(other, dict):
+            return other.get('name') == self.name and other.get('signature') == self.signature
+        if not isinstance(other, JavaFieldDesc):
+            return False
+        return other.name == self.name and other.signature == self.signature
+
+    def __hash__(self):
+        return hash((self.name, str(self.signature)))
+
+
+class JavaClassDesc(JavaMeta):
+    # prefixLayout只在primitivePrefix中设置，contentKey只在HandleTable.descKey中设置，
+    # readCodec只在ObjectRead.classCodec中设置，不属于对象的状态
+    __slots__ = ('name', 'suid', 'flags', 'superJavaClass', 'fields', 'classAnnotations', 'hasWriteObjectData',
+                 'hasBlockExternalData', 'prefixLayout', 'contentKey', 'readCodec')
 
-class JavaClassDesc:
     def __init__(self, name, suid, flags):
         self.name = name
         self.suid = suid
@@ -43,17 +128,57 @@ class JavaClassDesc:
         self.fields = []
         self.classAnnotations = []
         self.hasWriteObjectData = False
+        self.hasBlockExternalData = False
+        self.contentKey = None
+        self.readCodec = None
+
+    def __getstate__(self):
+        state = super().__getstate__()
+        state.pop('prefixLayout', None)
+        state.pop('contentKey', None)
+        state.pop('readCodec', None)
+        return state
+
+    def primitivePrefix(self):
+        """
+        Java按先基本类型、后对象类型的顺序排列字段，开头连续的基本类型字段编译为一个PrimitiveRun，
+        写入时该类的所有对象共用，少于MIN_WRITE_RUN_LENGTH个时返回None。
+        结果缓存在类描述上，fields被替换或者增删字段后重新计算
+        """
+        fields = self.fields
+        try:
+            layout = self.prefixLayout
+            if layout[0] is fields and layout[1] == len(fields):
+                return layout[2]
+        except AttributeError:
+            pass
+        count = 0
+        for field in fields:
+            signature = field['signature']
+            if type(signature) is not str or signature not in PRIMITIVE_FORMATS:
+                break
+            count += 1
+        run = None
+        if count >= MIN_WRITE_RUN_LENGTH:
+            run = primitiveRun(tuple(field['signature'] for field in fields[:count]))
+        self.prefixLayout = (fields, len(fields), run)
+        return run
 
     def __eq__(self, other):
         if not isinstance(other, JavaClassDesc):
             return False
         return other.name == self.name
 
+    def __hash__(self):
+        return hash((JavaClassDesc, self.name))
+
     def __str__(self):
         return f"javaclass {self.name}"
 
 
-class JavaClass:
+class JavaClass(JavaMeta):
+    __slots__ = ('javaclassDesc',)
+
     def __init__(self, javaclassDesc):
         self.javaclassDesc = javaclassDesc
 
@@ -62,8 +187,15 @@ class JavaClass:
             return False
         return self.javaclassDesc == other.javaclassDesc
 
+    def __hash__(self):
+        return hash((JavaClass, self.javaclassDesc))
+
+
+class JavaProxyClass(JavaMeta):
+    # readCodec同JavaClassDesc
+    __slots__ = ('interfaces', 'classAnnotations', 'superJavaClass', 'fields', 'hasWriteObjectData', 'name',
+                 'readCodec')
 
-class JavaProxyClass:
     def __init__(self, interfaces):
         self.interfaces = interfaces
         self.classAnnotations = []
@@ -71,27 +203,36 @@ class JavaProxyClass:
         self.fields = []
         self.hasWriteObjectData = False
         self.name = "Dynamic proxy"
+        self.readCodec = None
+
+    def __getstate__(self):
+        state = super().__getstate__()
+        state.pop('readCodec', None)
+        return state
 
     def __eq__(self, other):
-        if not isinstance(other, JavaProxyClass):
-            return False
-        for i in zip(self.interfaces, other.interfaces):
-            if i[0] != i[1]:
-                return False
-        return self.superJavaClass == other.superJavaClass
+        return graphEqual(self, other)
 
+    def __hash__(self):
+        return hash((JavaProxyClass, tuple(self.interfaces)))
+
+
+class JavaException(JavaMeta):
+    __slots__ = ('exception',)
 
-class JavaException:
     def __init__(self, exception):
         self.exception = exception
 
     def __eq__(self, other):
-        if not isinstance(other, JavaException):
-            return False
-        return self.exception == other.exception
+        return graphEqual(self, other)
 
+    def __hash__(self):
+        return structuralHash(self)
+
+
+class JavaArray(JavaMeta):
+    __slots__ = ('signature', 'length', 'list')
 
-class JavaArray:
     def __init__(self, length, signature):
         self.signature = signature
         self.length = length
@@ -101,28 +242,29 @@ class JavaArray:
         self.list.append(__obj__)
 
     def __eq__(self, other):
-        if not isinstance(other, JavaArray):
-            return False
-        if self.length != other.length:
-            return False
-        for i in zip(self.list, other.list):
-            if i[0] != i[1]:
-                return False
-        return True
+        return graphEqual(self, other)
+
+    def __hash__(self):
+        return structuralHash(self)
 
 
-class JavaEnum:
+class JavaEnum(JavaMeta):
+    __slots__ = ('javaClass', 'enumConstantName')
+
     def __init__(self, javaClass):
         self.javaClass = javaClass
         self.enumConstantName = None
 
     def __eq__(self, other):
-        if not isinstance(other, JavaEnum):
-            return False
-        return other.javaClass == self.javaClass and self.enumConstantName == other.enumConstantName
+        return graphEqual(self, other)
 
+    def __hash__(self):
+        return hash((JavaEnum, self.javaClass, self.enumConstantName))
+
+
+class JavaString(JavaMeta):
+    __slots__ = ('string',)
 
-class JavaString:
     def __init__(self, string):
         self.string = string
 
@@ -137,8 +279,13 @@ class JavaString:
             return False
         return other.string == self.string
 
+    def __hash__(self):
+        return hash(self.string)
+
+
+class JavaObject(JavaMeta):
+    __slots__ = ('javaClass', 'fields', 'objectAnnotation')
 
-class JavaObject:
     def __init__(self, javaClass):
         self.javaClass = javaClass
         # fields 保存类的字段，队列数据结构。父类在最前，子类在最后
@@ -149,45 +296,292 @@ class JavaObject:
         return f"className {self.javaClass.name}\t extend {self.javaClass.superJavaClass}"
 
     def __eq__(self, other):
-        if not isinstance(other, JavaObject):
-            return False
-        if id(other) == id(self):
-            return True
-        if other.javaClass != self.javaClass:
-            return False
-        if len(other.fields) != len(self.fields):
-            return False
-        else:
-            if id(self) in reference:
-                return True
-            else:
-                reference.append(id(self))
-            for i in zip(self.fields, other.fields):
-                for j in zip(*i):
-                    if j[0].value == self and j[1].value == other:
-                        continue
-                    if j[0] != j[1]:
-                        reference.pop()
-                        return False
-        if len(other.objectAnnotation) != len(self.objectAnnotation):
-            reference.pop()
-            return False
-        else:
-            for i in zip(other.objectAnnotation, self.objectAnnotation):
-                if i[0] != i[1]:
-                    reference.pop()
-                    return False
-        reference.pop()
-        return True
+        return graphEqual(self, other)
+
+    def __hash__(self):
+        return structuralHash(self)
+
+
+# JavaObject.fields的slot，LazyJavaObject用它读写还没有补全的字段
+RAW_FIELDS = JavaObject.fields
+
+
+class LazyJavaObject(JavaObject):
+    """
+    ObjectRead(lazy=True)读到的对象。每个类的字段中开头连续的基本类型字段只记录在缓冲区中的位置，
+    第一次访问fields时才读取，其余字段与JavaObject相同。
+    pending中是(字段列表, 基本类型字段的JavaFieldDesc, 缓冲区, 偏移)，读取前缓冲区需要保持有效。
+    copy、pickle时先读取全部字段，结果是普通的JavaObject
+    """
+    __slots__ = ('pending',)
+
+    def __init__(self, javaClass):
+        self.pending = []
+        super().__init__(javaClass)
+
+    @property
+    def fields(self):
+        if self.pending:
+            self.materialize()
+        return RAW_FIELDS.__get__(self)
+
+    @fields.setter
+    def fields(self, value):
+        self.pending = []
+        RAW_FIELDS.__set__(self, value)
 
+    def rawFields(self):
+        """
+        不读取延迟的字段，ObjectRead构造对象时使用
+        """
+        return RAW_FIELDS.__get__(self)
+
+    def materialize(self):
+        pending, self.pending = self.pending, []
+        for fields, fieldDescs, buffer, offset in pending:
+            values = primitiveRun(tuple(field.signature for field in fieldDescs)).unpackFrom(buffer, offset)
+            fields[0:0] = [JavaField(field.name, field.signature, value) for field, value in zip(fieldDescs, values)]
+
+    def __reduce_ex__(self, protocol):
+        state = {'javaClass': self.javaClass, 'fields': self.fields, 'objectAnnotation': self.objectAnnotation}
+        return JavaObject.__new__, (JavaObject,), state
+
+
+class JavaField(JavaMeta):
+    __slots__ = ('fieldName', 'signature', 'value')
 
-class JavaField:
     def __init__(self, name, signature, value):
         self.fieldName = name
         self.signature = signature
         self.value = value
 
     def __eq__(self, other):
-        if not isinstance(other, JavaField):
+        return graphEqual(self, other)
+
+    def __hash__(self):
+        return structuralHash(self)
+
+
+# 可能包含其他对象、需要按图比较的类型
+NESTED_TYPES = {JavaObject, JavaField, JavaArray, JavaException, JavaEnum, JavaProxyClass}
+
+# 按结构比较、计算摘要时视为同一种类型
+NODE_TYPES = {LazyJavaObject: JavaObject}
+
+
+def graphEqual(a, b):
+    """
+    按结构比较两个对象图。用显式的栈按对比较，已经比较过或正在比较的一对对象视为相等，
+    因此环和共享的子图只比较一次，耗时与图的大小成线性，不受递归深度限制，也没有全局状态。
+    JavaClassDesc按类名比较，JavaString按字符串比较，NaN与NaN相等
+    """
+    visited = set()
+    stack = [(a, b)]
+    push = stack.append
+    while stack:
+        x, y = stack.pop()
+        if x is y:
+            continue
+        t = type(x)
+        t = NODE_TYPES.get(t, t)
+        typeY = type(y)
+        typeY = NODE_TYPES.get(typeY, typeY)
+        if t not in NESTED_TYPES:
+            if typeY in NESTED_TYPES:
+                return False
+            # float和double字段的NaN视为相等
+            if x != y and not (t is float and x != x and y != y):
+                return False
+            continue
+        if typeY is not t:
             return False
-        return other.signature == self.signature and other.value == self.value and other.fieldName == self.fieldName
+        key = (id(x), id(y))
+        if key in visited:
+            continue
+        visited.add(key)
+        if t is JavaObject:
+            if x.javaClass != y.javaClass or len(x.fields) != len(y.fields) or \
+                    len(x.objectAnnotation) != len(y.objectAnnotation):
+                return False
+            for fieldsX, fieldsY in zip(x.fields, y.fields):
+                if len(fieldsX) != len(fieldsY):
+                    return False
+                for fieldX, fieldY in zip(fieldsX, fieldsY):
+                    if fieldX.fieldName != fieldY.fieldName or fieldX.signature != fieldY.signature:
+                        return False
+                    push((fieldX.value, fieldY.value))
+            stack.extend(zip(x.objectAnnotation, y.objectAnnotation))
+        elif t is JavaField:
+            if x.fieldName != y.fieldName or x.signature != y.signature:
+                return False
+            push((x.value, y.value))
+        elif t is JavaArray:
+            if x.length != y.length or x.signature != y.signature:
+                return False
+            if type(x.list) is list and type(y.list) is list:
+                if len(x.list) != len(y.list):
+                    return False
+                stack.extend(zip(x.list, y.list))
+            elif type(x.list) is array and type(y.list) is array:
+                if x.list.typecode != y.list.typecode or x.list.tobytes() != y.list.tobytes():
+                    return False
+            elif type(x.list) is type(y.list):
+                if x.list != y.list:
+                    return False
+            elif list(x.list) != list(y.list):
+                return False
+        elif t is JavaException:
+            push((x.exception, y.exception))
+        elif t is JavaEnum:
+            if x.javaClass != y.javaClass:
+                return False
+            push((x.enumConstantName, y.enumConstantName))
+        elif t is JavaProxyClass:
+            if list(x.interfaces) != list(y.interfaces):
+                return False
+            push((x.superJavaClass, y.superJavaClass))
+    return True
+
+
+# __hash__只展开到这个深度，保证与graphEqual一致（相等的图展开到任意深度都相同），且环不会无限展开
+HASH_DEPTH = 2
+
+
+def structuralHash(obj, depth=HASH_DEPTH):
+    """
+    与graphEqual一致的hash，相等的对象hash相同。对象可以修改，放入set、dict后不应再修改
+    """
+    t = type(obj)
+    t = NODE_TYPES.get(t, t)
+    if t is JavaObject:
+        items = [JavaObject, obj.javaClass.name, len(obj.objectAnnotation)]
+        for fields in obj.fields:
+            for field in fields:
+                items.append(field.fieldName)
+                if depth:
+                    items.append(structuralHash(field.value, depth - 1))
+        return hash(tuple(items))
+    if t is JavaField:
+        return hash((JavaField, obj.fieldName, structuralHash(obj.value, depth)))
+    if t is JavaArray:
+        return hash((JavaArray, obj.signature.name, obj.length))
+    if t is JavaException:
+        return hash((JavaException, structuralHash(obj.exception, depth)))
+    if t is float and obj != obj:
+        # NaN的hash与对象有关
+        return hash(float)
+    try:
+        return hash(obj)
+    except TypeError:
+        # list、array等不可hash的值
+        return hash(t)
+
+
+def fingerprint(content):
+    """
+    对象图的摘要，与进程无关，可以保存下来用于按内容去重、缓存。
+    共享的对象和环按第一次出现的序号记录，结构和共享方式都相同的图摘要相同；
+    graphEqual认为相等、但共享方式不同的图（如同一个对象与两个相同的对象）摘要可能不同
+    :return: 32个字符的十六进制字符串
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    update = digest.update
+
+    def text(tag, value):
+        data = str(value).encode('utf-8', 'surrogatepass')
+        update(b'%s%d:' % (tag, len(data)))
+        update(data)
+
+    seen = {}
+    stack = [content]
+    push = stack.append
+    while stack:
+        obj = stack.pop()
+        t = type(obj)
+        t = NODE_TYPES.get(t, t)
+        if t in FINGERPRINT_SHARED:
+            index = seen.get(id(obj))
+            if index is not None:
+                update(b'R%d;' % index)
+                continue
+            seen[id(obj)] = len(seen)
+        if t is JavaObject:
+            text(b'O', obj.javaClass.name)
+            update(b'%d,%d;' % (len(obj.fields), len(obj.objectAnnotation)))
+            children = []
+            for fields in obj.fields:
+                update(b'%d;' % len(fields))
+                for field in fields:
+                    text(b'f', field.fieldName)
+                    text(b's', field.signature)
+                    children.append(field.value)
+            children.extend(obj.objectAnnotation)
+            push(obj.javaClass)
+            stack.extend(reversed(children))
+        elif t is JavaClassDesc:
+            text(b'C', obj.name)
+            update(b'%d,%d,%d;' % (obj.suid, obj.flags, len(obj.fields)))
+            for field in obj.fields:
+                text(b'f', field['name'])
+                text(b's', field['signature'])
+            update(b'%d;' % len(obj.classAnnotations))
+            push(obj.superJavaClass)
+            stack.extend(reversed(obj.classAnnotations))
+        elif t is JavaString:
+            text(b'S', obj.string)
+        elif t is JavaArray:
+            update(b'A%d;' % obj.length)
+            values = obj.list
+            if type(values) is list:
+                update(b'%d;' % len(values))
+                stack.extend(reversed(values))
+            else:
+                push(values)
+            push(obj.signature)
+        elif t is JavaField:
+            text(b'F', obj.fieldName)
+            text(b's', obj.signature)
+            push(obj.value)
+        elif t is JavaEnum:
+            update(b'E')
+            push(obj.enumConstantName)
+            push(obj.javaClass)
+        elif t is JavaClass:
+            update(b'K')
+            push(obj.javaclassDesc)
+        elif t is JavaProxyClass:
+            update(b'P%d;' % len(obj.interfaces))
+            for interface in obj.interfaces:
+                text(b'i', interface)
+            update(b'%d;' % len(obj.classAnnotations))
+            push(obj.superJavaClass)
+            stack.extend(reversed(obj.classAnnotations))
+        elif t is JavaException:
+            update(b'X')
+            push(obj.exception)
+        elif t is JavaBLockData or t is JavaLongBLockData:
+            update(b'B' if t is JavaBLockData else b'G')
+            update(b'%d;' % obj.size)
+            push(bytes(obj.data))
+        elif t is JavaEndBlock:
+            update(b'e')
+        elif obj is None:
+            update(b'N')
+        elif t is bytes or t is bytearray or t is memoryview:
+            update(b'b%d:' % len(obj))
+            update(obj)
+        elif t is array:
+            text(b'a', obj.typecode)
+            update(b'%d:' % len(obj))
+            update(obj.tobytes())
+        elif t is list or t is tuple:
+            update(b'L%d;' % len(obj))
+            stack.extend(reversed(obj))
+        else:
+            # str、int、float、bool等基本类型的值
+            text(t.__name__.encode(), repr(obj))
+    return digest.hexdigest()
+
+
+# 可能被多处引用的对象，fingerprint中第二次出现时只记录序号
+FINGERPRINT_SHARED = {JavaObject, JavaArray, JavaClassDesc, JavaProxyClass, JavaEnum, JavaClass, JavaString}
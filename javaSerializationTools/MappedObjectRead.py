@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+import gc
+import mmap
+import warnings
+
+from .ObjectIO import BufferIO
+from .ObjectRead import ObjectRead
+
+
+class MappedObjectRead(ObjectRead):
+    """
+    用mmap映射文件后读取，不把文件读入内存，适用于很大的序列化文件：
+        with MappedObjectRead('sessions.ser') as reader:
+            for content in reader:
+                ...
+    zeroCopy为True时块数据、byte数组和boolean数组是映射的memoryview切片，不复制数据，
+    占用的内存只有构造出的对象，文件内容由操作系统按需换入换出。
+    close之前需要释放所有切片的引用，需要长期保留的数据用bytes()复制
+    """
+
+    def __init__(self, path, tracer=None, handler=None, registry=None, lazy=False, zeroCopy=True):
+        with open(path, 'rb') as f:
+            self.mapping = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            super().__init__(BufferIO(self.mapping, zeroCopy), tracer, handler, registry, lazy)
+        except Exception:
+            self.close()
+            raise
+
+    def __iter__(self):
+        """
+        依次返回剩余的顶层content
+        """
+        while self.bin.peekByte():
+            yield self.readContent()
+
+    def close(self):
+        """
+        还有切片或者LazyJavaObject引用映射时抛出BufferError，映射保持打开
+        """
+        if self.mapping.closed:
+            return
+        # handle表中的对象也引用切片
+        self.handles = []
+        self.bin.release()
+        try:
+            self.mapping.close()
+            return
+        except BufferError:
+            pass
+        # 有环的对象图需要回收后才会释放切片
+        gc.collect()
+        try:
+            self.mapping.close()
+        except BufferError:
+            raise BufferError("memoryview slices of the mapped file are still referenced") from None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, excType, excValue, traceback):
+        if excType is None:
+            self.close()
+            return
+        # 异常的traceback中的帧可能还引用切片，关闭失败时不掩盖原来的异常
+        try:
+            self.close()
+        except BufferError as e:
+            warnings.warn(f"mapping left open: {e}", ResourceWarning)
@@ -0,0 +1,158 @@
+# -*- coding: utf-8 -*-
+from collections import namedtuple, deque
+
+from .ContentHandler import ContentHandler
+
+
+class ObjectEvent(namedtuple('ObjectEvent', ['event', 'depth', 'handle', 'classDesc', 'name', 'value'])):
+    """
+    ObjectRead.events()产生的事件
+    event     事件名。startObject、startArray、startEnum、classDesc开始一个子树，分别由endObject、endArray、endEnum、
+              endClassDesc结束；其余为classData、field、arrayValues、string、reference、null、class、exception、
+              blockData、endBlock、reset
+    depth     事件所在的嵌套深度，子树的开始和结束事件深度相同
+    handle    相关的handle。对象、数组、枚举、TC_CLASS不再构造，它们的值就是各自的handle
+    classDesc 相关的类描述
+    name      字段名
+    value     字段的值、字符串的值、基本类型数组的值、块数据等
+    """
+    __slots__ = ()
+
+
+class EventCollector(ContentHandler):
+    """
+    把ObjectRead的回调转换为ObjectEvent放入队列，由EventStream取出
+    """
+
+    def __init__(self):
+        self.events = deque()
+        self.depth = 0
+        # 不为None时丢弃深度大于skipDepth的事件，以及深度等于skipDepth的结束事件
+        self.skipDepth = None
+
+    def emit(self, event, handle=None, classDesc=None, name=None, value=None):
+        if self.skipDepth is not None:
+            if self.depth > self.skipDepth:
+                return
+            self.skipDepth = None
+            return
+        self.events.append(ObjectEvent(event, self.depth, handle, classDesc, name, value))
+
+    def start(self, event, handle, classDesc, value=None):
+        self.emit(event, handle, classDesc, value=value)
+        self.depth += 1
+
+    def end(self, event, handle, classDesc=None, value=None):
+        self.depth -= 1
+        self.emit(event, handle, classDesc, value=value)
+
+    def reset(self):
+        self.emit('reset')
+
+    def null(self):
+        self.emit('null')
+        return None
+
+    def reference(self, handle, value):
+        self.emit('reference', handle, value=value)
+        return value
+
+    def string(self, handle, javaString):
+        self.emit('string', handle, value=javaString.string)
+        return javaString
+
+    def classDesc(self, handle, classDesc):
+        self.start('classDesc', handle, classDesc)
+
+    def endClassDesc(self, classDesc):
+        self.end('endClassDesc', None, classDesc)
+
+    def startObject(self, handle, classDesc):
+        self.start('startObject', handle, classDesc)
+        return handle
+
+    def classData(self, handle, classDesc):
+        self.emit('classData', handle, classDesc)
+
+    def field(self, handle, fieldDesc, value):
+        self.emit('field', handle, name=fieldDesc.name, value=value)
+
+    def endObject(self, handle):
+        self.end('endObject', handle)
+
+    def startArray(self, handle, classDesc, size):
+        self.start('startArray', handle, classDesc, size)
+        return handle
+
+    def arrayValues(self, handle, values):
+        self.emit('arrayValues', handle, value=values)
+
+    def endArray(self, handle):
+        self.end('endArray', handle)
+
+    def startEnum(self, handle, classDesc):
+        self.start('startEnum', handle, classDesc)
+        return handle
+
+    def endEnum(self, handle, constantName):
+        self.end('endEnum', handle, value=constantName)
+
+    def javaClass(self, handle, classDesc):
+        self.emit('class', handle, classDesc)
+        return handle
+
+    def exception(self, value):
+        self.emit('exception', value=value)
+        return value
+
+    def blockData(self, tc, data):
+        self.emit('blockData', value=data)
+        return data
+
+    def endBlock(self):
+        self.emit('endBlock')
+        return None
+
+
+class EventStream:
+    """
+    ObjectRead.events()返回的迭代器，一直读取到流结束。
+    每次只解析到产生下一个事件为止，已经读过的对象不会保留，内存占用与流的大小无关（handle表除外）。
+    收到startObject等开始事件后调用skip()，会跳过该子树剩余的事件，包括对应的结束事件。
+    被跳过的子树仍然需要解析，以保证之后的handle正确
+    """
+
+    def __init__(self, reader, collector):
+        self.reader = reader
+        self.collector = collector
+        self.driver = None
+        self.last = None
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        events = self.collector.events
+        while not events:
+            if self.driver is None:
+                if self.reader.bin.peekByte() == b'':
+                    raise StopIteration
+                self.driver = self.reader.driveContent(True)
+            try:
+                next(self.driver)
+            except StopIteration:
+                self.driver = None
+        self.last = events.popleft()
+        return self.last
+
+    def skip(self):
+        last = self.last
+        if last is None or last.event not in ('startObject', 'startArray', 'startEnum', 'classDesc'):
+            raise ValueError("skip() must follow a start event")
+        events = self.collector.events
+        # 已经在队列中的子树事件直接丢弃，子树还没有读完时由collector继续丢弃
+        while events:
+            event = events.popleft()
+            if event.depth == last.depth:
+                return
+        self.collector.skipDepth = last.depth
@@ -1,8 +1,71 @@
 # -*- coding: utf-8 -*-
-from struct import pack, unpack
+import re
+from struct import pack, unpack, Struct, error as StructError
+
+from .Exceptions import NeedMoreDataException
+
+# 补充平面的字符，Java中是两个char
+SUPPLEMENTARY = re.compile('[\U00010000-\U0010ffff]')
+SURROGATE = re.compile('[\ud800-\udfff]')
+
+# 2字节长度能表示的最大字节数，超过时字符串写成TC_LONGSTRING
+MAX_UTF_LENGTH = 0xFFFF
+
+# 编码结果缓存的字符串最大长度和缓存的数量
+UTF_CACHE_LENGTH = 256
+UTF_CACHE_SIZE = 4096
+utfCache = {}
+
+
+def decodeUtf(data):
+    """
+    解码Java的modified UTF-8：NUL编码为C0 80，补充平面的字符编码为两个3字节的代理项。
+    只有ASCII时直接解码，不逐个字符处理
+    """
+    try:
+        return str(data, 'ascii')
+    except UnicodeDecodeError:
+        pass
+    text = bytes(data).replace(b'\xc0\x80', b'\x00').decode('utf-8', 'surrogatepass')
+    if SURROGATE.search(text):
+        # 合并成对的代理项，单独的代理项保持不变
+        text = text.encode('utf-16-be', 'surrogatepass').decode('utf-16-be', 'surrogatepass')
+    return text
+
+
+def splitSurrogates(match):
+    code = ord(match.group()) - 0x10000
+    return chr(0xD800 + (code >> 10)) + chr(0xDC00 + (code & 0x3FF))
+
+
+def encodeUtf(text):
+    """
+    编码为Java的modified UTF-8。不含NUL的ASCII直接编码，
+    其他较短的字符串（非ASCII的类名、字段名等）缓存编码结果
+    """
+    if text.isascii() and '\x00' not in text:
+        return text.encode()
+    data = utfCache.get(text)
+    if data is not None:
+        return data
+    data = SUPPLEMENTARY.sub(splitSurrogates, text).encode('utf-8', 'surrogatepass').replace(b'\x00', b'\xc0\x80')
+    if len(text) <= UTF_CACHE_LENGTH:
+        if len(utfCache) >= UTF_CACHE_SIZE:
+            utfCache.clear()
+        utfCache[text] = data
+    return data
+
+
+def utfTooLong(data):
+    return ValueError(f"modified UTF-8 string of {len(data)} bytes exceeds {MAX_UTF_LENGTH} bytes")
 
 
 class ObjectIO:
+    # 流没有读取位置，只有FeedBufferIO需要在数据不完整时回退到之前的位置
+    pos = None
+    # 剩余的数据不够时抛出的异常
+    eofError = EOFError
+
     def __init__(self, base_stream):
         self.base_stream = base_stream
 
@@ -12,6 +75,12 @@ class ObjectIO:
     def peekByte(self) -> bytes:
         return self.base_stream.peek()[:1]
 
+    def tell(self):
+        try:
+            return self.base_stream.tell()
+        except (AttributeError, OSError):
+            return None
+
     def readUnsignedShort(self) -> int:
         number = self.readBytes(2)
         number = int.from_bytes(number, 'big')
@@ -36,17 +105,25 @@ class ObjectIO:
         self.writeBytes(num.to_bytes(4, 'big', signed=True))
 
     def readBytes(self, length) -> bytes:
-        return self.base_stream.read(length)
+        data = self.base_stream.read(length)
+        if len(data) != length:
+            # 流的read在末尾返回不足length的数据，不能当作完整的值
+            raise EOFError(f"stream ended at offset {self.tell()}, {length} bytes needed, {len(data)} left")
+        return data
 
     def readString(self) -> str:
         length = self.readUnsignedShort()
-        return self.readBytes(length).decode()
+        return decodeUtf(self.readBytes(length))
+
+    def readLongString(self) -> str:
+        """
+        TC_LONGSTRING的字符串，长度为8字节
+        """
+        length = self.readUnsignedLong()
+        return decodeUtf(self.readBytes(length))
 
     def readFloat(self):
-        num = self.readBytes(4)
-        # 模拟ieee 754 标准，具体参考https://stackoverflow.com/questions/30124608/convert-unsigned-integer-to-float-in-python
-        s = pack('>l', int.from_bytes(num, 'big'))
-        return unpack('>f', s)[0]
+        return FLOAT.unpack(self.readBytes(4))[0]
 
     def readBoolean(self):
         tc = int.from_bytes(self.readByte(), 'big')
@@ -57,16 +134,22 @@ class ObjectIO:
         return tc.decode()
 
     def readDouble(self):
-        tc = self.readBytes(8)
-        return unpack('d', tc)[0]
+        return DOUBLE.unpack(self.readBytes(8))[0]
 
     def writeBytes(self, value):
         self.base_stream.write(value)
 
     def writeString(self, value):
-        length = len(value)
-        self.writeShort(length)
-        self.writeBytes(value.encode())
+        data = encodeUtf(value)
+        if len(data) > MAX_UTF_LENGTH:
+            raise utfTooLong(data)
+        self.writeShort(len(data))
+        self.writeBytes(data)
+
+    def writeLongString(self, value):
+        data = encodeUtf(value)
+        self.writeLong(len(data))
+        self.writeBytes(data)
 
     def pack(self, fmt, data):
         return self.writeBytes(pack(fmt, data))
@@ -81,16 +164,352 @@ class ObjectIO:
         self.writeBytes(num.to_bytes(8, "big", signed=True))
 
     def writeFloat(self, value):
-        s = pack('>f', value)
-        s = unpack('>l', s)[0]
-        self.writeBytes(s.to_bytes(4, 'big'))
+        self.writeBytes(FLOAT.pack(value))
 
     def writeChar(self, value):
-        self.writeBytes(value.encode)
+        self.writeBytes(encodeChar(value))
 
     def writeDouble(self, value):
-        self.writeBytes(pack('d', value))
+        self.writeBytes(DOUBLE.pack(value))
 
     def writeBoolean(self, value):
         value = 0 if value else 1
         self.writeBytes(value.to_bytes(1, 'big'))
+
+
+BYTES = tuple(bytes((i,)) for i in range(256))
+UNSIGNED_SHORT = Struct('>H')
+INT = Struct('>i')
+LONG = Struct('>q')
+UNSIGNED_LONG = Struct('>Q')
+# Java的DataOutput按大端序写入float和double，与基本类型数组一致
+FLOAT = Struct('>f')
+DOUBLE = Struct('>d')
+
+
+class BufferIO:
+    """
+    直接从bytes、bytearray、memoryview或mmap中读取，用下标记录读取位置，不依赖流的read()和peek()
+    各方法的返回值与ObjectIO一致，zeroCopy为True时readBytes返回原缓冲区的memoryview切片，不复制数据
+    """
+    # 剩余的数据不够时抛出的异常
+    eofError = EOFError
+
+    def __init__(self, buffer, zeroCopy=False):
+        buffer = memoryview(buffer)
+        if buffer.format != 'B':
+            buffer = buffer.cast('B')
+        self.buffer = buffer
+        self.pos = 0
+        self.zeroCopy = zeroCopy
+
+    def tell(self):
+        # 读取越过末尾时pos会大于缓冲区的长度，实际的数据在末尾结束
+        return min(self.pos, len(self.buffer))
+
+    def release(self):
+        """
+        释放对缓冲区的引用，mmap需要在没有memoryview引用时才能close
+        """
+        self.buffer.release()
+
+    def readByte(self) -> bytes:
+        pos = self.pos
+        try:
+            tc = BYTES[self.buffer[pos]]
+        except IndexError:
+            return b''
+        self.pos = pos + 1
+        return tc
+
+    def peekByte(self) -> bytes:
+        try:
+            return BYTES[self.buffer[self.pos]]
+        except IndexError:
+            return b''
+
+    def unpack(self, struct):
+        pos = self.pos
+        self.pos = pos + struct.size
+        return struct.unpack_from(self.buffer, pos)[0]
+
+    def readUnsignedShort(self) -> int:
+        pos = self.pos
+        self.pos = pos + 2
+        return UNSIGNED_SHORT.unpack_from(self.buffer, pos)[0]
+
+    def readUnsignedLong(self) -> int:
+        return self.unpack(UNSIGNED_LONG)
+
+    def readLong(self) -> int:
+        pos = self.pos
+        self.pos = pos + 8
+        return LONG.unpack_from(self.buffer, pos)[0]
+
+    def readShort(self) -> int:
+        return self.unpack(UNSIGNED_SHORT)
+
+    def readInt(self) -> int:
+        pos = self.pos
+        self.pos = pos + 4
+        return INT.unpack_from(self.buffer, pos)[0]
+
+    def truncated(self, pos, length):
+        """
+        变长的数据超过缓冲区末尾时抛出的异常，切片不会报错，需要单独检查
+        """
+        return self.eofError(f"stream ended at offset {len(self.buffer)}, "
+                             f"{length} bytes needed at offset {pos}")
+
+    def readBytes(self, length):
+        pos = self.pos
+        end = self.pos = pos + length
+        if end > len(self.buffer):
+            raise self.truncated(pos, length)
+        if self.zeroCopy:
+            return self.buffer[pos:end]
+        return self.buffer[pos:end].tobytes()
+
+    def readString(self) -> str:
+        length = self.readUnsignedShort()
+        pos = self.pos
+        end = self.pos = pos + length
+        if end > len(self.buffer):
+            raise self.truncated(pos, length)
+        try:
+            return str(self.buffer[pos:end], 'ascii')
+        except UnicodeDecodeError:
+            return decodeUtf(self.buffer[pos:end])
+
+    def readLongString(self) -> str:
+        length = self.readUnsignedLong()
+        pos = self.pos
+        end = self.pos = pos + length
+        if end > len(self.buffer):
+            raise self.truncated(pos, length)
+        return decodeUtf(self.buffer[pos:end])
+
+    def readFloat(self):
+        return self.unpack(FLOAT)
+
+    def readBoolean(self):
+        return self.readByte() == b'\x00'
+
+    def readChar(self):
+        pos = self.pos
+        self.pos = pos + 2
+        return str(self.buffer[pos:pos + 2], 'utf-8')
+
+    def readDouble(self):
+        return self.unpack(DOUBLE)
+
+
+class FeedBufferIO(BufferIO):
+    """
+    IncrementalObjectRead使用的缓冲区，保存已经收到的数据。剩余的数据不够时抛出NeedMoreDataException，
+    不会读出不完整的值，读取位置保持不变。peekByte在末尾和BufferIO一样返回b''
+    """
+    eofError = NeedMoreDataException
+
+    def require(self, size):
+        left = len(self.buffer) - self.pos
+        if size > left:
+            raise NeedMoreDataException(f"{size} bytes needed at offset {self.pos}, {left} received")
+
+    def readByte(self) -> bytes:
+        self.require(1)
+        return BufferIO.readByte(self)
+
+    def unpack(self, struct):
+        self.require(struct.size)
+        return BufferIO.unpack(self, struct)
+
+    def readUnsignedShort(self) -> int:
+        self.require(2)
+        return BufferIO.readUnsignedShort(self)
+
+    def readLong(self) -> int:
+        self.require(8)
+        return BufferIO.readLong(self)
+
+    def readInt(self) -> int:
+        self.require(4)
+        return BufferIO.readInt(self)
+
+    def readBytes(self, length):
+        self.require(length)
+        return BufferIO.readBytes(self, length)
+
+    def readString(self) -> str:
+        self.require(2)
+        self.require(2 + UNSIGNED_SHORT.unpack_from(self.buffer, self.pos)[0])
+        return BufferIO.readString(self)
+
+    def readLongString(self) -> str:
+        self.require(8)
+        self.require(8 + UNSIGNED_LONG.unpack_from(self.buffer, self.pos)[0])
+        return BufferIO.readLongString(self)
+
+    def readChar(self):
+        self.require(2)
+        return BufferIO.readChar(self)
+
+
+class BufferedIO(ObjectIO):
+    """
+    写入时先追加到bytearray中，flush时一次写入base_stream，不再每个字节、长度都调用一次write。
+    base_stream为None时只保存在内存中
+    """
+
+    def __init__(self, base_stream=None):
+        super().__init__(base_stream)
+        self.buffer = bytearray()
+        # 已经写入base_stream的数据的结束位置
+        self.offset = 0
+        if base_stream is not None:
+            self.offset = super().tell() or 0
+
+    def tell(self):
+        return self.offset + len(self.buffer)
+
+    def flush(self):
+        if self.base_stream is None or not self.buffer:
+            return
+        # 复制一份，base_stream可能保留传入的对象，之后清空缓冲区不应影响它
+        self.base_stream.write(bytes(self.buffer))
+        self.offset += len(self.buffer)
+        self.buffer.clear()
+
+    def writeBytes(self, value):
+        self.buffer += value
+
+    def writeInt(self, num):
+        self.buffer += INT.pack(num)
+
+    def writeShort(self, num):
+        self.buffer += UNSIGNED_SHORT.pack(num)
+
+    def writeLong(self, num):
+        self.buffer += LONG.pack(num)
+
+    def writeString(self, value):
+        if value.isascii() and '\x00' not in value:
+            data = value.encode()
+        else:
+            data = encodeUtf(value)
+        if len(data) > MAX_UTF_LENGTH:
+            raise utfTooLong(data)
+        self.buffer += UNSIGNED_SHORT.pack(len(data))
+        self.buffer += data
+
+    def writeLongString(self, value):
+        data = encodeUtf(value)
+        self.buffer += LONG.pack(len(data))
+        self.buffer += data
+
+    def writeFloat(self, value):
+        self.buffer += FLOAT.pack(value)
+
+    def writeDouble(self, value):
+        self.buffer += DOUBLE.pack(value)
+
+    def writeBoolean(self, value):
+        self.buffer.append(0 if value else 1)
+
+
+def decodeChar(value):
+    return str(value, 'utf-8')
+
+
+def decodeBoolean(value):
+    return value == 0
+
+
+def encodeChar(value):
+    """
+    readChar把两个字节按utf-8解码，这样读出的值原样编码回两个字节；
+    其余的单个字符按Java的char编码为UTF-16BE。逐个写入和PrimitiveRun都使用这里的结果
+    """
+    if isinstance(value, (bytes, bytearray)):
+        data = bytes(value)
+    else:
+        data = value.encode('utf-8', 'surrogatepass')
+        if len(data) != 2 and len(value) == 1:
+            data = value.encode('utf-16-be', 'surrogatepass')
+    if len(data) != 2:
+        raise StructError(f"char must encode to 2 bytes, got {value!r}")
+    return data
+
+
+def encodeBoolean(value):
+    return 0 if value else 1
+
+
+# 基本类型 -> (Struct格式, 读取后的转换, 写入前的转换)，结果与BufferIO、BufferedIO逐个读写一致
+PRIMITIVE_FORMATS = {'B': ('c', None, None), 'C': ('2s', decodeChar, encodeChar),
+                     'D': ('d', None, None), 'F': ('f', None, None), 'I': ('i', None, None),
+                     'J': ('q', None, None), 'S': ('H', None, None), 'Z': ('B', decodeBoolean, encodeBoolean)}
+
+
+class PrimitiveRun:
+    """
+    类描述中连续的基本类型字段，编译成一个Struct，一次unpack_from读取、一次pack写入
+    """
+
+    def __init__(self, signatures):
+        self.signatures = signatures
+        formats = [PRIMITIVE_FORMATS[signature] for signature in signatures]
+        self.struct = Struct('>' + ''.join(fmt for fmt, _, _ in formats))
+        self.size = self.struct.size
+        # (下标, 转换函数)，没有需要转换的字段时为空
+        self.decoders = [(index, decode) for index, (_, decode, _) in enumerate(formats) if decode is not None]
+        self.encoders = [(index, encode) for index, (_, _, encode) in enumerate(formats) if encode is not None]
+
+    def unpackFrom(self, buffer, offset=0):
+        values = self.struct.unpack_from(buffer, offset)
+        if self.decoders:
+            values = list(values)
+            for index, decode in self.decoders:
+                values[index] = decode(values[index])
+        return values
+
+    def read(self, stream):
+        """
+        从BufferIO读取，返回各字段的值
+        """
+        pos = stream.pos
+        stream.pos = pos + self.size
+        return self.unpackFrom(stream.buffer, pos)
+
+    def readStream(self, stream):
+        """
+        从ObjectIO读取
+        """
+        return self.unpackFrom(stream.readBytes(self.size))
+
+    def pack(self, values):
+        """
+        :param values: 各字段的值组成的list，会被修改
+        值的类型或范围不对时抛出struct.error
+        """
+        for index, encode in self.encoders:
+            values[index] = encode(values[index])
+        return self.struct.pack(*values)
+
+
+# 读取时少于这个数量的字段逐个读取更快。每个对象读取n个int字段，逐个读取/一次读取的耗时(ns)：
+# 1个 890/1470，3个 3270/3330，4个 4310/4000，6个 5890/5250。HashMap、URL、PriorityQueue开头只有1~2个基本类型字段
+MIN_RUN_LENGTH = 4
+# 写入时要先取出各字段的值再pack，固定的开销更大，少于这个数量的字段逐个写入更快。
+# 逐个写入/一次写入的耗时(ns)：4个 1120/1560，5个 1340/1470，6个 1400/1440，8个 2800/2000
+MIN_WRITE_RUN_LENGTH = 6
+
+# 基本类型的签名组成的tuple -> PrimitiveRun，所有类描述共用
+primitiveRuns = {}
+
+
+def primitiveRun(signatures):
+    run = primitiveRuns.get(signatures)
+    if run is None:
+        run = primitiveRuns[signatures] = PrimitiveRun(signatures)
+    return run
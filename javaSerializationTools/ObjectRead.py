@@ -1,69 +1,268 @@
 # -*- coding: utf-8 -*-
+import mmap
+import struct
+import sys
+import warnings
+from array import array
+
 from .Constants import Constants
-from .Exceptions import InvalidHeaderException, InvalidTypeCodeException
-from .JavaMetaClass import JavaProxyClass, JavaClassDesc, JavaEndBlock, JavaObject, JavaField, JavaString, JavaClass, \
-    JavaBLockData, JavaArray, JavaEnum, JavaException, JavaLongBLockData
-from .ObjectIO import ObjectIO
+from .ContentHandler import TreeBuilder, LazyTreeBuilder
+from .Exceptions import InvalidHeaderException, InvalidTypeCodeException, InvalidArraySizeException, \
+    NeedMoreDataException
+from .JavaMetaClass import JavaProxyClass, JavaClassDesc, JavaString, JavaFieldDesc
+from .ObjectEvents import EventCollector, EventStream
+from .ObjectIO import ObjectIO, BufferIO, FeedBufferIO, primitiveRun, MIN_RUN_LENGTH
+from .Tracer import TraceEvent
+
+# 基本类型字段对应的ObjectIO、BufferIO方法
+primitiveReaders = {'B': 'readByte', 'C': 'readChar', 'D': 'readDouble', 'F': 'readFloat', 'I': 'readInt',
+                    'J': 'readLong', 'S': 'readShort', 'Z': 'readBoolean'}
+# 流的类型 -> {基本类型: 读取函数}，所有ObjectRead共用
+streamReaders = {}
+
+# 可以嵌套的结构实现为_read*生成器，yield CONTENT表示读取一个嵌套的content，yield生成器表示执行一个子步骤，结果都通过send返回。
+# 同名的公开方法通过drive驱动对应的生成器，直接返回读到的值
+CONTENT = None
+# 生成器yield MORE表示流中的数据不完整，driveContent等收到更多数据后继续执行该生成器，见IncrementalObjectRead
+MORE = object()
+
+
+def unsupportedReader(signature):
+    """
+    未知的类型不读取数据，与readFieldValue一样只给出警告
+    """
+    def read(stream):
+        warnings.warn(f"unsupport signature {signature}")
+    return read
+
+
+class ClassCodec:
+    """
+    类描述中每个字段的读取方法，缓存在类描述上，所有ObjectRead中该类的对象都直接使用，配合ClassDescRegistry时在多个流之间共用。
+    fields被替换或者增删字段、流的类型不同时重新构造
+        decoders        [(字段, 读取函数)]，读取函数的参数为流，对象类型的字段为None
+        readRun         Java按先基本类型、后对象类型的顺序排列字段，开头连续MIN_RUN_LENGTH个以上的基本类型字段
+                        编译为一个PrimitiveRun一次读取，返回各字段的值，不足时为None
+        rest            readRun之后逐个读取的[(字段, 读取函数)]
+    """
+
+    def __init__(self, fields, streamType, readers):
+        self.fields = fields
+        self.fieldCount = len(fields)
+        self.streamType = streamType
+        decoders = []
+        count = 0
+        for field in fields:
+            signature = field.signature
+            decode = None
+            if type(signature) is str:
+                decode = readers.get(signature)
+                if decode is None and not (signature.startswith('L') or signature.startswith('[')):
+                    decode = unsupportedReader(signature)
+                elif decode is not None and count == len(decoders):
+                    count += 1
+            decoders.append((field, decode))
+        self.decoders = decoders
+        self.readRun = None
+        self.rest = decoders
+        if count >= MIN_RUN_LENGTH:
+            run = primitiveRun(tuple(field.signature for field, _ in decoders[:count]))
+            # FeedBufferIO需要先检查数据是否完整，通过readBytes读取
+            direct = issubclass(streamType, BufferIO) and not issubclass(streamType, FeedBufferIO)
+            self.readRun = run.read if direct else run.readStream
+            self.rest = decoders[count:]
+        # 开头连续的基本类型字段的数量
+        self.count = count
+        self.lazy = None
+
+    def lazyLayout(self):
+        """
+        :return: (lazy时开头跳过、交给handler延迟读取的基本类型字段, 它们的字节数, 之后逐个读取的[(字段, 读取函数)])
+        """
+        layout = self.lazy
+        if layout is None:
+            count = self.count
+            primitiveFields = [field for field, _ in self.decoders[:count]]
+            size = sum(Constants.primitiveSizes[field.signature] for field in primitiveFields)
+            layout = self.lazy = (primitiveFields, size, self.decoders[count:])
+        return layout
 
 
 class ObjectRead:
-    def __init__(self, stream):
-        self.bin = ObjectIO(stream)
+    def __init__(self, stream, tracer=None, handler=None, registry=None, lazy=False):
+        """
+        :param stream: 文件等可读的流，或者bytes、bytearray、memoryview、mmap，也可以直接传入ObjectIO、BufferIO
+        :param handler: ContentHandler，决定读到的content构造成什么，默认使用TreeBuilder构造对象树
+        :param registry: ClassDescRegistry，在多个流之间共享相同的类描述
+        :param lazy: 为True时对象构造成LazyJavaObject，每个类开头的基本类型字段直接跳过，第一次访问fields时才读取。
+                     只支持bytes等缓冲区输入和LazyTreeBuilder，读取字段前缓冲区需要保持有效
+        """
+        if isinstance(stream, (ObjectIO, BufferIO)):
+            self.bin = stream
+        elif isinstance(stream, (bytes, bytearray, memoryview, mmap.mmap)):
+            self.bin = BufferIO(stream)
+        else:
+            self.bin = ObjectIO(stream)
         self.handles = []
+        self.tracer = tracer
+        if lazy:
+            if not isinstance(self.bin, BufferIO):
+                raise ValueError("lazy fields need a bytes-like or mmap input")
+            if handler is None:
+                handler = LazyTreeBuilder()
+            elif not isinstance(handler, LazyTreeBuilder):
+                raise ValueError("lazy fields need a LazyTreeBuilder handler")
+        self.lazy = lazy
+        self.handler = handler if handler is not None else TreeBuilder()
+        self.registry = registry
+        # handle -> 对象的类描述，与handle表一起清空，用于读取8u20 gadget
+        self.objectClasses = {}
+        # 刚读完的对象或者对象引用的类描述，用于读取8u20 gadget
+        self.lastObjectClass = None
         self.readStreamHeader()
 
     def newHandles(self, __object__):
         self.handles.append(__object__)
         return len(self.handles) - 1 + Constants.baseWireHandle
 
+    def nextHandle(self):
+        """
+        下一次newHandles分配的handle，用于在构造对象之前把handle传给handler
+        """
+        return len(self.handles) + Constants.baseWireHandle
+
+    def trace(self, event, tc=None, handle=None, className=None, value=None):
+        """
+        调用前需判断self.tracer，未设置tracer时不构造事件
+        """
+        self.tracer.emit(TraceEvent(event, self.bin.tell(), tc, handle, className, value))
+
+    def typeCodeError(self, tc):
+        """
+        peekByte、readByte在流的末尾返回b''，这时不是无效的类型码而是数据不完整
+        """
+        if tc:
+            return InvalidTypeCodeException(tc)
+        return self.bin.eofError(f"stream ended at offset {self.bin.tell()}")
+
+    def waitFor(self, mark, read, *args, handleCount=None):
+        """
+        read(*args)抛出NeedMoreDataException后执行的子步骤：回退到mark和handle表的handleCount个handle，
+        yield MORE等到收到更多数据后重新执行read，返回read的返回值。只有FeedBufferIO会抛出NeedMoreDataException
+        """
+        stream = self.bin
+        while True:
+            stream.pos = mark
+            if handleCount is not None:
+                del self.handles[handleCount:]
+            yield MORE
+            try:
+                return read(*args)
+            except NeedMoreDataException:
+                pass
+
     def readStreamHeader(self):
-        magic = self.bin.readUnsignedShort()
-        version = self.bin.readUnsignedShort()
+        try:
+            magic = self.bin.readUnsignedShort()
+            version = self.bin.readUnsignedShort()
+        except struct.error:
+            raise EOFError("stream header is truncated") from None
         if magic != Constants.magic or version != Constants.version:
             raise InvalidHeaderException(magic, version)
 
     def readClassDescriptor(self):
+        return self.drive(self._readClassDescriptor())
+
+    def _readClassDescriptor(self):
         """
         读取非动态代理类的结构, 已经将读取到的classdesc添加到handle中
         :return:
         """
-        tc = self.bin.peekByte()
+        stream = self.bin
+        tc = stream.peekByte()
+        while not tc:
+            yield MORE
+            tc = stream.peekByte()
         if tc == Constants.TC_CLASSDESC:
-            javaClass = self.__readClassDesc__()
+            javaClass = yield self._readClassDesc()
         elif tc == Constants.TC_REFERENCE:
-            javaClass = self.readHandle()
+            mark = stream.pos
+            try:
+                javaClass = self.readHandle()
+            except NeedMoreDataException:
+                javaClass = yield from self.waitFor(mark, self.readHandle)
         else:
-            raise InvalidTypeCodeException(tc)
+            raise self.typeCodeError(tc)
         return javaClass
 
     def readProxyClassDescriptor(self):
+        return self.drive(self._readProxyClassDescriptor())
+
+    def _readProxyClassDescriptor(self):
         """
         读取动态代理类的结构
         # TODO: 此处可能有问题，需要进一步检查
         :return:
         """
+        mark = self.bin.pos
+        try:
+            interfaces = self.readProxyInterfaces()
+        except NeedMoreDataException:
+            interfaces = yield from self.waitFor(mark, self.readProxyInterfaces)
+        javaProxyClass = JavaProxyClass(interfaces)
+        handle = self.newHandles(javaProxyClass)
+        if self.tracer:
+            self.trace('proxyClassDesc', Constants.TC_PROXYCLASSDESC, handle, value=interfaces)
+        self.handler.classDesc(handle, javaProxyClass)
+        yield from self._readClassAnnotations(javaProxyClass)
+        javaProxyClass.superJavaClass = yield self._readSuperClassDesc()
+        self.handler.endClassDesc(javaProxyClass)
+        return javaProxyClass
+
+    def readProxyInterfaces(self):
+        """
+        读取动态代理类实现的接口名，还没有分配handle
+        """
         tc = self.bin.readByte()
         if tc != Constants.TC_PROXYCLASSDESC:
-            raise InvalidTypeCodeException(tc)
+            raise self.typeCodeError(tc)
         interfaceCount = self.bin.readInt()
-        print(f"Interface count {interfaceCount}")
         interfaces = []
         for i in range(interfaceCount):
             interfaceName = self.bin.readString()
             interfaces.append(interfaceName)
-            print("--------------")
-            print(interfaceName)
-        javaProxyClass = JavaProxyClass(interfaces)
-        handle = self.newHandles(javaProxyClass)
-        print(f"TC_PROXYCLASSDESC new handle from {hex(handle)}")
-        self.readClassAnnotations(javaProxyClass)
-        javaProxyClass.superJavaClass = self.readSuperClassDesc()
-        return javaProxyClass
+        return interfaces
 
     def __readClassDesc__(self):
+        return self.drive(self._readClassDesc())
+
+    def _readClassDesc(self):
+        mark = self.bin.pos
+        handleCount = len(self.handles)
+        try:
+            classDesc, handle, header = self.readClassDescHeader()
+        except NeedMoreDataException:
+            classDesc, handle, header = yield from self.waitFor(mark, self.readClassDescHeader,
+                                                                handleCount=handleCount)
+        self.handler.classDesc(handle, classDesc)
+        yield from self._readClassAnnotations(classDesc)
+        superjavaClass = yield self._readSuperClassDesc()
+        classDesc.superJavaClass = superjavaClass
+        self.handler.endClassDesc(classDesc)
+        if self.registry is not None:
+            # handler收到的仍是刚读到的类描述，handle表和之后的对象使用共享的类描述
+            classDesc = self.registry.intern(classDesc, header)
+            self.handles[handle - Constants.baseWireHandle] = classDesc
+        return classDesc
+
+    def readClassDescHeader(self):
+        """
+        读取类名、suid、flags和字段，类描述和字段类型的字符串分配handle
+        :return: (类描述, handle, 有registry时为ClassDescRegistry.header的返回值，否则为None)
+        """
         tc = self.bin.readByte()
         if tc != Constants.TC_CLASSDESC:
-            raise InvalidTypeCodeException(tc)
+            raise self.typeCodeError(tc)
         # read Class name from bin
         className = self.bin.readString()
         suid = self.bin.readLong()
@@ -75,16 +274,17 @@ class ObjectRead:
         hasWriteObjectData = flags & Constants.SC_WRITE_METHOD != 0
         hasBlockExternalData = flags & Constants.SC_BLOCK_DATA != 0
         if externalizable and sflag:
-            print("serializable and externalizable flags conflict")
+            warnings.warn(f"{className} serializable and externalizable flags conflict")
 
-        print(f"className {className}")
-        print(f"suid {suid}")
-        print(f"number of fields {numFields}")
         classDesc = JavaClassDesc(className, suid, flags)
         classDesc.hasWriteObjectData = hasWriteObjectData
         classDesc.hasBlockExternalData = hasBlockExternalData
         handle = self.newHandles(classDesc)
-        print(f"TC_CLASSDESC new handle from {hex(handle)} className {className}")
+        if self.tracer:
+            self.trace('classDesc', Constants.TC_CLASSDESC, handle, className, suid)
+        elif self.registry is not None:
+            header = self.readSharedFields(classDesc, numFields)
+            return classDesc, handle, header
         fields = []
         for i in range(numFields):
             tcode = self.bin.readByte()
@@ -93,71 +293,174 @@ class ObjectRead:
                 signature = self.readTypeString()
             else:
                 signature = tcode.decode()
-            fields.append({'name': fname, 'signature': signature})
-            print(f"name {fname} signature {signature}")
+            fields.append(JavaFieldDesc(fname, signature))
+            if self.tracer:
+                self.trace('field', className=className, value=(fname, str(signature)))
             classDesc.fields = fields
-        self.readClassAnnotations(classDesc)
-        superjavaClass = self.readSuperClassDesc()
-        classDesc.superJavaClass = superjavaClass
-        return classDesc
+        header = None
+        if self.registry is not None:
+            header = self.registry.header(classDesc)
+        return classDesc, handle, header
+
+    def readSharedFields(self, classDesc, numFields):
+        """
+        有registry时读取字段：先只读出字段名和类型的字符串，registry中有内容相同的类描述时共用它的字段列表，
+        不再构造JavaFieldDesc和类型的JavaString。类型字符串的handle先用str占位，同一个字段块中的引用也会指向它，
+        确定字段列表后再换成JavaString
+        :return: ClassDescRegistry.header的返回值
+        """
+        stream = self.bin
+        handles = self.handles
+        names = []
+        signatures = []
+        # 每个字段的类型在handle表中的位置，基本类型为None
+        sources = []
+        # (新的类型字符串在handle表中的位置, 字段序号)
+        inline = []
+        for i in range(numFields):
+            tcode = stream.readByte()
+            names.append(stream.readString())
+            source = None
+            if tcode == b'L' or tcode == b'[':
+                tc = stream.readByte()
+                if tc == Constants.TC_REFERENCE:
+                    source = stream.readInt() - Constants.baseWireHandle
+                    signature = str(handles[source])
+                elif tc == Constants.TC_STRING or tc == Constants.TC_LONGSTRING:
+                    signature = stream.readString() if tc == Constants.TC_STRING else stream.readLongString()
+                    source = len(handles)
+                    inline.append((source, i))
+                    handles.append(signature)
+                elif tc == Constants.TC_NULL:
+                    signature = 'null'
+                else:
+                    raise self.typeCodeError(tc)
+            else:
+                signature = tcode.decode()
+            signatures.append(signature)
+            sources.append(source)
+        header = (classDesc.name, classDesc.suid, classDesc.flags, tuple(zip(names, signatures)))
+        fields = self.registry.sharedFields(header)
+        if fields is None:
+            for source, _ in inline:
+                handles[source] = JavaString(handles[source])
+            fields = [JavaFieldDesc(name, signature if source is None else handles[source])
+                      for name, signature, source in zip(names, signatures, sources)]
+            self.registry.addFields(header, fields)
+        else:
+            for source, i in inline:
+                signature = fields[i].signature
+                handles[source] = signature if type(signature) is JavaString else JavaString(handles[source])
+        classDesc.fields = fields
+        return header
 
     def readClassAnnotations(self, classDesc):
+        return self.drive(self._readClassAnnotations(classDesc))
+
+    def _readClassAnnotations(self, classDesc):
         """
         读取类的附加信息
         """
-        print(f"ClassAnnotations start ")
+        inlineReaders = self.inlineReaders
+        stream = self.bin
         while True:
-            __obj__ = self.readContent()
+            tc = stream.peekByte()
+            while not tc:
+                yield MORE
+                tc = stream.peekByte()
+            reader = inlineReaders.get(tc)
+            __obj__ = reader(self) if reader is not None else (yield CONTENT)
             classDesc.classAnnotations.append(__obj__)
-            if isinstance(__obj__, JavaEndBlock):
+            if tc == Constants.TC_ENDBLOCKDATA:
                 break
 
-        print(f"ClassAnnotations end ")
-
     def readSuperClassDesc(self):
+        return self.drive(self._readSuperClassDesc())
+
+    def _readSuperClassDesc(self):
         """
         读取父类的的class信息，一直到父类为空，类似于链表。java不支持多继承
         :return:
         """
-        tc = self.bin.peekByte()
-        print(f"Super Class start")
-        if tc != Constants.TC_NULL:
-            superJavaClass = self.readClassDescriptor()
+        stream = self.bin
+        tc = stream.peekByte()
+        while not tc:
+            yield MORE
+            tc = stream.peekByte()
+        if tc == Constants.TC_REFERENCE:
+            mark = stream.pos
+            try:
+                superJavaClass = self.readHandle()
+            except NeedMoreDataException:
+                superJavaClass = yield from self.waitFor(mark, self.readHandle)
+        elif tc != Constants.TC_NULL:
+            superJavaClass = yield self._readClassDesc()
         else:
-            self.bin.readByte()
+            stream.readByte()
             superJavaClass = None
-        print(f"Super Class End")
         return superJavaClass
 
     def readObject(self):
-        tc = self.bin.readByte()
+        return self.drive(self._readObject())
+
+    def _readObject(self):
+        stream = self.bin
+        tc = stream.readByte()
         if tc != Constants.TC_OBJECT:
-            raise InvalidTypeCodeException(tc)
-        tc = self.bin.peekByte()
+            raise self.typeCodeError(tc)
+        tc = stream.peekByte()
+        while not tc:
+            yield MORE
+            tc = stream.peekByte()
         javaClass = None
         if tc == Constants.TC_CLASSDESC:
-            javaClass = self.readClassDescriptor()
+            javaClass = yield self._readClassDesc()
         elif tc == Constants.TC_NULL:
+            self.lastObjectClass = None
             return self.readNull()
         elif tc == Constants.TC_REFERENCE:
-            javaClass = self.readHandle()
+            mark = stream.pos
+            try:
+                javaClass = self.readHandle()
+            except NeedMoreDataException:
+                javaClass = yield from self.waitFor(mark, self.readHandle)
         elif tc == Constants.TC_PROXYCLASSDESC:
-            javaClass = self.readProxyClassDescriptor()
+            javaClass = yield self._readProxyClassDescriptor()
         else:
-            raise InvalidTypeCodeException(tc)
+            raise self.typeCodeError(tc)
 
-        javaObject = JavaObject(javaClass)
-        handle = self.newHandles(javaObject)
-        print(f"readObject new handle from {hex(handle)}")
-        self.readClassData(javaObject)
+        handle = self.nextHandle()
+        javaObject = self.handler.startObject(handle, javaClass)
+        self.handles.append(javaObject)
+        self.objectClasses[handle] = javaClass
+        if self.tracer:
+            self.trace('object', Constants.TC_OBJECT, handle, javaClass.name)
+        yield from self._readClassData(javaObject, javaClass)
+        self.handler.endObject(javaObject)
+        self.lastObjectClass = javaClass
         return javaObject
 
-    def readClassData(self, javaObject):
+    def readClassData(self, javaObject, javaClass=None):
+        """
+        :param javaClass: 对象的类描述，为None时使用javaObject.javaClass
+        """
+        if javaClass is None:
+            javaClass = javaObject.javaClass
+        return self.drive(self._readClassData(javaObject, javaClass))
+
+    def _readClassData(self, javaObject, javaClass):
         """
         读取对象的值，先读取父类的值，再读取子类的值
         :return:
         """
-        superClass = javaObject.javaClass
+        inlineReaders = self.inlineReaders
+        stream = self.bin
+        peekByte = stream.peekByte
+        streamType = type(stream)
+        lazy = self.lazy
+        handler = self.handler
+        handlerField = handler.field
+        superClass = javaClass
         superClassList = []
         while superClass:
             superClassList.append(superClass)
@@ -165,16 +468,65 @@ class ObjectRead:
 
         while superClassList:
             classDesc = superClassList.pop()
-            fields = classDesc.fields
-            currentField = []
-            for field in fields:
-                signature = field['signature']
-                value = self.readFieldValue(signature)
-                javaField = JavaField(field['name'], signature, value)
-                currentField.append(javaField)
-            javaObject.fields.append(currentField)
+            handler.classData(javaObject, classDesc)
+            codec = classDesc.readCodec
+            if codec is None or codec.streamType is not streamType or codec.fields is not classDesc.fields or \
+                    codec.fieldCount != len(classDesc.fields):
+                codec = self.classCodec(classDesc)
+            if lazy:
+                decoders = self.skipPrimitiveFields(javaObject, classDesc, codec)
+            else:
+                readRun = codec.readRun
+                if readRun is not None:
+                    # 开头连续的基本类型字段一次读取
+                    try:
+                        values = readRun(stream)
+                    except NeedMoreDataException:
+                        values = yield from self.waitFor(stream.pos, readRun, stream)
+                    for (field, _), value in zip(codec.decoders, values):
+                        handlerField(javaObject, field, value)
+                decoders = codec.rest
+            for field, decode in decoders:
+                if decode is not None:
+                    try:
+                        value = decode(stream)
+                    except NeedMoreDataException:
+                        value = yield from self.waitFor(stream.pos, decode, stream)
+                else:
+                    # 引用、字符串、null等最常见的字段值直接读取，不经过readContent的栈
+                    reader = inlineReaders.get(peekByte())
+                    value = reader(self) if reader is not None else (yield CONTENT)
+                handlerField(javaObject, field, value)
             if classDesc.hasWriteObjectData:
-                self.readObjectAnnotations(javaObject)
+                yield from self._readObjectAnnotations(javaObject, javaClass)
+
+    def classCodec(self, classDesc):
+        """
+        构造类描述的ClassCodec，缓存在类描述的readCodec上
+        """
+        streamType = type(self.bin)
+        readers = streamReaders.get(streamType)
+        if readers is None:
+            readers = streamReaders[streamType] = {signature: getattr(streamType, name)
+                                                   for signature, name in primitiveReaders.items()}
+        codec = ClassCodec(classDesc.fields, streamType, readers)
+        classDesc.readCodec = codec
+        return codec
+
+    def skipPrimitiveFields(self, javaObject, classDesc, codec):
+        """
+        跳过类开头连续的基本类型字段，交给handler延迟读取
+        :return: 剩余需要读取的字段的[(字段, 读取函数)]
+        """
+        primitiveFields, size, decoders = codec.lazyLayout()
+        if primitiveFields:
+            stream = self.bin
+            offset = stream.pos
+            if offset + size > len(stream.buffer):
+                raise EOFError(f"{classDesc.name} field data is truncated")
+            stream.pos = offset + size
+            self.handler.lazyFields(javaObject, primitiveFields, stream.buffer, offset)
+        return decoders
 
     def readHandle(self):
         """
@@ -183,119 +535,268 @@ class ObjectRead:
         """
         self.bin.readByte()
         handle = self.bin.readInt()
-        print(hex(handle))
-        handle = handle - Constants.baseWireHandle
-        return self.handles[handle]
+        if self.tracer:
+            self.trace('reference', Constants.TC_REFERENCE, handle)
+        value = self.handles[handle - Constants.baseWireHandle]
+        self.lastObjectClass = self.objectClasses.get(handle)
+        return self.handler.reference(handle, value)
 
     def readTypeString(self):
+        """
+        读取字段的类型，类型属于类描述，不经过handler
+        """
         tc = self.bin.peekByte()
         if tc == Constants.TC_NULL:
-            return self.readNull()
+            self.bin.readByte()
+            return 'null'
         elif tc == Constants.TC_REFERENCE:
-            return self.readHandle()
+            self.bin.readByte()
+            handle = self.bin.readInt()
+            if self.tracer:
+                self.trace('reference', Constants.TC_REFERENCE, handle)
+            return self.handles[handle - Constants.baseWireHandle]
         elif tc == Constants.TC_STRING:
-            return self.readString()
+            return self.readJavaString()
         elif tc == Constants.TC_LONGSTRING:
-            return self.readString()
+            return self.readJavaString()
         else:
-            raise InvalidTypeCodeException(tc)
+            raise self.typeCodeError(tc)
 
-    def readString(self):
-        self.bin.readByte()
-        string = self.bin.readString()
+    def readJavaString(self):
+        tc = self.bin.readByte()
+        if tc == Constants.TC_LONGSTRING:
+            string = self.bin.readLongString()
+        else:
+            string = self.bin.readString()
         javaString = JavaString(string)
         handle = self.newHandles(javaString)
-        print(f"readString new handle from {hex(handle)} value {string}")
+        if self.tracer:
+            self.trace('string', tc, handle, value=string)
         return javaString
 
+    def readString(self):
+        javaString = self.readJavaString()
+        return self.handler.string(self.nextHandle() - 1, javaString)
+
     def readContent(self):
-        tc = self.bin.peekByte()
-        if tc == Constants.TC_NULL:
-            return self.readNull()
-        elif tc == Constants.TC_REFERENCE:
-            return self.readHandle()
-        elif tc == Constants.TC_CLASS:
-            self.bin.readByte()
-            clazz = self.readClassDescriptor()
-            javaClass = JavaClass(clazz)
-            handle = self.newHandles(javaClass)
-            print(f"TC_CLASS new handle from {hex(handle)}")
-            return javaClass
-        elif tc == Constants.TC_CLASSDESC:
-            return self.readClassDescriptor()
-        elif tc == Constants.TC_PROXYCLASSDESC:
-            return self.readProxyClassDescriptor()
-        elif tc == Constants.TC_STRING or tc == Constants.TC_LONGSTRING:
-            return self.readTypeString()
-        elif tc == Constants.TC_ENUM:
-            return self.readEnum()
-        elif tc == Constants.TC_OBJECT:
-            return self.readObject()
-        elif tc == Constants.TC_EXCEPTION:
-            return self.readException()
-        elif tc == Constants.TC_RESET:
-            self.readReset()
-        elif tc == Constants.TC_ARRAY:
-            return self.readArray()
-        elif tc == Constants.TC_BLOCKDATA:
-            return self.readBlockData()
-        elif tc == Constants.TC_BLOCKDATALONG:
-            return self.readLongBLockData()
-        elif tc == Constants.TC_ENDBLOCKDATA:
-            return self.readEndBlock()
-        else:
-            raise InvalidTypeCodeException(tc)
+        """
+        读取一个content，返回handler构造的值，默认为JavaMetaClass中的对象
+        """
+        return self.drive()
+
+    def drive(self, step=None):
+        """
+        用driveContent执行完一个_read*生成器，返回它的返回值，step为None时读取一个content
+        """
+        try:
+            next(self.driveContent(False, step))
+        except StopIteration as e:
+            return e.value
+        except struct.error as e:
+            # 定长的值读到流的末尾时剩余的字节不够unpack
+            raise EOFError(f"stream ended at offset {self.bin.tell()}") from e
+
+    def events(self):
+        """
+        以ObjectEvent的形式逐个返回流中剩余的content，见ObjectEvents.EventStream。之后不能再调用readContent
+        """
+        collector = EventCollector()
+        self.handler = collector
+        self.lazy = False
+        # 所有元素都经过driveContent，每执行一步就取出事件，事件不会在一个步骤中大量积累
+        self.inlineReaders = {}
+        return EventStream(self, collector)
+
+    def driveContent(self, pause, step=None, resumable=False):
+        """
+        读取一个content的生成器，content的值为生成器的返回值。
+        嵌套的结构不再递归调用，而是把生成器放入显式的栈中依次驱动，嵌套深度不受python递归深度的限制。
+        pause为True时每执行一步yield一次，step不为None时执行这个_read*生成器，而不是读取一个content。
+        resumable为True时流中的数据不完整时yield MORE，下一次next时从中断的位置继续读取，否则抛出EOFError
+        """
+        stack = []
+        stream = self.bin
+        request = CONTENT if step is None else step
+        value = None
+        while True:
+            if request is CONTENT:
+                tc = stream.peekByte()
+                reader = self.leafReaders.get(tc)
+                if reader is not None:
+                    mark = stream.pos
+                    try:
+                        value = reader(self)
+                    except NeedMoreDataException:
+                        stream.pos = mark
+                        yield self.needMore(resumable)
+                        continue
+                    if not stack:
+                        return value
+                elif tc:
+                    reader = self.nestedReaders.get(tc)
+                    if reader is None:
+                        raise self.typeCodeError(tc)
+                    stack.append(reader(self))
+                    value = None
+                else:
+                    yield self.needMore(resumable)
+                    continue
+            elif request is MORE:
+                # 栈顶的生成器在等待更多数据，之后继续执行它
+                yield self.needMore(resumable)
+                value = None
+            else:
+                stack.append(request)
+                value = None
+            while True:
+                try:
+                    request = stack[-1].send(value)
+                    break
+                except StopIteration as e:
+                    stack.pop()
+                    value = e.value
+                    if not stack:
+                        return value
+            if pause:
+                yield
+
+    def needMore(self, resumable):
+        """
+        流中的数据不完整时driveContent yield的值
+        """
+        if not resumable:
+            raise EOFError(f"stream ended at offset {self.bin.tell()}")
+        return MORE
+
+    def readClass(self):
+        return self.drive(self._readClass())
+
+    def _readClass(self):
+        self.bin.readByte()
+        clazz = yield self._readClassDescriptor()
+        handle = self.nextHandle()
+        javaClass = self.handler.javaClass(handle, clazz)
+        self.handles.append(javaClass)
+        if self.tracer:
+            self.trace('class', Constants.TC_CLASS, handle, clazz.name)
+        return javaClass
 
     def readBlockData(self):
         self.bin.readByte()
         length = int.from_bytes(self.bin.readByte(), 'big')
         data = self.bin.readBytes(length)
-        print(data)
-        blockData = JavaBLockData(length, data)
-        return blockData
+        if self.tracer:
+            self.trace('blockData', Constants.TC_BLOCKDATA, value=length)
+        return self.handler.blockData(Constants.TC_BLOCKDATA, data)
 
     def readEndBlock(self):
         self.bin.readByte()
-        endBD = JavaEndBlock()
-        return endBD
+        return self.handler.endBlock()
 
-    def readObjectAnnotations(self, javaObject):
-        print("reading readObjectAnnotations")
+    def readObjectAnnotations(self, javaObject, javaClass=None):
+        """
+        :param javaClass: 同readClassData
+        """
+        if javaClass is None:
+            javaClass = javaObject.javaClass
+        return self.drive(self._readObjectAnnotations(javaObject, javaClass))
+
+    def _readObjectAnnotations(self, javaObject, javaClass):
+        inlineReaders = self.inlineReaders
+        handler = self.handler
+        stream = self.bin
         while True:
-            __obj__ = self.readContent()
-            javaObject.objectAnnotation.append(__obj__)
-            if isinstance(__obj__, JavaEndBlock):
+            tc = stream.peekByte()
+            while not tc:
+                yield MORE
+                tc = stream.peekByte()
+            reader = inlineReaders.get(tc)
+            __obj__ = reader(self) if reader is not None else (yield CONTENT)
+            handler.annotation(javaObject, __obj__)
+            if tc == Constants.TC_ENDBLOCKDATA:
                 break
-            # 为了读取8u20 gadget
-            if isinstance(__obj__, JavaObject):
-                if __obj__.javaClass.name =='sun.reflect.annotation.AnnotationInvocationHandler' and javaObject.javaClass.name == 'java.beans.beancontext.BeanContextSupport':
+            # 为了读取8u20 gadget。刚读完的是对象或者对象引用时，lastObjectClass就是__obj__的类描述，与handler构造的值无关
+            if tc == Constants.TC_OBJECT or tc == Constants.TC_REFERENCE:
+                annotationClass = self.lastObjectClass
+                if annotationClass is not None and annotationClass.name == 'sun.reflect.annotation.AnnotationInvocationHandler' and javaClass.name == 'java.beans.beancontext.BeanContextSupport':
                     break
 
     def readNull(self):
         self.bin.readByte()
-        return 'null'
+        return self.handler.null()
 
     def readArray(self):
-        self.bin.readByte()
-        tc = self.bin.peekByte()
+        return self.drive(self._readArray())
+
+    def _readArray(self):
+        stream = self.bin
+        stream.readByte()
+        tc = stream.peekByte()
+        while not tc:
+            yield MORE
+            tc = stream.peekByte()
         javaClass = None
         if tc == Constants.TC_CLASSDESC:
-            javaClass = self.readClassDescriptor()
+            javaClass = yield self._readClassDescriptor()
         elif tc == Constants.TC_REFERENCE:
-            javaClass = self.readHandle()
+            mark = stream.pos
+            try:
+                javaClass = self.readHandle()
+            except NeedMoreDataException:
+                javaClass = yield from self.waitFor(mark, self.readHandle)
         else:
-            print("unsupport type")
-        size = self.bin.readInt()
-        print(javaClass)
-        print(f"array size {size}")
-        javaarray = JavaArray(size, javaClass)
-        handle = self.newHandles(javaarray)
-        print(f"TC_ARRAY new handle from {hex(handle)}")
-        for i in range(size):
-            signature = javaClass.name[1:]
-            javaarray.add(self.readFieldValue(signature))
+            raise self.typeCodeError(tc)
+        try:
+            size = stream.readInt()
+        except NeedMoreDataException:
+            size = yield from self.waitFor(stream.pos, stream.readInt)
+        if size < 0:
+            raise InvalidArraySizeException(size)
+        handler = self.handler
+        handle = self.nextHandle()
+        javaarray = handler.startArray(handle, javaClass, size)
+        self.handles.append(javaarray)
+        if self.tracer:
+            self.trace('array', Constants.TC_ARRAY, handle, javaClass.name, size)
+        signature = javaClass.name[1:]
+        if signature in Constants.primitiveSizes:
+            try:
+                values = self.readPrimitiveArray(signature, size)
+            except NeedMoreDataException:
+                values = yield from self.waitFor(stream.pos, self.readPrimitiveArray, signature, size)
+            handler.arrayValues(javaarray, values)
+        else:
+            inlineReaders = self.inlineReaders
+            element = handler.element
+            for i in range(size):
+                reader = inlineReaders.get(stream.peekByte())
+                element(javaarray, reader(self) if reader is not None else (yield CONTENT))
+        handler.endArray(javaarray)
         return javaarray
 
+    def readPrimitiveArray(self, signature, size):
+        """
+        基本类型数组一次读出，不再逐个元素读取
+        [B、[Z为bytes，[C为str，其余为转换为本机字节序的array.array。剩余的数据不够size个元素时抛出EOFError
+        """
+        length = size * Constants.primitiveSizes[signature]
+        stream = self.bin
+        if isinstance(stream, BufferIO) and length > len(stream.buffer) - stream.pos:
+            raise stream.eofError(f"[{signature} array of {size} elements needs {length} bytes, "
+                           f"{len(stream.buffer) - stream.pos} left at offset {stream.pos}")
+        data = stream.readBytes(length)
+        if len(data) != length:
+            raise EOFError(f"[{signature} array of {size} elements needs {length} bytes, got {len(data)}")
+        if signature == 'B' or signature == 'Z':
+            return data
+        if signature == 'C':
+            return str(data, 'utf-16-be', 'surrogatepass')
+        values = array(Constants.arrayTypecodes[signature])
+        values.frombytes(data)
+        if sys.byteorder == 'little':
+            values.byteswap()
+        return values
+
     def readFieldValue(self, signature: str):
         """
         读取字段的值，根据字段的类型
@@ -319,34 +820,78 @@ class ObjectRead:
         elif signature == "Z":
             return self.bin.readBoolean()
         else:
-            print(f"unsupport signature  {signature}")
+            warnings.warn(f"unsupport signature {signature}")
 
     def readEnum(self):
+        return self.drive(self._readEnum())
+
+    def _readEnum(self):
         self.bin.readByte()
-        javaClass = self.readClassDescriptor()
-        javaEnum = JavaEnum(javaClass)
-        handle = self.newHandles(javaEnum)
-        print(f"read enum new handle {handle}")
-        enumConstantName = self.readContent()
-        javaEnum.enumConstantName = enumConstantName
+        javaClass = yield self._readClassDescriptor()
+        handle = self.nextHandle()
+        javaEnum = self.handler.startEnum(handle, javaClass)
+        self.handles.append(javaEnum)
+        if self.tracer:
+            self.trace('enum', Constants.TC_ENUM, handle, javaClass.name)
+        enumConstantName = yield CONTENT
+        self.handler.endEnum(javaEnum, enumConstantName)
         return javaEnum
 
     def readReset(self):
         self.bin.readByte()
+        if self.tracer:
+            self.trace('reset', Constants.TC_RESET)
+        self.resetHandles()
+
+    def resetHandles(self):
+        """
+        TC_RESET和TC_EXCEPTION清空handle表，handler同步清空
+        """
         self.handles = []
+        self.objectClasses = {}
+        self.handler.reset()
 
     def readException(self):
+        return self.drive(self._readException())
+
+    def _readException(self):
         self.bin.readByte()
-        self.handles = []
-        exception = self.readObject()
-        self.handles = []
-        javaException = JavaException(exception)
-        return javaException
+        self.resetHandles()
+        while not self.bin.peekByte():
+            yield MORE
+        exception = yield self._readObject()
+        self.resetHandles()
+        return self.handler.exception(exception)
 
     def readLongBLockData(self):
         self.bin.readByte()
         length = int.from_bytes(self.bin.readBytes(4), 'big')
         data = self.bin.readBytes(length)
-        print(data)
-        blockData = JavaLongBLockData(length, data)
-        return blockData
+        if self.tracer:
+            self.trace('blockData', Constants.TC_BLOCKDATALONG, value=length)
+        return self.handler.blockData(Constants.TC_BLOCKDATALONG, data)
+
+    # 不会嵌套其他content的类型直接读取，不需要入栈
+    leafReaders = {
+        Constants.TC_NULL: readNull,
+        Constants.TC_REFERENCE: readHandle,
+        Constants.TC_STRING: readString,
+        Constants.TC_LONGSTRING: readString,
+        Constants.TC_RESET: readReset,
+        Constants.TC_BLOCKDATA: readBlockData,
+        Constants.TC_BLOCKDATALONG: readLongBLockData,
+        Constants.TC_ENDBLOCKDATA: readEndBlock,
+    }
+
+    nestedReaders = {
+        Constants.TC_CLASS: _readClass,
+        Constants.TC_CLASSDESC: _readClassDescriptor,
+        Constants.TC_PROXYCLASSDESC: _readProxyClassDescriptor,
+        Constants.TC_ENUM: _readEnum,
+        Constants.TC_OBJECT: _readObject,
+        Constants.TC_EXCEPTION: _readException,
+        Constants.TC_ARRAY: _readArray,
+    }
+
+    # 字段、数组元素和附加信息中直接读取的类型，events()中置为空，所有元素都经过driveContent
+    inlineReaders = leafReaders
@@ -0,0 +1,152 @@
+# -*- coding: utf-8 -*-
+from .Constants import Constants
+from .JavaMetaClass import JavaString, JavaArray, JavaField
+from .ObjectWrite import ObjectWrite
+
+
+class PrimitiveSlot:
+    """
+    编译模板时临时替换被标记的基本类型字段的值
+    """
+    __slots__ = ('name', 'value')
+
+    def __init__(self, name, value):
+        self.name = name
+        self.value = value
+
+
+class TemplateWrite(ObjectWrite):
+    """
+    在ObjectWrite的基础上记录被标记的对象在输出中的位置
+    """
+    # 基本类型字段都经过writeFieldValue，以便记录PrimitiveSlot的位置
+    fieldWriters = {}
+
+    def __init__(self, stream, slotNames, valueEquality=True):
+        super().__init__(stream, valueEquality)
+        # id(对象) -> 名字
+        self.slotNames = slotNames
+        # (开始位置, 结束位置, 名字)，按写入顺序排列
+        self.positions = []
+
+    def writeTypeString(self, javaString):
+        name = self.slotNames.get(id(javaString))
+        if name is None or javaString in self.handles:
+            return super().writeTypeString(javaString)
+        start = self.stream.tell()
+        self.writeUtf(javaString.string)
+        self.handles.assign(javaString)
+        self.positions.append((start, self.stream.tell(), name))
+
+    def writeFieldValue(self, signature, value):
+        if type(value) is not PrimitiveSlot:
+            return super().writeFieldValue(signature, value)
+        start = self.stream.tell()
+        super().writeFieldValue(signature, value.value)
+        self.positions.append((start, self.stream.tell(), value.name))
+
+    def _writeJavaArray(self, content):
+        name = self.slotNames.get(id(content))
+        if name is None or content in self.handles:
+            return super()._writeJavaArray(content)
+        return self._writeByteArraySlot(content, name)
+
+    def _writeByteArraySlot(self, content, name):
+        self.stream.writeBytes(Constants.TC_ARRAY)
+        yield from self._writeClassDesc(content.signature)
+        start = self.stream.tell()
+        self.stream.writeInt(content.length)
+        self.handles.assign(content)
+        if isinstance(content.list, list):
+            for i in content.list:
+                self.writeFieldValue('B', i)
+        else:
+            self.writePrimitiveArray('B', content.list)
+        self.positions.append((start, self.stream.tell(), name))
+
+
+class ObjectTemplate:
+    """
+    把对象只序列化一次，记录被标记的字符串、基本类型字段和byte数组在输出中的位置，
+    之后生成新的数据时只替换这些位置的内容并修正长度，不再遍历对象：
+        template = ObjectTemplate(dnslog, {'host': hostField})
+        data = template.render(host='xxx.dnslog.cn')
+    与修改对象后重新调用ObjectWrite.writeContent得到的数据相同。
+    valueEquality为True时，与被标记的字符串内容相同的其他字符串会写成对它的引用，替换后同样改变
+    """
+
+    def __init__(self, content, slots, valueEquality=True):
+        """
+        :param slots: {名字: 对象}，对象可以是JavaString、[B的JavaArray、基本类型的JavaField，
+                      值为JavaString或JavaArray的JavaField相当于标记它的值
+        """
+        self.signatures = {}
+        slotNames = {}
+        saved = []
+        try:
+            for name, target in slots.items():
+                if isinstance(target, JavaField):
+                    if isinstance(target.value, (JavaString, JavaArray)):
+                        target = target.value
+                    else:
+                        self.signatures[name] = target.signature
+                        saved.append((target, target.value))
+                        target.value = PrimitiveSlot(name, target.value)
+                        continue
+                if isinstance(target, JavaString):
+                    self.signatures[name] = 'Ljava/lang/String;'
+                elif isinstance(target, JavaArray) and target.signature.name == '[B':
+                    self.signatures[name] = '[B'
+                else:
+                    raise TypeError(f"slot {name} must be a JavaString, a byte array or a primitive field")
+                slotNames[id(target)] = name
+            writer = TemplateWrite(None, slotNames, valueEquality)
+            writer.writeContent(content)
+        finally:
+            for field, value in saved:
+                field.value = value
+
+        data = writer.toBytes()
+        # parts中依次是不变的数据和slot的名字
+        self.parts = []
+        self.defaults = {}
+        last = 0
+        for start, end, name in writer.positions:
+            self.parts.append(data[last:start])
+            self.parts.append(name)
+            self.defaults[name] = data[start:end]
+            last = end
+        self.parts.append(data[last:])
+        missing = set(slots) - set(self.defaults)
+        if missing:
+            raise ValueError(f"slots {sorted(missing)} were not written, "
+                             f"they may be references to equal strings written before them")
+
+    def encode(self, name, value):
+        """
+        按照ObjectWrite的写法编码slot的新值
+        """
+        writer = ObjectWrite()
+        # 去掉ObjectWrite写入的流头部
+        writer.stream.buffer.clear()
+        signature = self.signatures[name]
+        if signature == 'Ljava/lang/String;':
+            writer.writeUtf(str(value))
+        elif signature == '[B':
+            writer.stream.writeInt(len(value))
+            writer.writePrimitiveArray('B', bytes(value))
+        else:
+            writer.writeFieldValue(signature, value)
+        return writer.toBytes()
+
+    def render(self, **values):
+        """
+        :param values: slot的新值，字符串为str，byte数组为bytes，未给出的slot使用编译时的值
+        """
+        unknown = set(values) - set(self.defaults)
+        if unknown:
+            raise KeyError(f"unknown slots {sorted(unknown)}")
+        defaults = self.defaults
+        return b''.join(part if type(part) is bytes else
+                        (self.encode(part, values[part]) if part in values else defaults[part])
+                        for part in self.parts)
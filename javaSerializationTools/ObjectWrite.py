@@ -1,57 +1,177 @@
 # -*- coding: utf-8 -*-
-import copy
+import struct
+import sys
+import warnings
+from array import array
+from types import GeneratorType
 
 from .Constants import Constants
+from .HandleTable import HandleTable
 from .JavaMetaClass import JavaObject, JavaEndBlock, JavaString, JavaField, JavaBLockData, JavaArray, JavaException, \
-    JavaClassDesc, JavaProxyClass, JavaEnum, JavaClass
-from .ObjectIO import ObjectIO
+    JavaClassDesc, JavaProxyClass, JavaEnum, JavaClass, LazyJavaObject
+from .ObjectIO import BufferedIO, MIN_WRITE_RUN_LENGTH, MAX_UTF_LENGTH, encodeUtf
+from .Tracer import TraceEvent
+
+# content的类型 -> 写入方法的名字，writeStep按类型直接查表，子类等其他类型再依次判断isinstance
+stepWriters = {JavaObject: '_writeObject', LazyJavaObject: '_writeObject', JavaEndBlock: 'writeEndBlock',
+               JavaString: 'writeTypeString', JavaField: '_writeJavaField', JavaBLockData: 'writeJavaBlockData',
+               JavaArray: '_writeJavaArray', JavaException: '_writeJavaException', JavaClassDesc: '_writeJavaClassDesc',
+               JavaProxyClass: '_writeJavaProxyClass', JavaEnum: '_writeEnum', JavaClass: '_writeClass'}
+
+# 基本类型字段 -> BufferedIO的写入方法，与writeFieldValue一致
+fieldWriters = {'B': BufferedIO.writeBytes, 'C': BufferedIO.writeChar, 'D': BufferedIO.writeDouble,
+                'F': BufferedIO.writeFloat, 'I': BufferedIO.writeInt, 'J': BufferedIO.writeLong,
+                'S': BufferedIO.writeShort, 'Z': BufferedIO.writeBoolean}
+
+# 字符串的类型和长度
+STRING_HEADER = struct.Struct('>cH')
+LONG_STRING_HEADER = struct.Struct('>cq')
+
+# ObjectWrite的子类 -> {content的类型: 写入函数}，子类覆盖的方法同样生效
+classStepWriters = {}
 
 
 class ObjectWrite:
-    def __init__(self, stream):
-        self.handles = []
-        self.stream = ObjectIO(stream)
+    # 基本类型字段的写入函数，为空时都经过writeFieldValue
+    fieldWriters = fieldWriters
+
+    def __init__(self, stream=None, valueEquality=True, tracer=None, autoFlush=True, flushSize=65536, compact=False):
+        """
+        输出先写入内存中的缓冲区，再整块写入stream
+        :param stream: 可写的流，为None时只写入内存，用toBytes、getbuffer取出
+        :param autoFlush: 为True时流头部、每个content和reset写完后立即写入stream；
+                          为False时缓冲区超过flushSize才在content之间写入，写完后需要调用flush
+        :param compact: 为True时内容相同的字符串、类描述、枚举常量和Class对象只写入一次，之后写成引用，见HandleTable
+        """
+        self.handles = HandleTable(valueEquality, compact)
+        self.stream = BufferedIO(stream)
+        self.tracer = tracer
+        self.autoFlush = autoFlush
+        self.flushSize = flushSize
+        self.stepWriters = classStepWriters.get(type(self))
+        if self.stepWriters is None:
+            self.stepWriters = classStepWriters[type(self)] = {
+                contentType: getattr(type(self), name) for contentType, name in stepWriters.items()}
         self.writeStreamHeader()
+        self.endContent()
+
+    def endContent(self):
+        stream = self.stream
+        if self.autoFlush or len(stream.buffer) >= self.flushSize:
+            stream.flush()
+
+    def flush(self):
+        """
+        把缓冲区中的数据写入stream
+        """
+        self.stream.flush()
+
+    def toBytes(self):
+        """
+        :return: 缓冲区中还没有写入stream的数据，stream为None时就是全部输出
+        """
+        return bytes(self.stream.buffer)
+
+    def getbuffer(self):
+        """
+        :return: 缓冲区的memoryview，不复制数据，继续写入前需要release
+        """
+        return memoryview(self.stream.buffer)
+
+    def trace(self, event, tc=None, handle=None, className=None, value=None):
+        self.tracer.emit(TraceEvent(event, self.stream.tell(), tc, handle, className, value))
 
     def writeStreamHeader(self):
         self.stream.writeBytes(b'\xac\xed')
         self.stream.writeBytes(b'\x00\x05')
 
+    def reset(self):
+        """
+        handle表按对象本身查找，写入后又被修改的对象再次写入时只会写成引用。
+        写入TC_RESET并清空handle表，之后的对象都会重新完整写入
+        """
+        self.stream.writeBytes(Constants.TC_RESET)
+        self.handles.clear()
+        self.endContent()
+
     def writeContent(self, content):
+        """
+        写入一个content。可以嵌套的结构实现为_write*生成器，yield需要写入的content或者子步骤的生成器，
+        由drive用显式的栈依次驱动，不再递归调用，嵌套深度不受python递归深度的限制
+        """
+        step = self.writeStep(content)
+        if step is None:
+            self.endContent()
+        else:
+            self.drive(step)
+
+    def drive(self, step):
+        """
+        执行完一个_write*生成器，同名的公开方法都通过这里写入
+        :return: 生成器的返回值
+        """
+        stack = [step]
+        value = None
+        while stack:
+            try:
+                request = next(stack[-1])
+            except StopIteration as e:
+                stack.pop()
+                value = e.value
+                continue
+            if type(request) is GeneratorType:
+                stack.append(request)
+            else:
+                step = self.writeStep(request)
+                if step is not None:
+                    stack.append(step)
+        self.endContent()
+        return value
+
+    def writeStep(self, content):
+        """
+        写入不会嵌套的content，可以嵌套的content返回生成器，由drive驱动
+        """
+        writer = self.stepWriters.get(type(content))
+        if writer is not None:
+            return writer(self, content)
         if isinstance(content, JavaObject):
-            self.writeObject(content)
+            return self._writeObject(content)
         elif isinstance(content, JavaEndBlock):
             self.writeEndBlock(content)
         elif isinstance(content, JavaString):
             self.writeTypeString(content)
         elif isinstance(content, JavaField):
-            self.writeJavaField(content)
+            return self._writeJavaField(content)
         elif isinstance(content, JavaBLockData):
             self.writeJavaBlockData(content)
         elif isinstance(content, JavaArray):
-            self.writeJavaArray(content)
+            return self._writeJavaArray(content)
         elif isinstance(content, JavaException):
-            self.writeJavaException(content)
+            return self._writeJavaException(content)
         elif isinstance(content, JavaClassDesc):
-            self.writeJavaClassDesc(content)
+            return self._writeJavaClassDesc(content)
         elif isinstance(content, JavaProxyClass):
-            self.writeJavaProxyClass(content)
+            return self._writeJavaProxyClass(content)
         elif isinstance(content, JavaEnum):
-            self.writeEnum(content)
+            return self._writeEnum(content)
         elif isinstance(content, JavaClass):
-            self.writeClass(content)
+            return self._writeClass(content)
         elif content == 'null':
             self.stream.writeBytes(Constants.TC_NULL)
         else:
-            print(content)
+            warnings.warn(f"unsupport content {content!r}")
 
     def writeObject(self, javaObject):
-        if javaObject in self.handles:
-            self.writeHandle(javaObject)
-            return
+        return self.drive(self._writeObject(javaObject))
+
+    def _writeObject(self, javaObject):
+        handle = self.handles.lookup(javaObject)
+        if handle is not None:
+            return self.writeHandle(javaObject, handle)
         self.stream.writeBytes(Constants.TC_OBJECT)
-        self.writeClassDesc(javaObject.javaClass)
-        self.handles.append(copy.deepcopy(javaObject))
+        yield from self._writeClassDesc(javaObject.javaClass)
+        self.handles.assign(javaObject)
 
         superClassList = []
         superClass = javaObject.javaClass
@@ -62,26 +182,69 @@ class ObjectWrite:
             else:
                 break
         lastWriteObjectAnnotations = 0
+        fieldWriters = self.fieldWriters
+        stream = self.stream
         for field in javaObject.fields:
             classDesc = superClassList.pop()
-            for i in field:
-                self.writeContent(i)
+            fields = self.writePrimitivePrefix(classDesc, field) if len(field) >= MIN_WRITE_RUN_LENGTH else field
+            for i in fields:
+                signature = i.signature
+                # 基本类型直接查表写入
+                encode = fieldWriters.get(signature) if type(signature) is str else None
+                if encode is not None:
+                    encode(stream, i.value)
+                elif signature.startswith('L') or signature.startswith('['):
+                    value = i.value
+                    # 字符串和null是最常见的字段值，直接写入，不经过writeContent的栈
+                    if isinstance(value, JavaString):
+                        self.writeTypeString(value)
+                    elif type(value) is str and value == 'null':
+                        self.stream.writeBytes(Constants.TC_NULL)
+                    else:
+                        yield value
+                else:
+                    self.writeFieldValue(signature, i.value)
             if classDesc.hasWriteObjectData:
-                lastWriteObjectAnnotations = self.writeObjectAnnotations(javaObject.objectAnnotation,
-                                                                         lastWriteObjectAnnotations)
+                lastWriteObjectAnnotations = yield from self._writeObjectAnnotations(javaObject.objectAnnotation,
+                                                                                    lastWriteObjectAnnotations)
+
+    def writePrimitivePrefix(self, classDesc, field):
+        """
+        开头连续的基本类型字段用类描述上缓存的PrimitiveRun一次写入，值的类型不对时逐个写入，两种方式的结果相同
+        :return: 剩余需要写入的字段
+        """
+        if not self.fieldWriters or type(classDesc) is not JavaClassDesc:
+            return field
+        run = classDesc.primitivePrefix()
+        if run is None or len(field) != len(classDesc.fields):
+            return field
+        count = len(run.signatures)
+        try:
+            data = run.pack([i.value for i in field[:count]])
+        except (struct.error, TypeError, AttributeError, ValueError):
+            # 逐个写入时同样的值会抛出相同的异常，或者按writeFieldValue的规则写入
+            for i in field[:count]:
+                self.writeFieldValue(i.signature, i.value)
+        else:
+            self.stream.writeBytes(data)
+        return field[count:]
 
     def writeClassDesc(self, javaClass):
-        if javaClass in self.handles:
-            self.writeHandle(javaClass)
-            return
+        return self.drive(self._writeClassDesc(javaClass))
+
+    def _writeClassDesc(self, javaClass):
+        handle = self.handles.lookup(javaClass)
+        if handle is not None:
+            return self.writeHandle(javaClass, handle)
         if isinstance(javaClass, JavaProxyClass):
-            return self.writeJavaProxyClass(javaClass)
+            yield from self._writeJavaProxyClass(javaClass)
+            return
         self.stream.writeBytes(Constants.TC_CLASSDESC)
         self.stream.writeString(javaClass.name)
         self.stream.writeLong(javaClass.suid)
         self.stream.writeBytes(javaClass.flags.to_bytes(1, 'big'))
         self.stream.writeShort(len(javaClass.fields))
-        self.handles.append(javaClass)
+        self.handles.assign(javaClass)
         writeTypeString = False
         for i in javaClass.fields:
             if i['signature'].startswith('L') or i['signature'].startswith('['):
@@ -92,60 +255,90 @@ class ObjectWrite:
             self.stream.writeString(i['name'])
             if writeTypeString:
                 self.writeTypeString(i['signature'])
-        self.writeClassAnnotations(javaClass.classAnnotations)
+        yield from self._writeClassAnnotations(javaClass.classAnnotations)
         if javaClass.superJavaClass is not None:
-            self.writeClassDesc(javaClass.superJavaClass)
+            yield self._writeClassDesc(javaClass.superJavaClass)
         else:
             self.stream.writeBytes(Constants.TC_NULL)
 
-    def writeHandle(self, obj):
-        handle = self.handles.index(obj)
-        print(hex(handle))
-        handle = Constants.baseWireHandle + handle
+    def writeHandle(self, obj, handle=None):
+        if handle is None:
+            handle = self.handles.lookup(obj)
+        if self.tracer:
+            self.trace('reference', Constants.TC_REFERENCE, handle)
         self.stream.writeBytes(Constants.TC_REFERENCE)
         self.stream.writeInt(handle)
 
     def writeTypeString(self, javaString):
-        if javaString in self.handles:
-            self.writeHandle(javaString)
-            return
+        handle = self.handles.lookup(javaString)
+        if handle is not None:
+            return self.writeHandle(javaString, handle)
+        else:
+            self.writeUtf(javaString.string)
+            self.handles.assign(javaString)
+
+    def writeUtf(self, value):
+        """
+        写入类型和字符串，编码后超过65535字节时写成TC_LONGSTRING
+        """
+        if value.isascii() and '\x00' not in value:
+            data = value.encode()
         else:
-            self.stream.writeBytes(Constants.TC_STRING)
-            self.stream.writeString(javaString.string)
-            self.handles.append(javaString)
+            data = encodeUtf(value)
+        if len(data) > MAX_UTF_LENGTH:
+            self.stream.writeBytes(LONG_STRING_HEADER.pack(Constants.TC_LONGSTRING, len(data)))
+        else:
+            self.stream.writeBytes(STRING_HEADER.pack(Constants.TC_STRING, len(data)))
+        self.stream.writeBytes(data)
 
     def writeClassAnnotations(self, classAnnotations):
+        return self.drive(self._writeClassAnnotations(classAnnotations))
+
+    def _writeClassAnnotations(self, classAnnotations):
         for i in classAnnotations:
-            self.writeContent(i)
+            yield i
 
     def writeEndBlock(self, content):
         self.stream.writeBytes(Constants.TC_ENDBLOCKDATA)
 
     def writeJavaField(self, content):
+        return self.drive(self._writeJavaField(content))
+
+    def _writeJavaField(self, content):
         if content.signature.startswith('L') or content.signature.startswith('['):
-            self.writeContent(content.value)
-        elif content.signature == "B":
-            self.stream.writeBytes(content.value)
-        elif content.signature == "C":
-            self.stream.writeChar(content.value)
-        elif content.signature == "D":
-            self.stream.writeDouble(content.value)
-        elif content.signature == "F":
-            self.stream.writeFloat(content.value)
-        elif content.signature == 'I':
-            self.stream.writeInt(content.value)
-        elif content.signature == 'J':
-            self.stream.writeLong(content.value)
-        elif content.signature == 'S':
-            self.stream.writeShort(content.value)
-        elif content.signature == 'Z':
-            self.stream.writeBoolean(content.value)
+            yield content.value
+        else:
+            self.writeFieldValue(content.signature, content.value)
+
+    def writeFieldValue(self, signature, value):
+        """
+        写入基本类型字段的值
+        """
+        if signature == "B":
+            self.stream.writeBytes(value)
+        elif signature == "C":
+            self.stream.writeChar(value)
+        elif signature == "D":
+            self.stream.writeDouble(value)
+        elif signature == "F":
+            self.stream.writeFloat(value)
+        elif signature == 'I':
+            self.stream.writeInt(value)
+        elif signature == 'J':
+            self.stream.writeLong(value)
+        elif signature == 'S':
+            self.stream.writeShort(value)
+        elif signature == 'Z':
+            self.stream.writeBoolean(value)
         else:
-            print("unsupport", content)
+            warnings.warn(f"unsupport signature {signature}")
 
     def writeObjectAnnotations(self, objectAnnotation, lastWriteObjectAnnotations):
+        return self.drive(self._writeObjectAnnotations(objectAnnotation, lastWriteObjectAnnotations))
+
+    def _writeObjectAnnotations(self, objectAnnotation, lastWriteObjectAnnotations):
         while lastWriteObjectAnnotations < len(objectAnnotation):
-            self.writeContent(objectAnnotation[lastWriteObjectAnnotations])
+            yield objectAnnotation[lastWriteObjectAnnotations]
             if isinstance(objectAnnotation[lastWriteObjectAnnotations], JavaEndBlock):
                 lastWriteObjectAnnotations += 1
                 break
@@ -160,59 +353,97 @@ class ObjectWrite:
         self.stream.writeBytes(content.data)
 
     def writeJavaArray(self, content):
-        if content in self.handles:
-            return self.writeHandle(content)
+        return self.drive(self._writeJavaArray(content))
+
+    def _writeJavaArray(self, content):
+        handle = self.handles.lookup(content)
+        if handle is not None:
+            return self.writeHandle(content, handle)
         else:
             self.stream.writeBytes(Constants.TC_ARRAY)
-            self.writeClassDesc(content.signature)
+            yield from self._writeClassDesc(content.signature)
             self.stream.writeInt(content.length)
-            self.handles.append(content)
-            for i in content.list:
-                if content.signature.name[1:].startswith("[") or content.signature.name[1:].startswith("L"):
-                    self.writeContent(i)
-                else:
-                    self.writeJavaField(JavaField(None, content.signature.name[1:], i))
+            self.handles.assign(content)
+            signature = content.signature.name[1:]
+            if signature.startswith("[") or signature.startswith("L"):
+                for i in content.list:
+                    yield i
+            elif isinstance(content.list, list):
+                for i in content.list:
+                    self.writeFieldValue(signature, i)
+            else:
+                self.writePrimitiveArray(signature, content.list)
+
+    def writePrimitiveArray(self, signature, values):
+        """
+        一次写入ObjectRead.readPrimitiveArray读出的bytes、str或array.array
+        """
+        if signature == 'C':
+            values = values.encode('utf-16-be', 'surrogatepass')
+        elif isinstance(values, array) and sys.byteorder == 'little':
+            values = array(values.typecode, values)
+            values.byteswap()
+        self.stream.writeBytes(values)
 
     def writeJavaException(self, content):
+        return self.drive(self._writeJavaException(content))
+
+    def _writeJavaException(self, content):
         self.stream.writeBytes(Constants.TC_EXCEPTION)
-        self.handles = []
-        self.writeContent(content.exception)
-        self.handles = []
+        self.handles.clear()
+        yield content.exception
+        self.handles.clear()
 
     def writeJavaClassDesc(self, content):
-        if content in self.handles:
-            return self.writeHandle(content)
+        return self.drive(self._writeJavaClassDesc(content))
+
+    def _writeJavaClassDesc(self, content):
+        handle = self.handles.lookup(content)
+        if handle is not None:
+            return self.writeHandle(content, handle)
         else:
             self.stream.writeBytes(Constants.TC_CLASS)
-            self.writeClassDesc(content)
-            self.handles.append(content)
+            yield from self._writeClassDesc(content)
+            self.handles.assign(content)
 
     def writeJavaProxyClass(self, content):
-        if content in self.handles:
-            return self.writeHandle(content)
+        return self.drive(self._writeJavaProxyClass(content))
+
+    def _writeJavaProxyClass(self, content):
+        handle = self.handles.lookup(content)
+        if handle is not None:
+            return self.writeHandle(content, handle)
         self.stream.writeBytes(Constants.TC_PROXYCLASSDESC)
         self.stream.writeInt(len(content.interfaces))
         for i in content.interfaces:
             self.stream.writeString(i)
-        self.handles.append(content)
+        self.handles.assign(content)
         for i in content.classAnnotations:
-            self.writeContent(i)
+            yield i
         if content.superJavaClass:
-            self.writeClassDesc(content.superJavaClass)
+            yield self._writeClassDesc(content.superJavaClass)
         else:
             self.stream.writeBytes(Constants.TC_NULL)
 
     def writeEnum(self, content):
-        if content in self.handles:
-            return self.writeHandle(content)
+        return self.drive(self._writeEnum(content))
+
+    def _writeEnum(self, content):
+        handle = self.handles.lookup(content)
+        if handle is not None:
+            return self.writeHandle(content, handle)
         self.stream.writeBytes(Constants.TC_ENUM)
-        self.writeClassDesc(content.javaClass)
-        self.handles.append(content)
-        self.writeContent(content.enumConstantName)
+        yield from self._writeClassDesc(content.javaClass)
+        self.handles.assign(content)
+        yield content.enumConstantName
 
     def writeClass(self, content):
-        if content in self.handles:
-            return self.writeHandle(content)
+        return self.drive(self._writeClass(content))
+
+    def _writeClass(self, content):
+        handle = self.handles.lookup(content)
+        if handle is not None:
+            return self.writeHandle(content, handle)
         self.stream.writeBytes(Constants.TC_CLASS)
-        self.writeClassDesc(content.javaclassDesc)
-        self.handles.append(content)
+        yield from self._writeClassDesc(content.javaclassDesc)
+        self.handles.assign(content)
@@ -0,0 +1,182 @@
+# -*- coding: utf-8 -*-
+import hashlib
+import json
+import os
+import pickle
+import threading
+from collections import OrderedDict
+
+from .ContentHandler import StatsHandler
+from .ObjectRead import ObjectRead
+
+
+def digestBytes(data):
+    """
+    缓存使用的key，原始字节的blake2b摘要
+    """
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+
+class ParseCache:
+    """
+    按原始字节的摘要缓存解析结果，相同的数据不再重复解析，适用于反复出现相同payload的场景：
+        cache = ParseCache(maxEntries=1024, directory='cache')
+        contents = cache.contents(data)
+        summary = cache.summary(data)
+    contents返回所有顶层content组成的list，缓存命中时返回的是同一个对象，修改前需要copy.deepcopy；
+    summary只统计类名和对象数，不构造对象树。
+    指定directory时结果同时保存到磁盘，对象树用pickle保存，只应读取自己写入的目录
+    """
+
+    def __init__(self, maxEntries=256, directory=None):
+        self.maxEntries = maxEntries
+        self.directory = directory
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+        # (类型, 摘要) -> 结果，按最近使用的顺序排列
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.diskHits = 0
+        self.misses = 0
+
+    def contents(self, data):
+        """
+        :return: 数据中所有的顶层content，与依次调用ObjectRead.readContent的结果相同
+        """
+        return self.lookup('contents', bytes(data), parseContents)
+
+    def summary(self, data):
+        """
+        :return: dict，contents为顶层content数，handles为handle表的大小，objects为对象数，
+                 classes为出现的类名（按第一次出现的顺序），signature为类名序列的摘要，
+                 相同利用链生成的payload即使命令、地址不同signature也相同
+        """
+        return self.lookup('summary', bytes(data), summarize)
+
+    def lookup(self, kind, data, parse):
+        key = (kind, digestBytes(data))
+        with self.lock:
+            result = self.entries.get(key)
+            if result is not None:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return result
+        result = self.load(key)
+        if result is not None:
+            with self.lock:
+                self.diskHits += 1
+        else:
+            # 解析出错时抛出异常，不缓存
+            result = parse(data)
+            with self.lock:
+                self.misses += 1
+            self.save(key, result)
+        with self.lock:
+            self.entries[key] = result
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxEntries:
+                self.entries.popitem(last=False)
+        return result
+
+    def path(self, key):
+        kind, digest = key
+        return os.path.join(self.directory, f"{digest}.{kind}.{'json' if kind == 'summary' else 'pickle'}")
+
+    def load(self, key):
+        """
+        :return: 磁盘上保存的结果，没有或者文件已损坏时返回None，损坏的文件会被删除
+        """
+        if self.directory is None:
+            return None
+        path = self.path(key)
+        try:
+            if key[0] == 'summary':
+                with open(path, 'r') as f:
+                    return json.load(f)
+            with open(path, 'rb') as f:
+                return pickle.load(f)
+        except FileNotFoundError:
+            return None
+        except (EOFError, pickle.UnpicklingError, ValueError):
+            # 例如写入时进程被杀死、磁盘已满留下的不完整文件，当作未命中重新解析
+            removeFile(path)
+            return None
+
+    def save(self, key, result):
+        """
+        结果无法保存时（例如对象树嵌套太深，pickle超过递归深度）只缓存在内存中，不影响本次读取
+        """
+        if self.directory is None:
+            return
+        path = self.path(key)
+        # 先写入临时文件再改名，多个进程共用一个目录时不会读到写了一半的文件
+        temp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            if key[0] == 'summary':
+                with open(temp, 'w') as f:
+                    json.dump(result, f, ensure_ascii=False)
+            else:
+                with open(temp, 'wb') as f:
+                    pickle.dump(result, f, pickle.HIGHEST_PROTOCOL)
+            os.replace(temp, path)
+        except (RecursionError, pickle.PicklingError, OSError):
+            removeFile(temp)
+
+    def stats(self):
+        return {'hits': self.hits, 'diskHits': self.diskHits, 'misses': self.misses, 'entries': len(self.entries)}
+
+    def clear(self):
+        """
+        清空内存中的缓存和计数，不删除磁盘上的文件
+        """
+        with self.lock:
+            self.entries.clear()
+            self.hits = self.diskHits = self.misses = 0
+
+
+def removeFile(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+def parseContents(data):
+    reader = ObjectRead(data)
+    contents = []
+    while reader.bin.peekByte():
+        contents.append(reader.readContent())
+    return contents
+
+
+def summarize(data):
+    summary, error, _ = readSummary(data)
+    if error is not None:
+        raise error
+    return summary
+
+
+def readSummary(data):
+    """
+    统计data中的顶层content数、handle表大小、对象数和类名，不构造对象树。ParseCache.summary和CorpusScan共用
+    :return: (summary, error, offset)，解析出错时不抛出异常，error为异常，summary中是出错之前的统计，
+             offset为出错时流中的偏移
+    """
+    handler = StatsHandler()
+    reader = None
+    contents = 0
+    error = None
+    try:
+        reader = ObjectRead(data, handler=handler)
+        while reader.bin.peekByte():
+            reader.readContent()
+            contents += 1
+    except Exception as e:
+        error = e
+    classes = list(handler.classes)
+    signature = hashlib.blake2b('\n'.join(classes).encode('utf-8', 'surrogatepass'), digest_size=16).hexdigest()
+    summary = {'contents': contents, 'handles': len(reader.handles) if reader is not None else 0,
+               'objects': handler.objects, 'classes': classes, 'signature': signature}
+    offset = reader.bin.tell() if reader is not None else 0
+    return summary, error, offset
@@ -0,0 +1,365 @@
+# -*- coding: utf-8 -*-
+import hashlib
+import json
+import os
+import sys
+from array import array
+from collections import namedtuple
+
+from .Constants import Constants
+from .ContentHandler import ContentHandler
+from .ObjectIO import BYTES
+from .ObjectRead import ObjectRead
+
+# handle     handle值，从0x7e0000开始
+# tc         类型，如Constants.TC_OBJECT
+# offset     元素第一个字节在流中的偏移
+# length     元素占用的字节数，包括嵌套在其中的元素
+# className  对象、数组、枚举、类、类描述的类名，字符串为None
+# epoch      TC_RESET和TC_EXCEPTION会清空handle表，epoch为之前清空的次数
+IndexEntry = namedtuple('IndexEntry', ('handle', 'tc', 'offset', 'length', 'className', 'epoch'))
+
+MAGIC = b'JSIX\x01'
+
+
+def indexed(read):
+    """
+    记录元素的开始位置和开始时handle表的大小，读完后加入索引
+    """
+
+    def wrapper(self):
+        start = self.bin.pos
+        first = self.startEntry()
+        value = yield from read(self)
+        self.endEntry(start, first)
+        return value
+
+    return wrapper
+
+
+class NameHandler(ContentHandler):
+    """
+    只记录每个handle的类名，不构造对象
+    """
+
+    def __init__(self):
+        self.names = {}
+
+    def classDesc(self, handle, classDesc):
+        self.names[handle] = classDesc.name
+
+    def startObject(self, handle, classDesc):
+        self.names[handle] = classDesc.name
+
+    def startArray(self, handle, classDesc, size):
+        self.names[handle] = classDesc.name
+
+    def startEnum(self, handle, classDesc):
+        self.names[handle] = classDesc.name
+
+    def javaClass(self, handle, classDesc):
+        self.names[handle] = classDesc.name
+
+
+class IndexingObjectRead(ObjectRead):
+    """
+    读取时记录每个分配handle的元素的位置
+    """
+
+    def __init__(self, data):
+        self.index = StreamIndex()
+        self.epoch = 0
+        self.epochHandles = None
+        # 当前epoch中已经记录的handle
+        self.claimed = bytearray()
+        super().__init__(data, handler=NameHandler())
+        self.epochHandles = self.handles
+
+    def startEntry(self):
+        if self.handles is not self.epochHandles:
+            # handle表被TC_RESET或TC_EXCEPTION清空
+            self.epoch += 1
+            self.epochHandles = self.handles
+            self.claimed = bytearray()
+        return len(self.handles)
+
+    def endEntry(self, start, first):
+        self.startEntry()
+        claimed = self.claimed
+        count = len(self.handles)
+        if len(claimed) < count:
+            claimed.extend(bytes(count - len(claimed)))
+        # 嵌套的元素已经先记录，第一个没有被记录的handle就是这个元素的
+        handle = first
+        while handle < count and claimed[handle]:
+            handle += 1
+        if handle == count:
+            # 例如类描述为null的对象，没有分配handle
+            return
+        claimed[handle] = 1
+        wireHandle = handle + Constants.baseWireHandle
+        name = self.handler.names.pop(wireHandle, None)
+        self.index.append(wireHandle, self.bin.buffer[start], start, self.bin.pos - start, first, name, self.epoch)
+
+    def readJavaString(self):
+        start = self.bin.pos
+        first = self.startEntry()
+        value = super().readJavaString()
+        self.endEntry(start, first)
+        return value
+
+    _readClassDesc = indexed(ObjectRead._readClassDesc)
+    _readProxyClassDescriptor = indexed(ObjectRead._readProxyClassDescriptor)
+    _readObject = indexed(ObjectRead._readObject)
+    _readArray = indexed(ObjectRead._readArray)
+    _readEnum = indexed(ObjectRead._readEnum)
+    _readClass = indexed(ObjectRead._readClass)
+
+
+# 分派表中是ObjectRead的函数，换成记录位置的版本
+IndexingObjectRead.nestedReaders = {tc: getattr(IndexingObjectRead, reader.__name__)
+                                    for tc, reader in ObjectRead.nestedReaders.items()}
+
+
+class StreamIndex:
+    """
+    流中每个分配handle的元素（类描述、对象、字符串、数组、枚举、类）的位置，之后可以直接跳到该位置读取，不再从头解析：
+        index = StreamIndex.forFile('payload.ser')
+        for entry in index.select(Constants.TC_ARRAY, '[B'):
+            value = index.open(data).readEntry(entry)
+    各列保存在array中，按元素读完的顺序排列，可以保存到文件旁边的.idx文件中
+    """
+
+    def __init__(self):
+        self.handles = array('i')
+        self.tcs = bytearray()
+        self.offsets = array('q')
+        self.lengths = array('q')
+        # 开始读取元素时handle表的大小，跳到该元素读取时从这里分配handle
+        self.firsts = array('i')
+        self.nameIds = array('i')
+        self.epochs = array('i')
+        self.names = []
+        self.nameIndex = {}
+        # (epoch, handle) -> 行号
+        self.rows = None
+        # 数据的摘要和大小，用于判断索引是否过期
+        self.digest = None
+        self.size = None
+
+    @classmethod
+    def build(cls, data):
+        """
+        解析整个流，建立索引
+        :param data: bytes、bytearray、memoryview或mmap
+        """
+        reader = IndexingObjectRead(data)
+        while reader.bin.peekByte():
+            reader.readContent()
+        index = reader.index
+        index.digest = hashlib.blake2b(data, digest_size=16).hexdigest()
+        index.size = len(data)
+        return index
+
+    @classmethod
+    def forFile(cls, path, indexPath=None):
+        """
+        读取path旁边的索引文件，不存在或者文件已经改变时重新建立并保存
+        """
+        indexPath = indexPath or path + '.idx'
+        with open(path, 'rb') as f:
+            data = f.read()
+        try:
+            index = cls.load(indexPath)
+            if index.size == len(data) and index.digest == hashlib.blake2b(data, digest_size=16).hexdigest():
+                return index
+        except (OSError, ValueError):
+            pass
+        index = cls.build(data)
+        index.save(indexPath)
+        return index
+
+    def append(self, handle, tc, offset, length, first, name, epoch):
+        nameId = -1
+        if name is not None:
+            nameId = self.nameIndex.get(name)
+            if nameId is None:
+                nameId = self.nameIndex[name] = len(self.names)
+                self.names.append(name)
+        self.handles.append(handle)
+        self.tcs.append(tc)
+        self.offsets.append(offset)
+        self.lengths.append(length)
+        self.firsts.append(first)
+        self.nameIds.append(nameId)
+        self.epochs.append(epoch)
+        self.rows = None
+
+    def __len__(self):
+        return len(self.handles)
+
+    def entry(self, row):
+        nameId = self.nameIds[row]
+        return IndexEntry(self.handles[row], BYTES[self.tcs[row]], self.offsets[row], self.lengths[row],
+                          self.names[nameId] if nameId >= 0 else None, self.epochs[row])
+
+    def __iter__(self):
+        return (self.entry(row) for row in range(len(self)))
+
+    def row(self, handle, epoch=0):
+        if self.rows is None:
+            self.rows = {key: row for row, key in enumerate(zip(self.epochs, self.handles))}
+        return self.rows[(epoch, handle)]
+
+    def find(self, handle, epoch=0):
+        """
+        :return: handle对应的IndexEntry，不存在时抛出KeyError
+        """
+        return self.entry(self.row(handle, epoch))
+
+    def select(self, tc=None, className=None):
+        """
+        :return: 类型为tc、类名为className的元素，按在流中的位置排列，参数为None表示不限制
+        """
+        tcs = self.tcs
+        nameIds = self.nameIds
+        tcCode = tc[0] if tc is not None else None
+        if tc == Constants.TC_STRING:
+            tcCodes = (Constants.TC_STRING[0], Constants.TC_LONGSTRING[0])
+        else:
+            tcCodes = (tcCode,)
+        nameId = None
+        if className is not None:
+            nameId = self.nameIndex.get(className)
+            if nameId is None:
+                return []
+        rows = [row for row in range(len(self))
+                if (tcCode is None or tcs[row] in tcCodes) and (nameId is None or nameIds[row] == nameId)]
+        rows.sort(key=self.offsets.__getitem__)
+        return [self.entry(row) for row in rows]
+
+    def handleCount(self, epoch):
+        return max((handle - Constants.baseWireHandle + 1 for e, handle in zip(self.epochs, self.handles)
+                    if e == epoch), default=0)
+
+    def open(self, data, epoch=0, handler=None):
+        """
+        :param data: 建立索引时的数据
+        :return: IndexedObjectRead，按handle或IndexEntry读取epoch中的元素
+        """
+        return IndexedObjectRead(data, self, epoch, handler)
+
+    def save(self, path):
+        """
+        保存为MAGIC、4字节的头部长度、JSON头部和各列的数据，数据为小端字节序
+        """
+        columns = [self.handles, self.offsets, self.lengths, self.firsts, self.nameIds, self.epochs]
+        header = json.dumps({'count': len(self), 'names': self.names, 'digest': self.digest, 'size': self.size},
+                            ensure_ascii=False).encode('utf-8')
+        temp = f"{path}.{os.getpid()}.tmp"
+        with open(temp, 'wb') as f:
+            f.write(MAGIC)
+            f.write(len(header).to_bytes(4, 'big'))
+            f.write(header)
+            f.write(self.tcs)
+            for column in columns:
+                if sys.byteorder == 'big':
+                    column = array(column.typecode, column)
+                    column.byteswap()
+                f.write(column.tobytes())
+        os.replace(temp, path)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, 'rb') as f:
+            data = f.read()
+        if not data.startswith(MAGIC):
+            raise ValueError(f"{path} is not a stream index")
+        pos = len(MAGIC)
+        headerLength = int.from_bytes(data[pos:pos + 4], 'big')
+        pos += 4
+        header = json.loads(data[pos:pos + headerLength].decode('utf-8'))
+        pos += headerLength
+        index = cls()
+        count = header['count']
+        index.digest = header['digest']
+        index.size = header['size']
+        index.names = header['names']
+        index.nameIndex = {name: nameId for nameId, name in enumerate(index.names)}
+        index.tcs = bytearray(data[pos:pos + count])
+        pos += count
+        for name in ('handles', 'offsets', 'lengths', 'firsts', 'nameIds', 'epochs'):
+            column = getattr(index, name)
+            size = column.itemsize * count
+            column.frombytes(data[pos:pos + size])
+            if sys.byteorder == 'big':
+                column.byteswap()
+            pos += size
+        if pos != len(data):
+            raise ValueError(f"{path} is truncated or corrupted")
+        return index
+
+
+# handle表中还没有读取的位置
+MISSING = object()
+
+
+class HandleSlots:
+    """
+    IndexedObjectRead的handle表，大小固定，被引用的handle还没有读取时按索引跳过去读取
+    """
+
+    def __init__(self, load, count):
+        self.values = [MISSING] * count
+        self.cursor = 0
+        self.load = load
+
+    def append(self, value):
+        self.values[self.cursor] = value
+        self.cursor += 1
+
+    def __len__(self):
+        return self.cursor
+
+    def __getitem__(self, index):
+        value = self.values[index]
+        if value is MISSING:
+            value = self.load(index)
+        return value
+
+
+class IndexedObjectRead(ObjectRead):
+    """
+    按索引读取流中的单个元素，只读取该元素和它引用的元素。
+    读取一个元素时会重新构造嵌套在其中的元素，元素引用了包含它的元素时，得到的对象图中同一个handle可能对应两个相同的对象
+    """
+
+    def __init__(self, data, index, epoch=0, handler=None):
+        super().__init__(data, handler=handler)
+        self.index = index
+        self.epoch = epoch
+        self.handles = HandleSlots(self.loadHandle, index.handleCount(epoch))
+
+    def loadHandle(self, index):
+        return self.readEntry(self.index.find(index + Constants.baseWireHandle, self.epoch))
+
+    def get(self, handle):
+        """
+        :return: handle对应的值，已经读取过时不重复读取
+        """
+        return self.handles[handle - Constants.baseWireHandle]
+
+    def readEntry(self, entry):
+        """
+        跳到entry的位置读取，读完后回到原来的位置
+        """
+        row = self.index.row(entry.handle, entry.epoch)
+        stream = self.bin
+        handles = self.handles
+        pos, cursor = stream.pos, handles.cursor
+        stream.pos = entry.offset
+        handles.cursor = self.index.firsts[row]
+        try:
+            return self.readContent()
+        finally:
+            stream.pos, handles.cursor = pos, cursor
@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+import logging
+from collections import namedtuple, deque
+
+
+class TraceEvent(namedtuple('TraceEvent', ['event', 'offset', 'tc', 'handle', 'className', 'value'])):
+    """
+    读写过程中的调试事件。ObjectRead/ObjectWrite默认不设置tracer，此时只多一次属性判断，不产生任何输出
+    event     事件名，如classDesc、object、string、reference
+    offset    事件产生时流中的偏移，流不支持tell()时为None
+    tc        类型码，如Constants.TC_OBJECT
+    handle    相关的handle
+    className 相关的类名
+    value     事件附带的数据，如字符串的值、数组的长度
+    """
+    __slots__ = ()
+
+
+class Tracer:
+    """
+    把所有事件按顺序记录在events中，子类覆盖emit改变事件的去向
+    """
+
+    def __init__(self):
+        self.events = []
+
+    def emit(self, event):
+        self.events.append(event)
+
+
+class CallbackTracer(Tracer):
+    def __init__(self, callback):
+        self.callback = callback
+
+    def emit(self, event):
+        self.callback(event)
+
+
+class LoggingTracer(Tracer):
+    def __init__(self, logger=None, level=logging.DEBUG):
+        self.logger = logger or logging.getLogger('javaSerializationTools')
+        self.level = level
+
+    def emit(self, event):
+        if not self.logger.isEnabledFor(self.level):
+            return
+        handle = hex(event.handle) if event.handle is not None else None
+        self.logger.log(self.level, "%s offset=%s tc=%s handle=%s className=%s value=%r", event.event,
+                        event.offset, event.tc, handle, event.className, event.value)
+
+
+class RingBufferTracer(Tracer):
+    """
+    只保留最近的maxlen个事件，用于出错后查看出错位置附近的解析过程
+    """
+
+    def __init__(self, maxlen=1024):
+        self.events = deque(maxlen=maxlen)
+
+    def emit(self, event):
+        self.events.append(event)
@@ -1,11 +1,30 @@
 # -*- coding: utf-8 -*-
 
 from .JavaMetaClass import JavaEndBlock, JavaBLockData, JavaLongBLockData, JavaClassDesc, JavaClass, JavaProxyClass, \
-    JavaException, JavaArray, JavaEnum, JavaString, JavaObject, JavaField
-from .Exceptions import InvalidTypeCodeException, InvalidHeaderException
+    JavaException, JavaArray, JavaEnum, JavaString, JavaObject, JavaField, JavaFieldDesc, LazyJavaObject, graphEqual, \
+    fingerprint
+from .Exceptions import InvalidTypeCodeException, InvalidHeaderException, InvalidArraySizeException
+from .HandleTable import HandleTable
+from .ContentHandler import ContentHandler, TreeBuilder, LazyTreeBuilder, StatsHandler
+from .ObjectEvents import ObjectEvent, EventCollector, EventStream
 from .ObjectWrite import ObjectWrite
 from .ObjectRead import ObjectRead
+from .IncrementalObjectRead import IncrementalObjectRead
+from .MappedObjectRead import MappedObjectRead
+from .AsyncObjectRead import AsyncObjectRead
+from .AsyncObjectWrite import AsyncObjectWrite
+from .ObjectTemplate import ObjectTemplate
+from .BatchWrite import BatchWrite
+from .ParseCache import ParseCache
+from .ClassDescRegistry import ClassDescRegistry
+from .StreamIndex import StreamIndex, IndexEntry
+from .Tracer import TraceEvent, Tracer, CallbackTracer, LoggingTracer, RingBufferTracer
 
 __all__ = [JavaEndBlock, JavaBLockData, JavaLongBLockData, JavaClassDesc, JavaClass, JavaProxyClass, \
-           JavaException, JavaArray, JavaEnum, JavaString, JavaObject, JavaField, InvalidTypeCodeException,
-           InvalidHeaderException, ObjectWrite, ObjectRead]
+           JavaException, JavaArray, JavaEnum, JavaString, JavaObject, JavaField, JavaFieldDesc, LazyJavaObject,
+           graphEqual, fingerprint,
+           InvalidTypeCodeException, InvalidHeaderException, InvalidArraySizeException, HandleTable, ObjectWrite,
+           ObjectRead, TraceEvent, Tracer, CallbackTracer, LoggingTracer, RingBufferTracer, ContentHandler, TreeBuilder,
+           LazyTreeBuilder, StatsHandler, ObjectEvent, EventCollector, EventStream, IncrementalObjectRead,
+           MappedObjectRead, AsyncObjectRead, AsyncObjectWrite, ObjectTemplate, BatchWrite, ParseCache,
+           ClassDescRegistry, StreamIndex, IndexEntry]
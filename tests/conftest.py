@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+"""
+各个测试共用的辅助函数，测试文件中用from conftest import ...导入
+"""
+import os
+
+from javaSerializationTools import ObjectRead, ObjectWrite, TreeBuilder, JavaClassDesc, JavaFieldDesc, JavaObject, JavaField, \
+    JavaArray, JavaString, JavaEndBlock
+
+FILES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'files')
+
+
+def readBytes(name):
+    """
+    :return: tests/files中文件的内容
+    """
+    with open(os.path.join(FILES, name), 'rb') as f:
+        return f.read()
+
+
+def readFile(name, **options):
+    """
+    :param options: 传给ObjectRead，例如lazy=True
+    :return: tests/files中文件的第一个content
+    """
+    return ObjectRead(readBytes(name), **options).readContent()
+
+
+def write(*contents, writerType=ObjectWrite, **options):
+    """
+    :param options: 传给writerType，例如compact=True
+    :return: 依次写入contents得到的数据
+    """
+    writer = writerType(None, **options)
+    for content in contents:
+        writer.writeContent(content)
+    return writer.toBytes()
+
+
+def largeArray(count=5000):
+    """
+    :return: count个test.Point对象组成的数组，count为5000时写入后约150KB
+    """
+    desc = JavaClassDesc('test.Point', 1, 2)
+    desc.fields = [JavaFieldDesc('x', 'I'), JavaFieldDesc('y', 'J'),
+                   JavaFieldDesc('name', JavaString('Ljava/lang/String;'))]
+    desc.classAnnotations = [JavaEndBlock()]
+    arrayDesc = JavaClassDesc('[Ltest.Point;', 1, 2)
+    arrayDesc.classAnnotations = [JavaEndBlock()]
+    array = JavaArray(count, arrayDesc)
+    for i in range(count):
+        point = JavaObject(desc)
+        point.fields.append([JavaField('x', 'I', i), JavaField('y', 'J', -i),
+                             JavaField('name', desc.fields[2].signature, JavaString(f'point-{i}'))])
+        array.list.append(point)
+    return array
+
+
+class CountingBuilder(TreeBuilder):
+    """
+    记录startObject的次数，content被重新读取时次数会增加
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.objects = 0
+
+    def startObject(self, handle, classDesc):
+        self.objects += 1
+        return super().startObject(handle, classDesc)
+
+
+def deepChain(length):
+    """
+    :return: 每个test.Node的next字段引用下一个Node，嵌套length层的链表
+    """
+    desc = JavaClassDesc('test.Node', 1, 2)
+    desc.fields = [JavaFieldDesc('value', 'I'), JavaFieldDesc('next', JavaString('Ltest/Node;'))]
+    desc.classAnnotations = [JavaEndBlock()]
+    head = 'null'
+    for i in range(length):
+        node = JavaObject(desc)
+        node.fields.append([JavaField('value', 'I', i), JavaField('next', desc.fields[1].signature, head)])
+        head = node
+    return head
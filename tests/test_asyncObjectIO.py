@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+import asyncio
+
+from conftest import readFile, write, largeArray, CountingBuilder
+from javaSerializationTools import AsyncObjectRead, AsyncObjectWrite, ObjectRead, graphEqual
+
+
+async def serve(handle):
+    """
+    在127.0.0.1的随机端口上启动服务器，返回服务器和连接到它的(reader, writer)
+    """
+    server = await asyncio.start_server(handle, '127.0.0.1', 0)
+    port = server.sockets[0].getsockname()[1]
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    return server, reader, writer
+
+
+def testLoopbackRoundTrip():
+    objects = [readFile('7u21.ser'), readFile('CommonsCollections1.ser')]
+
+    async def main():
+        received = asyncio.get_running_loop().create_future()
+
+        async def handle(reader, writer):
+            contents = [content async for content in AsyncObjectRead(reader)]
+            received.set_result(contents)
+            writer.close()
+
+        server, _, writer = await serve(handle)
+        async with server:
+            objectWrite = AsyncObjectWrite(writer)
+            await objectWrite.writeContent(objects[0])
+            await objectWrite.reset()
+            await objectWrite.writeContent(objects[1])
+            await objectWrite.close()
+            return await asyncio.wait_for(received, 10)
+
+    contents = asyncio.run(main())
+    # TC_RESET本身也是一个content，值为None
+    assert len(contents) == 3 and contents[1] is None
+    assert graphEqual(contents[0], objects[0])
+    assert graphEqual(contents[2], objects[1])
+
+
+def testMessageSplitAcrossChunks():
+    obj = readFile('CommonsCollections1.ser')
+    data = write(obj, obj)
+
+    async def main():
+        async def handle(reader, writer):
+            # 分成很多个小段发送，每段都等待对端接收
+            for i in range(0, len(data), 13):
+                writer.write(data[i:i + 13])
+                await writer.drain()
+                await asyncio.sleep(0)
+            writer.close()
+
+        server, reader, writer = await serve(handle)
+        async with server:
+            objectRead = AsyncObjectRead(reader, chunkSize=7)
+            first = await objectRead.readContent()
+            second = await objectRead.readContent()
+            try:
+                await objectRead.readContent()
+            except EOFError:
+                pass
+            else:
+                raise AssertionError("expected EOFError after the last content")
+            writer.close()
+            return first, second
+
+    first, second = asyncio.run(main())
+    assert graphEqual(first, obj)
+    # 第二次写入的是对第一个对象的引用
+    assert second is first
+
+
+def testLargePayloadInSmallChunks():
+    data = write(largeArray())
+
+    async def main():
+        async def handle(reader, writer):
+            for i in range(0, len(data), 1460):
+                writer.write(data[i:i + 1460])
+                await writer.drain()
+            writer.close()
+
+        server, reader, writer = await serve(handle)
+        async with server:
+            handler = CountingBuilder()
+            contents = [content async for content in AsyncObjectRead(reader, handler, chunkSize=512)]
+            writer.close()
+            return contents, handler
+
+    contents, handler = asyncio.run(main())
+    oneShot = CountingBuilder()
+    expected = ObjectRead(data, handler=oneShot).readContent()
+    assert len(contents) == 1 and graphEqual(contents[0], expected)
+    # 数据分成几百段到达，每个对象仍然只读取一次
+    assert handler.objects == oneShot.objects
+
+
+def testTruncatedMessage():
+    data = write(readFile('7u21.ser'))
+
+    async def main():
+        async def handle(reader, writer):
+            writer.write(data[:len(data) // 2])
+            await writer.drain()
+            writer.close()
+
+        server, reader, writer = await serve(handle)
+        async with server:
+            try:
+                await AsyncObjectRead(reader).readContent()
+            except EOFError as e:
+                return e
+            finally:
+                writer.close()
+
+    assert isinstance(asyncio.run(main()), EOFError)
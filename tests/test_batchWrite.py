@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+import os
+
+from conftest import readFile, write
+from javaSerializationTools import BatchWrite
+
+
+def hostField(dnslog):
+    """
+    dnslog.ser中java.net.URL的host字段，见tests/testDnslog
+    """
+    return dnslog.objectAnnotation[1].fields[0][4]
+
+
+def setHost(dnslog, host):
+    hostField(dnslog).value.string = host
+
+
+def expectedOutputs(hosts):
+    dnslog = readFile('dnslog.ser')
+    outputs = []
+    for host in hosts:
+        setHost(dnslog, host)
+        outputs.append(write(dnslog))
+    return outputs
+
+
+def testPoolOutputEqualsObjectWrite():
+    # 长度不同的host，覆盖模板中长度前缀的更新
+    hosts = [f'{"x" * (i % 7)}{i}.dnslog.cn' for i in range(50)]
+    expected = expectedOutputs(hosts)
+    dnslog = readFile('dnslog.ser')
+    with BatchWrite(dnslog, slots={'host': hostField(dnslog)}, workers=2) as batch:
+        assert list(batch.map(({'host': host} for host in hosts), chunksize=8)) == expected
+    with BatchWrite(readFile('dnslog.ser'), mutate=setHost, workers=2) as batch:
+        assert list(batch.map(hosts, chunksize=8)) == expected
+
+
+def testWriteFiles(tmp_path):
+    hosts = [f'{i}.dnslog.cn' for i in range(10)]
+    dnslog = readFile('dnslog.ser')
+    with BatchWrite(dnslog, slots={'host': hostField(dnslog)}, workers=2) as batch:
+        paths = batch.writeFiles(({'host': host} for host in hosts), tmp_path, chunksize=3)
+    assert paths == [os.path.join(tmp_path, f'{i}.ser') for i in range(10)]
+    for path, data in zip(paths, expectedOutputs(hosts)):
+        with open(path, 'rb') as f:
+            assert f.read() == data
@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+from conftest import readBytes, write, largeArray
+from javaSerializationTools import ObjectRead, ClassDescRegistry, JavaClassDesc, JavaString, graphEqual
+
+
+def readShared(data, registry):
+    reader = ObjectRead(data, registry=registry)
+    content = reader.readContent()
+    return content, [value for value in reader.handles if type(value) is JavaClassDesc]
+
+
+def testDescsAreSharedAcrossStreams():
+    registry = ClassDescRegistry()
+    data = readBytes('CommonsCollections1.ser')
+    first, firstDescs = readShared(data, registry)
+    second, secondDescs = readShared(data, registry)
+    assert firstDescs and len(firstDescs) == len(secondDescs)
+    assert all(a is b for a, b in zip(firstDescs, secondDescs))
+    expected = ObjectRead(data).readContent()
+    assert graphEqual(first, expected)
+    assert graphEqual(second, expected)
+
+
+def testFieldsAreSharedBeforeInterning():
+    registry = ClassDescRegistry()
+    first, firstDescs = readShared(write(largeArray(3)), registry)
+    data = write(largeArray(5))
+    second, secondDescs = readShared(data, registry)
+    assert firstDescs == secondDescs
+    assert all(a is b for a, b in zip(firstDescs, secondDescs))
+    assert graphEqual(second, ObjectRead(data).readContent())
+    # 附加信息不同的类描述不共享，但共用字段列表
+    array = largeArray(2)
+    array.list[0].javaClass.classAnnotations.insert(0, JavaString('codebase'))
+    third, thirdDescs = readShared(write(array), registry)
+    point = thirdDescs[1]
+    assert point is not firstDescs[1]
+    assert point.fields is firstDescs[1].fields
+    assert point.classAnnotations[0] == JavaString('codebase')
+
+
+def testCodecIsSharedAcrossReaders():
+    registry = ClassDescRegistry()
+    data = write(largeArray(3))
+    _, descs = readShared(data, registry)
+    codec = descs[1].readCodec
+    assert codec is not None
+    second, _ = readShared(data, registry)
+    assert descs[1].readCodec is codec
+    assert graphEqual(second, ObjectRead(data).readContent())
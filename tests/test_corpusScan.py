@@ -0,0 +1,41 @@
+# -*- coding: utf-8 -*-
+import json
+import os
+
+from conftest import readBytes, write, largeArray
+from javaSerializationTools.CorpusScan import main
+
+
+def testTruncatedFilesReportEOFOffset(tmp_path):
+    data = write(largeArray(3), largeArray(20))
+    (tmp_path / 'a.ser').write_bytes(data)
+    (tmp_path / 'b.ser').write_bytes(data[:-10])
+    (tmp_path / 'c.ser').write_bytes(readBytes('dnslog.ser')[:2])
+    output = tmp_path / 'scan.jsonl'
+    main(['-j', '1', '-o', str(output), str(tmp_path / '*.ser')])
+    with open(output) as f:
+        results = {os.path.basename(result['path']): result for result in map(json.loads, f)}
+    assert results['a.ser']['ok'] and results['a.ser']['error'] is None
+    assert results['a.ser']['contents'] == 2 and results['a.ser']['size'] == len(data)
+    # 第二个content不完整，保留之前的统计
+    truncated = results['b.ser']
+    assert not truncated['ok'] and truncated['contents'] == 1
+    assert truncated['error'].startswith('EOFError') and truncated['error'].endswith(f'(offset {len(data) - 10})')
+    assert truncated['classes'] == results['a.ser']['classes']
+    assert results['c.ser']['error'] == 'EOFError: stream header is truncated (offset 0)'
+
+
+def testWorkersMatchSingleProcess(tmp_path):
+    data = write(largeArray(3))
+    corpus = tmp_path / 'corpus'
+    corpus.mkdir()
+    for i in range(5):
+        (corpus / f'{i}.ser').write_bytes(data[:len(data) - i])
+    outputs = []
+    for workers in ('1', '2'):
+        output = tmp_path / f'scan{workers}.jsonl'
+        main(['-j', workers, '-o', str(output), str(corpus)])
+        with open(output) as f:
+            outputs.append([{key: value for key, value in json.loads(line).items() if key != 'seconds'} for line in f])
+    assert outputs[0] == outputs[1]
+    assert [result['ok'] for result in outputs[0]] == [True, False, False, False, False]
@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+import pickle
+
+from conftest import write
+from javaSerializationTools import ObjectRead, HandleTable, JavaClassDesc, JavaFieldDesc, JavaString, \
+    JavaEnum, JavaClass, JavaArray, JavaEndBlock
+from javaSerializationTools.JavaMetaClass import graphEqual
+
+
+def enumClass():
+    desc = JavaClassDesc('java.util.concurrent.TimeUnit', 0, 0x12)
+    desc.classAnnotations = [JavaEndBlock()]
+    desc.superJavaClass = JavaClassDesc('java.lang.Enum', 0, 0x12)
+    desc.superJavaClass.classAnnotations = [JavaEndBlock()]
+    return desc
+
+
+def pointClass(*fields):
+    desc = JavaClassDesc('test.Point', 1, 2)
+    desc.fields = [JavaFieldDesc(name, 'I') for name in fields]
+    desc.classAnnotations = [JavaEndBlock()]
+    return desc
+
+
+def separateValues(count=30):
+    # 每个枚举常量、Class对象和它们的类描述都分别构造
+    values = []
+    for i in range(count):
+        enum = JavaEnum(enumClass())
+        enum.enumConstantName = JavaString(('SECONDS', 'MINUTES')[i % 2])
+        values.append(enum)
+        values.append(JavaClass(enumClass()))
+    desc = JavaClassDesc('[Ljava.lang.Object;', 1, 2)
+    desc.classAnnotations = [JavaEndBlock()]
+    array = JavaArray(len(values), desc)
+    array.list = values
+    return array
+
+
+def testCompactSmallerThanDefault():
+    obj = separateValues()
+    default = write(obj)
+    compact = write(obj, compact=True)
+    assert len(compact) < len(default)
+    result = ObjectRead(compact).readContent()
+    assert graphEqual(result, ObjectRead(default).readContent())
+    # 相同的枚举常量读出来是同一个对象
+    assert result.list[0] is result.list[4]
+    assert result.list[1] is result.list[3]
+    assert write(result, compact=True) == compact
+
+
+def testCompactKeepsDifferentDescsApart():
+    table = HandleTable(compact=True)
+    handle = table.assign(pointClass('x', 'y'))
+    assert table.lookup(pointClass('x', 'y')) == handle
+    assert table.lookup(pointClass('x')) is None
+    # 默认模式按类名查找
+    table = HandleTable()
+    handle = table.assign(pointClass('x', 'y'))
+    assert table.lookup(pointClass('x')) == handle
+
+
+def testCompactKeyFollowsChanges():
+    table = HandleTable(compact=True)
+    written = pointClass('x')
+    handle = table.assign(written)
+    other = pointClass('x')
+    assert table.lookup(other) == handle
+    other.fields.append(JavaFieldDesc('y', 'I'))
+    assert table.lookup(other) is None
+    other.fields.pop()
+    other.classAnnotations.insert(0, JavaString('codebase'))
+    assert table.lookup(other) is None
+    # 流中的handle仍然是写入时的内容
+    written.fields.append(JavaFieldDesc('y', 'I'))
+    assert table.lookup(pointClass('x')) == handle
+
+
+def testCompactMergesEqualAnnotations():
+    table = HandleTable(compact=True)
+    first = pointClass('x')
+    first.classAnnotations.insert(0, JavaString('codebase'))
+    second = pointClass('x')
+    second.classAnnotations.insert(0, JavaString('codebase'))
+    handle = table.assign(first)
+    assert table.lookup(second) == handle
+
+
+def testCompactKeyIsCachedOnTheDesc():
+    table = HandleTable(compact=True)
+    desc = enumClass()
+    key = table.descKey(desc)
+    assert table.descKey(desc) is key
+    # 父类变化后重新计算
+    desc.superJavaClass.classAnnotations.insert(0, JavaString('codebase'))
+    assert table.descKey(desc) != key
+    desc.superJavaClass.classAnnotations.pop(0)
+    assert table.descKey(desc) == key
+    # 从pickle恢复的类描述没有缓存
+    restored = pickle.loads(pickle.dumps(desc))
+    assert table.descKey(restored) == key
@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+from conftest import readFile, write, largeArray, CountingBuilder
+from javaSerializationTools import IncrementalObjectRead, ObjectRead, graphEqual
+
+
+def feedAll(data, size, handler=None):
+    reader = IncrementalObjectRead(handler)
+    contents = []
+    for i in range(0, len(data), size):
+        contents.extend(reader.feed(data[i:i + size]))
+    reader.close()
+    return contents
+
+
+def testLargeObjectInSmallSegments():
+    data = write(largeArray())
+    assert len(data) > 100000
+    contents = feedAll(data, 1460)
+    assert len(contents) == 1
+    assert graphEqual(contents[0], ObjectRead(data).readContent())
+
+
+def testContentIsNotReparsed():
+    data = write(readFile('CommonsCollections1.ser'), largeArray(500))
+    oneShot = CountingBuilder()
+    reader = ObjectRead(data, handler=oneShot)
+    expected = [reader.readContent(), reader.readContent()]
+    # 每个字节单独到达时，每个对象也只开始读取一次
+    handler = CountingBuilder()
+    contents = feedAll(data, 1, handler)
+    assert handler.objects == oneShot.objects
+    assert len(contents) == 2
+    assert all(graphEqual(content, value) for content, value in zip(contents, expected))
+
+
+def testPending():
+    data = write(largeArray(10))
+    reader = IncrementalObjectRead()
+    assert reader.feed(data[:-3]) == []
+    # 流头不计入
+    assert reader.pending == len(data) - 3 - 4
+    assert len(reader.feed(data[-3:])) == 1
+    assert reader.pending == 0
+    reader.feed(data[4:20])
+    try:
+        reader.close()
+    except EOFError:
+        pass
+    else:
+        raise AssertionError("expected EOFError for a truncated content")
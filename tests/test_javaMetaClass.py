@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+import os
+import pickle
+import subprocess
+import sys
+
+from conftest import readFile, write
+from javaSerializationTools import ObjectRead, JavaObject, JavaClassDesc, JavaString, LazyJavaObject, graphEqual, \
+    fingerprint
+
+
+def roundTrip(obj):
+    return pickle.loads(pickle.dumps(obj, pickle.HIGHEST_PROTOCOL))
+
+
+def testPickleJavaObject():
+    obj = readFile('7u21.ser')
+    assert type(obj) is JavaObject
+    copied = roundTrip(obj)
+    assert type(copied) is JavaObject
+    assert graphEqual(obj, copied)
+
+
+def testPickleJavaClassDesc():
+    desc = readFile('7u21.ser').javaClass
+    assert type(desc) is JavaClassDesc
+    desc.primitivePrefix()
+    copied = roundTrip(desc)
+    assert graphEqual(desc, copied)
+    assert copied.superJavaClass.name == desc.superJavaClass.name
+    assert not hasattr(copied, 'prefixLayout')
+
+
+def testPickleLazyJavaObject():
+    lazy = readFile('CommonsBeanutils1.ser', lazy=True)
+    assert type(lazy) is LazyJavaObject
+    copied = roundTrip(lazy)
+    assert type(copied) is JavaObject
+    assert graphEqual(readFile('CommonsBeanutils1.ser'), copied)
+
+
+class TaggedObject(JavaObject):
+    __slots__ = ('tag',)
+
+
+def testPickleKeepsBaseClassSlots():
+    desc = JavaClassDesc('Tagged', 1, 2)
+    obj = TaggedObject(desc)
+    obj.tag = 'tag'
+    copied = roundTrip(obj)
+    assert copied.tag == 'tag'
+    assert copied.javaClass.name == 'Tagged'
+    assert copied.fields == [] and copied.objectAnnotation == []
+
+
+# 摘要的格式变化后需要更新，已经保存的摘要会全部失效
+DNSLOG_FINGERPRINT = '1cac7824fdb8c08c2c7c198ede204641'
+
+
+def testFingerprintIsStable():
+    dnslog = readFile('dnslog.ser')
+    assert fingerprint(dnslog) == DNSLOG_FINGERPRINT
+    assert fingerprint(readFile('dnslog.ser', lazy=True)) == DNSLOG_FINGERPRINT
+    assert fingerprint(roundTrip(dnslog)) == DNSLOG_FINGERPRINT
+    assert fingerprint(ObjectRead(write(dnslog)).readContent()) == DNSLOG_FINGERPRINT
+    # 与进程和字符串的hash种子无关
+    code = "from conftest import readFile; from javaSerializationTools import fingerprint; " \
+           "print(fingerprint(readFile('dnslog.ser')))"
+    tests = os.path.dirname(os.path.abspath(__file__))
+    path = os.pathsep.join([tests, os.path.dirname(tests)])
+    for seed in ('1', '2'):
+        env = dict(os.environ, PYTHONHASHSEED=seed, PYTHONPATH=path)
+        output = subprocess.run([sys.executable, '-c', code], env=env, capture_output=True, text=True, check=True)
+        assert output.stdout.strip() == DNSLOG_FINGERPRINT
+
+
+def testFingerprintFollowsContent():
+    dnslog = readFile('dnslog.ser')
+    host = {field.fieldName: field for field in dnslog.objectAnnotation[1].fields[0]}['host'].value
+    original = host.string
+    host.string = 'other.dnslog.cn'
+    assert fingerprint(dnslog) != DNSLOG_FINGERPRINT
+    host.string = original
+    assert fingerprint(dnslog) == DNSLOG_FINGERPRINT
+    # 同一个字符串对象和两个相同的字符串对象摘要不同
+    shared = JavaString('same')
+    separate = [JavaString('same'), JavaString('same')]
+    assert fingerprint([shared, shared]) != fingerprint(separate)
+    assert fingerprint(separate) == fingerprint([JavaString('same'), JavaString('same')])
@@ -0,0 +1,39 @@
+# -*- coding: utf-8 -*-
+import os
+import warnings
+
+from conftest import FILES
+from javaSerializationTools import MappedObjectRead
+
+
+def testExitKeepsOriginalException():
+    path = os.path.join(FILES, 'dnslog.ser')
+    slices = []
+    with warnings.catch_warnings(record=True) as caught:
+        warnings.simplefilter('always')
+        try:
+            with MappedObjectRead(path) as reader:
+                # 切片引用映射，close会抛出BufferError
+                slices.append(reader.bin.buffer[:4])
+                raise KeyError('original')
+        except KeyError as e:
+            assert e.args == ('original',)
+        else:
+            raise AssertionError("expected the KeyError from the with block")
+    assert any(issubclass(warning.category, ResourceWarning) for warning in caught)
+    slices[0].release()
+    reader.close()
+    assert reader.mapping.closed
+
+
+def testExitRaisesWithoutException():
+    path = os.path.join(FILES, 'dnslog.ser')
+    try:
+        with MappedObjectRead(path) as reader:
+            data = reader.bin.buffer[:4]
+    except BufferError:
+        pass
+    else:
+        raise AssertionError("expected BufferError for a referenced slice")
+    data.release()
+    reader.close()
@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+from conftest import write
+from javaSerializationTools import ObjectRead, JavaClassDesc, JavaFieldDesc, JavaObject, JavaField, JavaString, \
+    JavaEndBlock
+
+
+def item(name, inner='null'):
+    desc = JavaClassDesc('test.Item', 1, 2)
+    desc.fields = [JavaFieldDesc('count', 'I'), JavaFieldDesc('inner', JavaString('Ltest/Item;')),
+                   JavaFieldDesc('name', JavaString('Ljava/lang/String;'))]
+    desc.classAnnotations = [JavaEndBlock()]
+    obj = JavaObject(desc)
+    obj.fields.append([JavaField('count', 'I', 3), JavaField('inner', desc.fields[1].signature, inner),
+                       JavaField('name', desc.fields[2].signature, JavaString(name))])
+    return obj
+
+
+def streamData():
+    return write(item('outer', item('inner')), JavaString('after'))
+
+
+def testEventOrder():
+    events = list(ObjectRead(streamData()).events())
+    assert [(e.event, e.depth, e.name) for e in events] == [
+        ('classDesc', 0, None), ('endBlock', 1, None), ('endClassDesc', 0, None),
+        ('startObject', 0, None), ('classData', 1, None), ('field', 1, 'count'),
+        ('reference', 1, None), ('startObject', 1, None), ('classData', 2, None), ('field', 2, 'count'),
+        ('null', 2, None), ('field', 2, 'inner'), ('string', 2, None), ('field', 2, 'name'), ('endObject', 1, None),
+        ('field', 1, 'inner'), ('string', 1, None), ('field', 1, 'name'), ('endObject', 0, None),
+        ('string', 0, None)]
+    # 对象的值就是它的handle
+    inner = events[7]
+    assert events[15].value == inner.handle
+    assert events[6].handle == events[0].handle
+    assert [e.value for e in events if e.event == 'string'] == ['inner', 'outer', 'after']
+
+
+def testSkip():
+    stream = ObjectRead(streamData()).events()
+    # 类描述的子树已经在队列中
+    assert next(stream).event == 'classDesc'
+    stream.skip()
+    assert next(stream).event == 'startObject'
+    seen = []
+    for event in stream:
+        if event.event == 'startObject':
+            # 嵌套的对象还没有读完
+            stream.skip()
+            continue
+        seen.append(event)
+    assert [(e.event, e.depth, e.name) for e in seen] == [
+        ('classData', 1, None), ('field', 1, 'count'), ('reference', 1, None), ('field', 1, 'inner'),
+        ('string', 1, None), ('field', 1, 'name'), ('endObject', 0, None), ('string', 0, None)]
+    # 跳过的子树仍然被解析，之后的handle与不跳过时相同
+    full = list(ObjectRead(streamData()).events())
+    assert (seen[3].value, seen[4].handle) == (full[15].value, full[16].handle)
+    assert [e.value for e in seen if e.event == 'string'] == ['outer', 'after']
+
+def testSkipNeedsStartEvent():
+    stream = ObjectRead(streamData()).events()
+    next(stream)
+    next(stream)
+    try:
+        stream.skip()
+    except ValueError:
+        pass
+    else:
+        raise AssertionError("expected ValueError for skip() after endBlock")
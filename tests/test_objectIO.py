@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+import io
+import struct
+
+from conftest import write
+from javaSerializationTools import ObjectRead, IncrementalObjectRead, JavaClassDesc, JavaFieldDesc, JavaObject, \
+    JavaField, JavaString, JavaEndBlock
+from javaSerializationTools.Constants import Constants
+from javaSerializationTools.ObjectIO import ObjectIO, BufferIO, BufferedIO, encodeUtf, decodeUtf
+
+VALUES = {'F': -1.5, 'D': -2.25e300, 'I': -7, 'J': -8}
+
+
+def numbers(signatures):
+    desc = JavaClassDesc('test.Numbers', 1, 2)
+    desc.fields = [JavaFieldDesc(f'f{i}', signature) for i, signature in enumerate(signatures)]
+    desc.classAnnotations = [JavaEndBlock()]
+    obj = JavaObject(desc)
+    obj.fields.append([JavaField(f'f{i}', signature, VALUES[signature]) for i, signature in enumerate(signatures)])
+    return obj
+
+
+def testNegativeFloatAndDouble():
+    expected = struct.pack('>f', -1.5) + struct.pack('>d', -2.25e300)
+    for backend in (ObjectIO, BufferedIO):
+        stream = io.BytesIO()
+        writer = backend(stream)
+        writer.writeFloat(-1.5)
+        writer.writeDouble(-2.25e300)
+        if backend is BufferedIO:
+            writer.flush()
+        assert stream.getvalue() == expected
+    for reader in (ObjectIO(io.BytesIO(expected)), BufferIO(expected)):
+        assert reader.readFloat() == -1.5
+        assert reader.readDouble() == -2.25e300
+
+
+def testNegativeFloatFields():
+    # 逐个读写和PrimitiveRun一次读写
+    for signatures in ('FD', 'FDIJFD'):
+        data = write(numbers(signatures))
+        # BufferIO和ObjectIO，后者与open(path, 'rb')一样需要peek
+        for source in (data, io.BufferedReader(io.BytesIO(data))):
+            fields = ObjectRead(source).readContent().fields[0]
+            assert [field.value for field in fields] == [VALUES[signature] for signature in signatures]
+        lazy = ObjectRead(data, lazy=True).readContent()
+        assert [field.value for field in lazy.fields[0]] == [VALUES[signature] for signature in signatures]
+
+
+def testTruncatedStringIsEOF():
+    data = write(JavaString('truncated'))
+    for size in range(5, len(data)):
+        for source in (data[:size], io.BufferedReader(io.BytesIO(data[:size]))):
+            try:
+                ObjectRead(source).readContent()
+            except EOFError as e:
+                assert f'offset {size}' in str(e)
+            else:
+                raise AssertionError(f"expected EOFError for {size} of {len(data)} bytes")
+
+
+# Java的DataOutputStream.writeUTF的结果
+MODIFIED_UTF = {
+    'ascii': b'ascii',
+    'a\x00b': b'a\xc0\x80b',
+    '中文': b'\xe4\xb8\xad\xe6\x96\x87',
+    # 补充平面的字符写成两个代理项
+    '\U0001F600': b'\xed\xa0\xbd\xed\xb8\x80',
+    # 单独的代理项原样保留
+    '\ud800x': b'\xed\xa0\x80x',
+}
+
+
+def readBack(data):
+    """
+    :return: 分别用BufferIO、ObjectIO和IncrementalObjectRead读出的第一个content
+    """
+    incremental = IncrementalObjectRead()
+    contents = []
+    for i in range(0, len(data), 1000):
+        contents.extend(incremental.feed(data[i:i + 1000]))
+    incremental.close()
+    return [ObjectRead(data).readContent(), ObjectRead(io.BufferedReader(io.BytesIO(data))).readContent(), contents[0]]
+
+
+def testModifiedUtf():
+    for text, data in MODIFIED_UTF.items():
+        assert encodeUtf(text) == data
+        assert decodeUtf(data) == text
+        written = write(JavaString(text))
+        assert written[4:] == Constants.TC_STRING + struct.pack('>H', len(data)) + data
+        assert all(value.string == text for value in readBack(written))
+    # 类名和字段名也按modified UTF-8编码
+    obj = numbers('FD')
+    obj.javaClass.name = 'test.\U0001F600\x00'
+    obj.javaClass.fields[0].name = obj.fields[0][0].fieldName = '字段'
+    for value in readBack(write(obj)):
+        assert value.javaClass.name == 'test.\U0001F600\x00'
+        assert value.fields[0][0].fieldName == '字段'
+
+
+def testLongString():
+    # 按编码后的字节数而不是字符数判断
+    for text, tc in (('x' * 0xFFFF, Constants.TC_STRING), ('x' * 0x10000, Constants.TC_LONGSTRING),
+                     ('中' * 21845, Constants.TC_STRING), ('中' * 21846, Constants.TC_LONGSTRING)):
+        data = write(JavaString(text))
+        assert data[4:5] == tc
+        if tc == Constants.TC_LONGSTRING:
+            assert data[5:13] == struct.pack('>Q', len(text.encode()))
+        assert all(value.string == text for value in readBack(data))
+    for writer in (ObjectIO(io.BytesIO()), BufferedIO(io.BytesIO())):
+        try:
+            writer.writeString('中' * 21846)
+        except ValueError:
+            pass
+        else:
+            raise AssertionError("expected ValueError for a name longer than 65535 bytes")
@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+import os
+
+from conftest import FILES, readBytes, write, largeArray
+from javaSerializationTools import ObjectRead, JavaClassDesc, JavaFieldDesc, JavaObject, JavaField, JavaEndBlock, \
+    LazyJavaObject, graphEqual
+
+
+def readAll(data, **options):
+    reader = ObjectRead(data, **options)
+    contents = []
+    while reader.bin.peekByte():
+        contents.append(reader.readContent())
+    return contents
+
+
+def pendingObjects(contents):
+    # 不经过fields，找出还没有读取字段的对象
+    seen = set()
+    stack = list(contents)
+    count = 0
+    while stack:
+        obj = stack.pop()
+        if id(obj) in seen:
+            continue
+        seen.add(id(obj))
+        if type(obj) is LazyJavaObject:
+            count += bool(obj.pending)
+            for fields in obj.rawFields():
+                stack.extend(field.value for field in fields)
+            stack.extend(obj.objectAnnotation)
+        elif type(obj) is list:
+            stack.extend(obj)
+        elif hasattr(obj, 'list') and type(obj.list) is list:
+            stack.extend(obj.list)
+    return count
+
+
+def testLazyEqualsEagerOnCorpus():
+    pending = 0
+    for name in sorted(os.listdir(FILES)):
+        data = readBytes(name)
+        try:
+            eager = readAll(data)
+        except Exception:
+            # 不是完整的序列化流
+            continue
+        lazy = readAll(data, lazy=True)
+        assert len(lazy) == len(eager), name
+        pending += pendingObjects(lazy)
+        # graphEqual逐个访问fields，比较前后各读一次
+        assert all(graphEqual(a, b) for a, b in zip(lazy, eager)), name
+        assert pendingObjects(lazy) == 0, name
+        assert b''.join(write(content) for content in readAll(data, lazy=True)) == \
+               b''.join(write(content) for content in eager), name
+    assert pending > 0
+
+
+def testLazyHierarchy():
+    # 父类和子类开头都有连续的基本类型字段
+    base = JavaClassDesc('test.Base', 1, 2)
+    base.fields = [JavaFieldDesc('a', 'I'), JavaFieldDesc('b', 'D'), JavaFieldDesc('c', 'Z')]
+    base.classAnnotations = [JavaEndBlock()]
+    desc = JavaClassDesc('test.Child', 1, 2)
+    desc.fields = [JavaFieldDesc('d', 'J'), JavaFieldDesc('e', 'F'), JavaFieldDesc('f', 'S'), JavaFieldDesc('g', 'B')]
+    desc.classAnnotations = [JavaEndBlock()]
+    desc.superJavaClass = base
+    obj = JavaObject(desc)
+    obj.fields.append([JavaField('a', 'I', -3), JavaField('b', 'D', -0.5), JavaField('c', 'Z', True)])
+    obj.fields.append([JavaField('d', 'J', 1 << 40), JavaField('e', 'F', 2.5), JavaField('f', 'S', 2),
+                       JavaField('g', 'B', b'\x7f')])
+    data = write(obj, largeArray(50))
+    lazy = readAll(data, lazy=True)
+    assert type(lazy[0]) is LazyJavaObject and pendingObjects(lazy) > 0
+    eager = readAll(data)
+    assert graphEqual(lazy[0], eager[0]) and graphEqual(lazy[1], eager[1])
+    assert [[field.value for field in fields] for fields in lazy[0].fields] == \
+           [[field.value for field in fields] for fields in eager[0].fields]
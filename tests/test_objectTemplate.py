@@ -0,0 +1,42 @@
+# -*- coding: utf-8 -*-
+from conftest import readFile, write
+from javaSerializationTools import ObjectTemplate, JavaClassDesc, JavaFieldDesc, JavaObject, JavaField, JavaArray, \
+    JavaString, JavaEndBlock
+
+
+def urlFields(dnslog):
+    """
+    dnslog.ser中java.net.URL的字段，见tests/testDnslog
+    """
+    return {field.fieldName: field for field in dnslog.objectAnnotation[1].fields[0]}
+
+
+def testRenderEqualsRewrite():
+    dnslog = readFile('dnslog.ser')
+    fields = urlFields(dnslog)
+    template = ObjectTemplate(dnslog, {'host': fields['host'], 'port': fields['port']})
+    assert template.render() == write(dnslog)
+    data = template.render(host='xxx.dnslog.cn', port=8080)
+    fields['host'].value.string = 'xxx.dnslog.cn'
+    fields['port'].value = 8080
+    assert data == write(dnslog)
+
+
+def testRenderByteArray():
+    desc = JavaClassDesc('test.Payload', 1, 2)
+    desc.fields = [JavaFieldDesc('name', JavaString('Ljava/lang/String;')),
+                   JavaFieldDesc('data', JavaString('[B'))]
+    desc.classAnnotations = [JavaEndBlock()]
+    arrayDesc = JavaClassDesc('[B', 1, 2)
+    arrayDesc.classAnnotations = [JavaEndBlock()]
+    array = JavaArray(3, arrayDesc)
+    array.list = b'abc'
+    obj = JavaObject(desc)
+    obj.fields.append([JavaField('name', desc.fields[0].signature, JavaString('payload')),
+                       JavaField('data', desc.fields[1].signature, array)])
+    template = ObjectTemplate(obj, {'data': array, 'name': obj.fields[0][0]})
+    data = template.render(data=b'0123456789', name='长名字')
+    array.list = b'0123456789'
+    array.length = 10
+    obj.fields[0][0].value.string = '长名字'
+    assert data == write(obj)
@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+from conftest import write, deepChain
+from javaSerializationTools import ObjectRead, ObjectWrite, JavaClassDesc, JavaFieldDesc, JavaObject, JavaField, \
+    JavaEndBlock
+
+
+class FieldByFieldWrite(ObjectWrite):
+    # 基本类型字段都经过writeFieldValue，不使用PrimitiveRun
+    fieldWriters = {}
+
+
+def charObject(char):
+    desc = JavaClassDesc('test.Chars', 1, 2)
+    # 至少MIN_WRITE_RUN_LENGTH个基本类型字段，write(obj)使用PrimitiveRun
+    signatures = 'CIJSZD'
+    desc.fields = [JavaFieldDesc(f'f{i}', signature) for i, signature in enumerate(signatures)]
+    desc.classAnnotations = [JavaEndBlock()]
+    obj = JavaObject(desc)
+    values = {'C': char, 'I': 1, 'J': 2, 'S': 3, 'Z': True, 'D': 1.5}
+    obj.fields.append([JavaField(f'f{i}', signature, values[signature]) for i, signature in enumerate(signatures)])
+    return obj
+
+
+def testCharFieldPathsAgree():
+    for char in ('A', '中', '\x00A'):
+        obj = charObject(char)
+        assert write(obj) == write(obj, writerType=FieldByFieldWrite)
+    # 单个字符按Java的char写成两个字节，与readChar读出的'\x00A'相同
+    assert write(charObject('A')) == write(charObject('\x00A'))
+
+
+def testCharFieldRoundTrip():
+    data = write(charObject('A'))
+    obj = ObjectRead(data).readContent()
+    assert write(obj) == data
+    assert write(obj, writerType=FieldByFieldWrite) == data
+
+
+def testDeepChainWithoutRecursion():
+    # 远超默认递归深度的链表
+    length = 100000
+    data = write(deepChain(length))
+    result = ObjectRead(data).readContent()
+    assert write(result) == data
+    values = []
+    while result != 'null':
+        fields = result.fields[0]
+        values.append(fields[0].value)
+        result = fields[1].value
+    assert values == list(range(length - 1, -1, -1))
@@ -0,0 +1,36 @@
+# -*- coding: utf-8 -*-
+import os
+
+from conftest import readBytes, write, deepChain
+from javaSerializationTools import ParseCache, graphEqual
+
+
+def testDeepGraphIsNotPersisted(tmp_path):
+    data = write(deepChain(20000))
+    cache = ParseCache(directory=str(tmp_path))
+    contents = cache.contents(data)
+    assert contents[0].fields[0][0].value == 19999
+    # pickle超过递归深度，只缓存在内存中，不留下临时文件
+    assert os.listdir(tmp_path) == []
+    assert cache.contents(data) is contents
+    assert ParseCache(directory=str(tmp_path)).contents(data)[0].fields[0][0].value == 19999
+
+
+def testCorruptFileIsAMiss(tmp_path):
+    data = readBytes('dnslog.ser')
+    cache = ParseCache(directory=str(tmp_path))
+    contents = cache.contents(data)
+    summary = cache.summary(data)
+    for name in os.listdir(tmp_path):
+        path = os.path.join(tmp_path, name)
+        with open(path, 'r+b') as f:
+            f.truncate(os.path.getsize(path) // 2)
+    cache = ParseCache(directory=str(tmp_path))
+    assert graphEqual(cache.contents(data)[0], contents[0])
+    assert cache.summary(data) == summary
+    assert cache.stats()['misses'] == 2 and cache.stats()['diskHits'] == 0
+    # 损坏的文件被删除后重新写入
+    cache = ParseCache(directory=str(tmp_path))
+    assert cache.summary(data) == summary
+    assert graphEqual(cache.contents(data)[0], contents[0])
+    assert cache.stats()['diskHits'] == 2
@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+import os
+
+from conftest import FILES, readBytes, write, largeArray
+from javaSerializationTools import ObjectRead, StreamIndex, graphEqual
+from javaSerializationTools.Constants import Constants
+
+
+def fullParse(data):
+    """
+    :return: 从头解析整个流后的handle表
+    """
+    reader = ObjectRead(data)
+    while reader.bin.peekByte():
+        reader.readContent()
+    return reader.handles
+
+
+def testEntriesEqualFullParse():
+    for name in sorted(os.listdir(FILES)):
+        data = readBytes(name)
+        index = StreamIndex.build(data)
+        handles = fullParse(data)
+        assert len(index) == len(handles), name
+        reader = index.open(data)
+        for entry in index:
+            assert data[entry.offset:entry.offset + 1] == entry.tc, name
+            expected = handles[entry.handle - Constants.baseWireHandle]
+            assert graphEqual(reader.readEntry(entry), expected), (name, entry)
+            # 按handle读取时不重复读取
+            assert reader.get(entry.handle) is reader.get(entry.handle)
+
+
+def testEntriesAfterReset():
+    first = write(largeArray(3))
+    second = write(largeArray(5))
+    data = first + Constants.TC_RESET + second[4:]
+    index = StreamIndex.build(data)
+    assert {entry.epoch for entry in index} == {0, 1}
+    for epoch, handles in enumerate((fullParse(first), fullParse(data))):
+        reader = index.open(data, epoch)
+        entries = [entry for entry in index if entry.epoch == epoch]
+        assert len(entries) == len(handles)
+        for entry in entries:
+            assert graphEqual(reader.readEntry(entry), handles[entry.handle - Constants.baseWireHandle])
+
+
+def testSavedIndexMatches(tmp_path):
+    data = readBytes('CommonsCollections1.ser')
+    index = StreamIndex.build(data)
+    path = str(tmp_path / 'CommonsCollections1.ser.idx')
+    index.save(path)
+    assert list(StreamIndex.load(path)) == list(index)